@@ -0,0 +1,234 @@
+"""
+Fast JSON responses and compression for both FastAPI apps
+
+- `FastJSONResponse` renders with orjson instead of the standard json encoder.
+- `CompressionMiddleware` negotiates brotli or gzip for responses above a size
+  threshold, including streamed responses.
+- `PrecompressedJSON` renders a payload once and keeps its gzip/brotli variants,
+  so cached responses are served without re-serialising or re-compressing.
+"""
+import gzip
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from http_caching import ETAG_ENCODING_SUFFIXES
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the framing overhead isn't worth it
+MINIMUM_COMPRESSION_SIZE = 1024
+
+# Compression levels for responses compressed per request and for cached bodies
+# compressed once; cached bodies can afford a slower, denser setting
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 4
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/xml", "application/javascript")
+
+
+def _default(value: Any) -> Any:
+    # ObjectId, Decimal and other types orjson doesn't know natively
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered with orjson (datetime, UUID and dataclasses natively)
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick "br" or "gzip" from an Accept-Encoding header, preferring brotli
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def encode_etag(etag: Optional[str], encoding: Optional[str]) -> Optional[str]:
+    """
+    Give each content-coding of a representation its own strong ETag
+    """
+    if not etag or not encoding or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}{ETAG_ENCODING_SUFFIXES[encoding]}"'
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else DYNAMIC_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL if cached else DYNAMIC_GZIP_LEVEL, mtime=0)
+
+
+class PrecompressedJSON:
+    """
+    A JSON payload rendered once, with its compressed variants prepared up front.
+    Meant to be stored in the read cache: `cache_size` reports its footprint.
+    """
+    __slots__ = ("data", "body", "variants")
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.body = dumps(data)
+        self.variants: Dict[str, bytes] = {}
+        if len(self.body) >= MINIMUM_COMPRESSION_SIZE:
+            self.variants["gzip"] = compress(self.body, "gzip", cached=True)
+            if brotli is not None:
+                self.variants["br"] = compress(self.body, "br", cached=True)
+
+    @property
+    def cache_size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+    def response(self, request: Request, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Build the response for this request, using a precompressed variant when accepted
+        """
+        headers = dict(headers or {})
+        body, encoding = self.body, None
+
+        if self.variants:
+            headers["Vary"] = "Accept-Encoding"
+            encoding = choose_encoding(request.headers.get("accept-encoding"))
+            if encoding in self.variants:
+                body = self.variants[encoding]
+                headers["Content-Encoding"] = encoding
+                if "ETag" in headers:
+                    headers["ETag"] = encode_etag(headers["ETag"], encoding)
+
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip.
+    Responses that already carry a Content-Encoding (e.g. PrecompressedJSON)
+    and non-text content types are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_COMPRESSION_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk decides whether to compress
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                skip = (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                )
+                if skip:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    headers["ETag"] = encode_etag(headers["etag"], encoding)
+
+                if not more_body:
+                    # Whole body available: compress in one go
+                    body = compress(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    start_message = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                del headers["Content-Length"]
+                compressor = _StreamCompressor(encoding)
+                await send(start_message)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class _StreamCompressor:
+    """Incremental gzip/brotli compressor for streamed responses"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=DYNAMIC_BROTLI_QUALITY)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.finish
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(DYNAMIC_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._flush = self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data) if data else b""
+
+    def flush(self) -> bytes:
+        return self._flush()
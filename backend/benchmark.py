@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""
+Performance benchmarks for the KnockoffKitchen.com backend
+
+Benchmarks run against a separate database (BENCHMARK_DB_NAME) on the
+server configured by MONGODB_URI, seeded with synthetic recipes, so they
+never touch production data. With --memory they run offline against the
+in-memory engine instead (absolute timings then say nothing about MongoDB).
+
+Usage:
+    python benchmark.py search --recipes 100000
+    python benchmark.py --memory search --recipes 20000
+    python benchmark.py serialize --limit 100
+    python benchmark.py sitemap --urls 1000000
+    python benchmark.py startup --max-import-ms 1500 --max-startup-ms 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Callable
+
+from dotenv import load_dotenv
+
+# Load environment variables (MONGODB_URI) before the MongoDB modules read them
+load_dotenv()
+
+import mongodb_setup
+
+BENCHMARK_DB_NAME = "knockoffkitchen_benchmark"
+
+BRANDS = [
+    "Pringles", "Doritos", "Lay's", "Cheetos", "Oreo", "Ritz", "Cheez-It", "Goldfish",
+    "Kellogg's", "Nabisco", "Hershey's", "Reese's", "Heinz", "Kraft", "Taco Bell", "KFC",
+]
+CATEGORIES = [
+    "Chips & Crisps", "Cookies", "Crackers", "Candy", "Sauces & Condiments",
+    "Snack Cakes", "Cereal", "Frozen Foods", "Dips & Spreads", "Beverages",
+]
+FLAVORS = [
+    "Original", "Sour Cream & Onion", "Cheddar Cheese", "BBQ", "Chili", "Salt & Vinegar",
+    "Honey Mustard", "Jalapeno", "Ranch", "Chocolate", "Peanut Butter", "Cinnamon",
+]
+INGREDIENTS = [
+    "all-purpose flour", "salt", "baking powder", "vegetable oil", "water", "potato starch",
+    "onion powder", "garlic powder", "smoked paprika", "brown sugar", "cheddar cheese powder",
+    "cocoa powder", "butter", "vanilla extract", "cayenne pepper", "dried dill", "honey",
+]
+
+
+def make_synthetic_recipe(i: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    Build a realistic-looking recipe document
+    """
+    brand = rng.choice(BRANDS)
+    flavor = rng.choice(FLAVORS)
+    category = rng.choice(CATEGORIES)
+    title = f"Homemade {brand} {flavor} Copycat {i}"
+    ingredients = [f"{rng.randint(1, 4)} tbsp {item}" for item in rng.sample(INGREDIENTS, 8)]
+    return {
+        "_id": f"bench-{i:08d}",
+        "title": title,
+        "slug": f"homemade-{brand}-{flavor}-copycat-{i}".lower().replace(" ", "-").replace("&", "and").replace("'", ""),
+        "brand_name": brand,
+        "category": category,
+        "prep_time": rng.randint(5, 30),
+        "cook_time": rng.randint(5, 60),
+        "total_time": rng.randint(10, 90),
+        "yield": "4 servings",
+        "ingredients": {"items": ingredients},
+        "instructions": "\n".join(f"{n}. Mix and bake step {n}." for n in range(1, 9)),
+        "introduction": " ".join(rng.choice(INGREDIENTS + FLAVORS) for _ in range(550)),
+        "faq": [{"question": f"Question {n}?", "answer": "An answer. " * 20} for n in range(4)],
+        "nutritional_info": {"text": "Lower in sodium and sugar than the original. " * 5},
+        "cost_comparison": "Homemade costs about 60% less than store-bought. " * 4,
+    }
+
+
+def seed_recipes(count: int, batch_size: int = 5000):
+    """
+    Fill the benchmark database with `count` synthetic recipes (reused if already present)
+    """
+    from mongodb_search import build_search_tokens
+    from mongodb_indexes import ensure_indexes
+
+    recipes_collection = mongodb_setup.get_recipes_collection()
+    if recipes_collection.count_documents({}) == count:
+        print(f"Reusing {count} seeded recipes in '{BENCHMARK_DB_NAME}'")
+        return
+
+    print(f"Seeding {count} synthetic recipes into '{BENCHMARK_DB_NAME}'...")
+    recipes_collection.delete_many({})
+    rng = random.Random(42)
+    for start in range(0, count, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, count)):
+            recipe = make_synthetic_recipe(i, rng)
+            recipe["search_tokens"] = build_search_tokens(recipe)
+            batch.append(recipe)
+        recipes_collection.insert_many(batch, ordered=False)
+
+    ensure_indexes(recipes_collection)
+
+
+def time_call(func: Callable[[], Any], repeat: int) -> List[float]:
+    """
+    Run `func` `repeat` times and return the durations in milliseconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(label: str, durations: List[float]):
+    durations = sorted(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    print(f"  {label:<28} median {statistics.median(durations):9.2f} ms   p95 {p95:9.2f} ms")
+
+
+def benchmark_search(args):
+    """
+    Compare the legacy unanchored $regex search with the indexed search subsystem
+    """
+    from mongodb_search import search_recipes
+
+    seed_recipes(args.recipes)
+    recipes_collection = mongodb_setup.get_recipes_collection()
+
+    def legacy_regex(query: str):
+        query_filter = {"$or": [
+            {"title": {"$regex": query, "$options": "i"}},
+            {"brand_name": {"$regex": query, "$options": "i"}},
+            {"category": {"$regex": query, "$options": "i"}},
+        ]}
+        return list(recipes_collection.find(query_filter).limit(20))
+
+    queries = ["chocolate", "choc", "cheddar chee", "doritos ranch", "sour cream onion ", "peanut butter cook"]
+    for query in queries:
+        print(f"query '{query}'")
+        report("regex (legacy)", time_call(lambda: legacy_regex(query), args.repeat))
+        report("indexed search", time_call(lambda: asyncio.run(search_recipes(query, limit=20)), args.repeat))
+
+
+def benchmark_serialize(args):
+    """
+    Serialisation time and bytes on the wire for a /recipes/?limit=N response.
+    Needs no database: the payload is built from synthetic recipes.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from api_responses import dumps, compress, brotli
+
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    recipes = []
+    for i in range(args.limit):
+        recipe = make_synthetic_recipe(i, rng)
+        recipe["id"] = recipe.pop("_id")
+        recipe.update({"version": 1, "created_at": now, "updated_at": now})
+        recipes.append(recipe)
+
+    print(f"/recipes/?limit={args.limit}")
+    report("json + jsonable_encoder", time_call(lambda: json.dumps(jsonable_encoder(recipes)).encode("utf-8"), args.repeat))
+    report("orjson", time_call(lambda: dumps(recipes), args.repeat))
+
+    body = dumps(recipes)
+    report("gzip (dynamic)", time_call(lambda: compress(body, "gzip"), args.repeat))
+    if brotli is not None:
+        report("brotli (dynamic)", time_call(lambda: compress(body, "br"), args.repeat))
+
+    print("bytes on the wire")
+    print(f"  {'identity':<28} {len(body):>10,}")
+    print(f"  {'gzip (dynamic)':<28} {len(compress(body, 'gzip')):>10,}")
+    print(f"  {'gzip (cached)':<28} {len(compress(body, 'gzip', cached=True)):>10,}")
+    if brotli is not None:
+        print(f"  {'brotli (dynamic)':<28} {len(compress(body, 'br')):>10,}")
+        print(f"  {'brotli (cached)':<28} {len(compress(body, 'br', cached=True)):>10,}")
+
+
+def benchmark_sitemap(args):
+    """
+    Build time and peak memory of the sharded sitemap writer for N URLs, for a
+    full build and for a rebuild where nothing changed. Needs no database:
+    URLs are synthetic. With --legacy, also times the single-file
+    ElementTree + minidom build it replaced.
+    """
+    from sitemap_generator import BASE_URL, chunked, write_sitemap_index
+
+    lastmod = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def urls():
+        for i in range(args.urls):
+            yield f"{BASE_URL}/recipes/homemade-brand-flavor-copycat-{i}", lastmod, "monthly", "0.7"
+
+    def legacy(path: str):
+        from xml.dom import minidom
+        from xml.etree import ElementTree as ET
+
+        root = ET.Element("urlset")
+        root.set("xmlns", "http://www.sitemaps.org/schemas/sitemap/0.9")
+        for loc, _, changefreq, priority in urls():
+            url = ET.SubElement(root, "url")
+            ET.SubElement(url, "loc").text = loc
+            ET.SubElement(url, "lastmod").text = datetime.now().strftime("%Y-%m-%d")
+            ET.SubElement(url, "changefreq").text = changefreq
+            ET.SubElement(url, "priority").text = priority
+        pretty_xml = minidom.parseString(ET.tostring(root, encoding="utf-8")).toprettyxml(indent="  ")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(pretty_xml)
+
+    def sharded(path: str, fresh: bool = True):
+        shard_dir = os.path.join(os.path.dirname(path), "sitemaps")
+        if fresh:
+            # Drop the previous run's manifest so every shard is rewritten
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        write_sitemap_index(chunked("recipes", urls()), path, shard_dir)
+
+    def measure(label: str, build: Callable[[str], Any], warm_up: Callable[[str], Any] = None):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sitemap.xml")
+            if warm_up:
+                warm_up(path)
+            durations = time_call(lambda: build(path), args.repeat)
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+            tracemalloc.start()
+            build(path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        report(label, durations)
+        print(f"  {'':<28} peak memory {peak / 2**20:8.1f} MiB   files {size / 2**20:8.1f} MiB")
+
+    print(f"sitemap with {args.urls:,} URLs")
+    measure("sharded, full build", sharded)
+    measure("sharded, unchanged", lambda path: sharded(path, fresh=False), warm_up=sharded)
+    if args.legacy:
+        measure("ElementTree + minidom", legacy)
+
+
+# Modules the MongoDB app must not load at import or startup: they belong to
+# the SQL backend, to CSV recipe generation or export, or to the related
+# recipes computation, which are all imported on first use
+FORBIDDEN_STARTUP_MODULES = (
+    "pandas", "sqlalchemy", "database", "generate_recipes", "deepseek_api", "pyarrow", "numpy",
+)
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import mongodb_setup
+mongodb_setup.DB_NAME = sys.argv[1]
+import mongodb_main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(mongodb_main.app)
+ready = time.perf_counter()
+with client:
+    started = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - ready) * 1000,
+    "forbidden": [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+"""
+
+
+def benchmark_startup(args):
+    """
+    Cold import and startup time of mongodb_main, each run in a fresh interpreter.
+    Exits non-zero when a budget is exceeded or a forbidden module is loaded,
+    so it can guard against regressions in CI.
+    """
+    env = dict(os.environ)
+    if args.memory:
+        env["MONGODB_URI"] = mongodb_setup.MEMORY_URI_SCHEME
+
+    results = []
+    # Startup restores and rebuilds the sitemap: keep it away from the published files
+    with tempfile.TemporaryDirectory() as directory:
+        env["SITEMAP_PUBLIC_DIR"] = os.path.join(directory, "public")
+        env["SITEMAP_BACKEND_COPY"] = os.path.join(directory, "sitemap.xml")
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE, BENCHMARK_DB_NAME, json.dumps(FORBIDDEN_STARTUP_MODULES)],
+                capture_output=True, text=True, check=True, env=env
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print("mongodb_main cold start")
+    report("import", [r["import_ms"] for r in results])
+    report("startup", [r["startup_ms"] for r in results])
+
+    failures = []
+    forbidden = sorted({name for r in results for name in r["forbidden"]})
+    if forbidden:
+        failures.append(f"loaded at startup: {', '.join(forbidden)}")
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    if import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.0f} ms (budget {args.max_import_ms} ms)")
+    startup_ms = statistics.median(r["startup_ms"] for r in results)
+    if startup_ms > args.max_startup_ms:
+        failures.append(f"startup took {startup_ms:.0f} ms (budget {args.max_startup_ms} ms)")
+
+    for failure in failures:
+        print(f"  REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="KnockoffKitchen.com backend benchmarks")
+    parser.add_argument("--memory", action="store_true", help="Use the in-memory engine instead of MONGODB_URI")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    search_parser = subparsers.add_parser("search", help="Indexed search vs. legacy regex search")
+    search_parser.add_argument("--recipes", type=int, default=100000, help="Number of recipes to seed")
+    search_parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+    search_parser.set_defaults(func=benchmark_search)
+
+    serialize_parser = subparsers.add_parser("serialize", help="JSON rendering and compression of a listing response")
+    serialize_parser.add_argument("--limit", type=int, default=100, help="Recipes in the response")
+    serialize_parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement")
+    serialize_parser.set_defaults(func=benchmark_serialize)
+
+    sitemap_parser = subparsers.add_parser("sitemap", help="Streaming sitemap build time and memory")
+    sitemap_parser.add_argument("--urls", type=int, default=1000000, help="URLs in the sitemap")
+    sitemap_parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    sitemap_parser.add_argument("--legacy", action="store_true", help="Also measure the ElementTree + minidom build")
+    sitemap_parser.set_defaults(func=benchmark_sitemap)
+
+    startup_parser = subparsers.add_parser("startup", help="Cold import and startup time of the MongoDB app")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to start")
+    startup_parser.add_argument("--max-import-ms", type=float, default=1500, help="Import time budget (median)")
+    startup_parser.add_argument("--max-startup-ms", type=float, default=1000, help="Startup handler budget (median)")
+    startup_parser.set_defaults(func=benchmark_startup)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Never run benchmarks against the production database
+    mongodb_setup.DB_NAME = BENCHMARK_DB_NAME
+    if args.memory:
+        mongodb_setup.use_memory_database()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
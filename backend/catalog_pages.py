@@ -0,0 +1,17 @@
+"""
+Brand and category page helpers shared by the MongoDB and PostgreSQL backends
+"""
+
+
+def slugify(name: str) -> str:
+    """
+    Generate the URL slug used for brand and category pages
+    """
+    return name.lower().replace(" ", "-").replace("&", "and")
+
+
+def category_description(category_name: str) -> str:
+    """
+    Generate the description shown on category pages
+    """
+    return f"Delicious homemade {category_name.lower()} recipes that taste just like your favorite store-bought brands but healthier and more affordable."
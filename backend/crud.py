@@ -1,25 +1,98 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, tuple_, func, and_, or_, literal
+from sqlalchemy.orm import load_only, undefer_group
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from typing import List, Optional, Dict, Any
+import hashlib
 import uuid
 
-from models import Recipe
+from models import Recipe, CONTENT_GROUP, SEARCH_CONFIG
 from schemas import RecipeCreate, RecipeUpdate
+from pagination import parse_sort, encode_cursor, decode_cursor
+from catalog_pages import slugify, category_description
+
+# Columns needed by list and grid pages (recipe cards)
+CARD_COLUMNS = ("title", "brand_name", "category", "prep_time", "cook_time", "total_time")
+
+# Every column outside the deferred content group (see RecipeSummary)
+SUMMARY_COLUMNS = CARD_COLUMNS + ("yield_amount", "created_at", "updated_at")
+
+# Predefined projections selectable with `view=`
+VIEWS = {
+    "card": CARD_COLUMNS,
+    "summary": SUMMARY_COLUMNS,
+}
+
+# Columns that are never part of an API response
+INTERNAL_COLUMNS = {"search_vector"}
+
+# Loader option for full recipes: the heavy columns are deferred on the model
+FULL_RECIPE = undefer_group(CONTENT_GROUP)
+
+def projection(columns: List[str], *extra):
+    """
+    Load only the given columns. Touching any other column raises instead of
+    lazy-loading it with one query per row.
+    """
+    return load_only(*[getattr(Recipe, c) for c in columns], *extra, raiseload=True)
+
+def resolve_columns(fields: Optional[List[str]] = None, view: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Map API field names and/or a named view to Recipe column attributes.
+    Returns None (full rows) when neither is given.
+    """
+    if view and view not in VIEWS:
+        raise ValueError(f"Unknown view '{view}'. Use one of: {', '.join(VIEWS)}")
+    
+    columns = list(VIEWS[view]) if view else []
+    for field in fields or []:
+        # 'yield' is exposed under its alias but mapped as yield_amount
+        column = "yield_amount" if field == "yield" else field
+        if column not in Recipe.__mapper__.column_attrs or column in INTERNAL_COLUMNS:
+            raise ValueError(f"Unknown field '{field}'")
+        if column not in columns and column != "id":
+            columns.append(column)
+    
+    return columns or None
+
+def recipe_to_dict(recipe: Recipe, columns: List[str]) -> Dict[str, Any]:
+    """
+    Serialise only the loaded columns of a projected Recipe
+    """
+    data = {"id": recipe.id}
+    for column in columns:
+        data["yield" if column == "yield_amount" else column] = getattr(recipe, column)
+    return data
 
 async def get_recipe(db: AsyncSession, recipe_id: uuid.UUID):
-    result = await db.execute(select(Recipe).where(Recipe.id == recipe_id))
+    result = await db.execute(select(Recipe).options(FULL_RECIPE).where(Recipe.id == recipe_id))
     return result.scalars().first()
 
+async def get_recipe_validators(db: AsyncSession, recipe_id: uuid.UUID):
+    """
+    Get only the id and updated_at of a recipe (primary key lookup, no heavy columns)
+    """
+    result = await db.execute(select(Recipe.id, Recipe.updated_at).where(Recipe.id == recipe_id))
+    return result.first()
+
 async def get_recipes(
     db: AsyncSession, 
     skip: int = 0, 
     limit: int = 100,
     brand_name: Optional[str] = None,
-    category: Optional[str] = None
+    category: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    view: Optional[str] = None
 ):
+    columns = resolve_columns(fields, view)
     query = select(Recipe)
     
+    if columns:
+        # Only the projected columns are selected; the rest are never read from disk
+        query = query.options(projection(columns))
+    else:
+        query = query.options(FULL_RECIPE)
     if brand_name:
         query = query.where(Recipe.brand_name == brand_name)
     if category:
@@ -27,7 +100,157 @@ async def get_recipes(
     
     query = query.offset(skip).limit(limit)
     result = await db.execute(query)
-    return result.scalars().all()
+    recipes = result.scalars().all()
+    
+    if columns:
+        return [recipe_to_dict(recipe, columns) for recipe in recipes]
+    return recipes
+
+async def get_recipes_page(
+    db: AsyncSession,
+    limit: int = 100,
+    after: Optional[str] = None,
+    sort: Optional[str] = None,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    view: Optional[str] = None
+):
+    """
+    Get a page of recipes using keyset pagination on (sort column, id).
+    Returns a dict with the recipes and the `next_cursor` token.
+    """
+    field, direction = parse_sort(sort)
+    sort_key = sort or field
+    sort_column = getattr(Recipe, field)
+    columns = resolve_columns(fields, view)
+    
+    query = select(Recipe)
+    
+    if columns:
+        # The sort column is always loaded since the next cursor is built from it
+        query = query.options(projection(columns, sort_column))
+    else:
+        query = query.options(FULL_RECIPE)
+    if brand_name:
+        query = query.where(Recipe.brand_name == brand_name)
+    if category:
+        query = query.where(Recipe.category == category)
+    
+    if after:
+        value, last_id = decode_cursor(after, sort_key)
+        position = tuple_(sort_column, Recipe.id)
+        if direction == 1:
+            query = query.where(position > tuple_(value, last_id))
+        else:
+            query = query.where(position < tuple_(value, last_id))
+    
+    if direction == 1:
+        query = query.order_by(sort_column.asc(), Recipe.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), Recipe.id.desc())
+    
+    # Fetch one extra row to know whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
+    recipes = list(result.scalars().all())
+    
+    next_cursor = None
+    if len(recipes) > limit:
+        recipes = recipes[:limit]
+        last = recipes[-1]
+        next_cursor = encode_cursor(sort_key, getattr(last, field), last.id)
+    
+    if columns:
+        recipes = [recipe_to_dict(recipe, columns) for recipe in recipes]
+    return {"recipes": recipes, "next_cursor": next_cursor}
+
+async def search_recipes(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    after: Optional[str] = None,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """
+    Full-text search over title, brand, category and ingredients, best matches first.
+    
+    `query` uses web search syntax ("quoted phrases", -excluded, or). Matching
+    uses the GIN index on the generated search_vector column; results are
+    paginated with a keyset on (rank, id). Returns a dict with summary rows
+    (plus their `rank`) and the `next_cursor` token.
+    """
+    tsquery = func.websearch_to_tsquery(literal(SEARCH_CONFIG).cast(REGCONFIG), query)
+    rank = func.ts_rank(Recipe.search_vector, tsquery).label("rank")
+    # Cursors are only valid for the query that issued them
+    sort_key = "rank:" + hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()[:12]
+    
+    statement = (
+        select(Recipe, rank)
+        .options(projection(list(SUMMARY_COLUMNS)))
+        .where(Recipe.search_vector.op("@@")(tsquery))
+    )
+    if brand_name:
+        statement = statement.where(Recipe.brand_name == brand_name)
+    if category:
+        statement = statement.where(Recipe.category == category)
+    
+    if after:
+        last_rank, last_id = decode_cursor(after, sort_key)
+        statement = statement.where(or_(
+            rank.expression < last_rank,
+            and_(rank.expression == last_rank, Recipe.id > last_id)
+        ))
+    
+    # Fetch one extra row to know whether there is a next page
+    result = await db.execute(statement.order_by(rank.desc(), Recipe.id.asc()).limit(limit + 1))
+    rows = result.all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_rank = rows[-1]
+        next_cursor = encode_cursor(sort_key, last_rank, last.id)
+    
+    recipes = []
+    for recipe, recipe_rank in rows:
+        data = recipe_to_dict(recipe, list(SUMMARY_COLUMNS))
+        data["rank"] = recipe_rank
+        recipes.append(data)
+    return {"recipes": recipes, "next_cursor": next_cursor}
+
+async def count_recipes_by(db: AsyncSession, column) -> List[Any]:
+    """
+    (value, recipe count) for each distinct value of an indexed column, in order.
+    A single GROUP BY that Postgres can answer from the column's index alone.
+    """
+    result = await db.execute(
+        select(column, func.count()).group_by(column).order_by(column)
+    )
+    return result.all()
+
+async def get_brands(db: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Get all brands with their recipe counts
+    """
+    return [
+        {"name": name, "slug": slugify(name), "count": count}
+        for name, count in await count_recipes_by(db, Recipe.brand_name)
+    ]
+
+async def get_categories(db: AsyncSession) -> List[Dict[str, Any]]:
+    """
+    Get all categories with their recipe counts
+    """
+    return [
+        {
+            "name": name,
+            "slug": slugify(name),
+            "count": count,
+            "description": category_description(name)
+        }
+        for name, count in await count_recipes_by(db, Recipe.category)
+    ]
 
 async def create_recipe(db: AsyncSession, recipe: RecipeCreate):
     # Convert Pydantic model to dict, handling the 'yield' field
@@ -41,7 +264,9 @@ async def create_recipe(db: AsyncSession, recipe: RecipeCreate):
     db_recipe = Recipe(**recipe_data)
     db.add(db_recipe)
     await db.commit()
-    await db.refresh(db_recipe)
+    # Only the server-generated columns need reading back; a full refresh
+    # would leave the deferred content columns unloaded
+    await db.refresh(db_recipe, ["created_at", "updated_at"])
     return db_recipe
 
 async def update_recipe(db: AsyncSession, recipe_id: uuid.UUID, recipe: RecipeUpdate):
@@ -1,12 +1,66 @@
 import pandas as pd
 import json
+import time
 import uuid
-from typing import List, Dict, Any, Optional
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
 
 from models import Recipe
 from schemas import RecipeCreate
 
+# Columns loaded by the bulk import, in COPY order ("yield" is the database name of yield_amount)
+IMPORT_COLUMNS = (
+    "id", "title", "brand_name", "category", "prep_time", "cook_time", "total_time", "yield",
+    "ingredients", "instructions", "storage_instructions", "recipe_variations", "special_equipment",
+    "pro_tips", "nutritional_info", "faq", "serving_suggestions", "cost_comparison", "seo_meta_description",
+)
+JSON_COLUMNS = ("ingredients", "nutritional_info", "faq")
+
+STAGING_TABLE = "recipes_import"
+
+
+def csv_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Rows of a CSV DataFrame as dicts, with empty cells (NaN) as None
+    """
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def prepare_recipe_row(recipe_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert the CSV representation of a recipe (a row from csv_records) into RecipeCreate input
+    """
+    recipe_data = dict(recipe_data)
+    
+    # Ingredients exported by export_recipes_to_csv are JSON
+    if isinstance(recipe_data.get('ingredients'), str) and recipe_data['ingredients'].lstrip().startswith('{'):
+        try:
+            recipe_data['ingredients'] = json.loads(recipe_data['ingredients'])
+        except json.JSONDecodeError:
+            pass
+    
+    # Process ingredients (assuming they're in a comma-separated string)
+    if 'ingredients' in recipe_data and isinstance(recipe_data['ingredients'], str):
+        ingredients_list = [item.strip() for item in recipe_data['ingredients'].split(',')]
+        recipe_data['ingredients'] = {'items': ingredients_list}
+        
+    # Process nutritional info (assuming it's in a JSON string)
+    if 'nutritional_info' in recipe_data and isinstance(recipe_data['nutritional_info'], str):
+        try:
+            recipe_data['nutritional_info'] = json.loads(recipe_data['nutritional_info'])
+        except json.JSONDecodeError:
+            recipe_data['nutritional_info'] = None
+            
+    # Process FAQ (assuming it's in a JSON string)
+    if 'faq' in recipe_data and isinstance(recipe_data['faq'], str):
+        try:
+            recipe_data['faq'] = json.loads(recipe_data['faq'])
+        except json.JSONDecodeError:
+            recipe_data['faq'] = None
+    
+    return recipe_data
+
 
 async def import_recipes_from_csv(
     file_path: str, 
@@ -28,29 +82,12 @@ async def import_recipes_from_csv(
     df = pd.read_csv(file_path)
     
     # Convert DataFrame to list of dictionaries
-    recipes_data = df.to_dict(orient='records')
+    recipes_data = csv_records(df)
     created_recipes = []
     
     # Process each recipe
     for recipe_data in recipes_data:
-        # Process ingredients (assuming they're in a comma-separated string)
-        if 'ingredients' in recipe_data and isinstance(recipe_data['ingredients'], str):
-            ingredients_list = [item.strip() for item in recipe_data['ingredients'].split(',')]
-            recipe_data['ingredients'] = {'items': ingredients_list}
-            
-        # Process nutritional info (assuming it's in a JSON string)
-        if 'nutritional_info' in recipe_data and isinstance(recipe_data['nutritional_info'], str):
-            try:
-                recipe_data['nutritional_info'] = json.loads(recipe_data['nutritional_info'])
-            except json.JSONDecodeError:
-                recipe_data['nutritional_info'] = None
-                
-        # Process FAQ (assuming it's in a JSON string)
-        if 'faq' in recipe_data and isinstance(recipe_data['faq'], str):
-            try:
-                recipe_data['faq'] = json.loads(recipe_data['faq'])
-            except json.JSONDecodeError:
-                recipe_data['faq'] = None
+        recipe_data = prepare_recipe_row(recipe_data)
                 
         # Create recipe
         recipe = RecipeCreate(**recipe_data)
@@ -60,6 +97,144 @@ async def import_recipes_from_csv(
     return created_recipes
 
 
+def validate_chunk(rows: List[Dict[str, Any]], first_line: int) -> Tuple[List[tuple], List[Dict[str, Any]]]:
+    """
+    Validate CSV rows (from csv_records) against RecipeCreate and convert them
+    to COPY records. Returns (records, error rows); each error row carries its
+    CSV line number, the validation errors and the original values.
+    """
+    records, errors = [], []
+    for offset, row in enumerate(rows):
+        try:
+            data = prepare_recipe_row(row)
+            recipe = RecipeCreate(**data).model_dump(by_alias=True)
+            recipe_id = uuid.UUID(str(data["id"])) if data.get("id") else uuid.uuid4()
+        except (ValidationError, ValueError) as e:
+            message = "; ".join(
+                f"{'.'.join(str(p) for p in error['loc'])}: {error['msg']}" for error in e.errors()
+            ) if isinstance(e, ValidationError) else str(e)
+            errors.append({"line": first_line + offset, "error": message, "row": row})
+            continue
+        
+        recipe["id"] = recipe_id
+        for column in JSON_COLUMNS:
+            if recipe[column] is not None:
+                # asyncpg sends jsonb as text
+                recipe[column] = json.dumps(recipe[column])
+        records.append(tuple(recipe[column] for column in IMPORT_COLUMNS))
+    return records, errors
+
+
+def print_progress(progress: Dict[str, Any]):
+    print(
+        f"Imported {progress['imported']} of {progress['rows']} rows "
+        f"({progress['inserted']} new, {progress['updated']} updated, "
+        f"{progress['errors']} invalid, {progress['skipped']} skipped) "
+        f"at {progress['rows_per_second']:.0f} rows/s"
+    )
+
+
+async def bulk_import_recipes_from_csv(
+    file_path: str,
+    engine: Optional[AsyncEngine] = None,
+    chunk_size: int = 5000,
+    update_existing: bool = False,
+    errors_path: Optional[str] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = print_progress
+) -> Dict[str, Any]:
+    """
+    Import recipes from a CSV file in bulk.
+    
+    The file is read and validated in chunks; each valid chunk is loaded with
+    COPY into a temporary staging table and merged into `recipes` with one
+    INSERT ... ON CONFLICT (id), so a chunk costs a handful of round trips
+    instead of three per row. Each chunk is committed separately.
+    
+    Args:
+        file_path: Path to the CSV file (same columns as import_recipes_from_csv,
+            plus an optional `id`; rows without one get a new id)
+        engine: Async engine to use (default: a dedicated engine with the "bulk" profile)
+        chunk_size: Rows validated and loaded per chunk
+        update_existing: Overwrite recipes whose id already exists instead of skipping them
+        errors_path: Optional CSV file receiving the invalid rows and their errors
+        progress: Called with the running totals after every chunk
+        
+    Returns:
+        Totals: rows read; imported, split into inserted (new ids) and updated
+        (existing ids, only with update_existing); skipped (existing ids
+        without update_existing, and ids repeated within a chunk); invalid
+        rows and the invalid rows themselves (line numbers refer to the CSV file)
+    """
+    from database import create_engine
+    
+    own_engine = engine is None
+    if own_engine:
+        engine = create_engine("bulk", name="import")
+    
+    columns = ", ".join(f'"{column}"' for column in IMPORT_COLUMNS)
+    updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in IMPORT_COLUMNS if column != "id")
+    conflict = f"DO UPDATE SET {updates}, updated_at = now()" if update_existing else "DO NOTHING"
+    merge = (
+        f"INSERT INTO recipes ({columns}) "
+        # A chunk may repeat an id; ON CONFLICT can only touch each row once
+        f"SELECT DISTINCT ON (id) {columns} FROM {STAGING_TABLE} ORDER BY id "
+        f"ON CONFLICT (id) {conflict} "
+        # xmax is 0 for a freshly inserted row and set for one updated on conflict
+        f"RETURNING (xmax = 0) AS inserted"
+    )
+    
+    totals = {
+        "rows": 0, "imported": 0, "inserted": 0, "updated": 0, "skipped": 0, "errors": 0,
+        "seconds": 0.0, "rows_per_second": 0.0
+    }
+    error_rows = []
+    start = time.perf_counter()
+    
+    try:
+        async with engine.connect() as connection:
+            raw = await connection.get_raw_connection()
+            conn = raw.driver_connection
+            await conn.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DELETE ROWS AS "
+                f"SELECT {columns} FROM recipes WITH NO DATA"
+            )
+            
+            # Line 1 is the header
+            line = 2
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size, dtype=object):
+                rows = csv_records(chunk)
+                records, errors = validate_chunk(rows, line)
+                line += len(rows)
+                
+                if records:
+                    async with conn.transaction():
+                        await conn.copy_records_to_table(STAGING_TABLE, records=records, columns=IMPORT_COLUMNS)
+                        merged = await conn.fetch(merge)
+                    inserted = sum(1 for row in merged if row["inserted"])
+                    totals["inserted"] += inserted
+                    totals["updated"] += len(merged) - inserted
+                    totals["imported"] += len(merged)
+                    totals["skipped"] += len(records) - len(merged)
+                
+                totals["rows"] += len(rows)
+                totals["errors"] += len(errors)
+                error_rows.extend(errors)
+                totals["seconds"] = time.perf_counter() - start
+                totals["rows_per_second"] = totals["rows"] / totals["seconds"] if totals["seconds"] else 0.0
+                if progress:
+                    progress(dict(totals))
+    finally:
+        if own_engine:
+            await engine.dispose()
+    
+    if errors_path and error_rows:
+        pd.DataFrame(
+            [{"line": e["line"], "error": e["error"], **e["row"]} for e in error_rows]
+        ).to_csv(errors_path, index=False)
+    
+    return {**totals, "error_rows": error_rows}
+
+
 def analyze_recipes(recipes: List[Recipe]) -> Dict[str, Any]:
     """
     Perform analysis on a list of recipes.
@@ -139,3 +314,25 @@ def export_recipes_to_csv(recipes: List[Recipe], file_path: str) -> None:
         
     df = pd.DataFrame(recipes_data)
     df.to_csv(file_path, index=False)
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    
+    parser = argparse.ArgumentParser(description="Bulk import recipes from a CSV file into Postgres")
+    parser.add_argument("file", help="CSV file to import")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows validated and loaded per chunk")
+    parser.add_argument("--update", action="store_true", help="Overwrite recipes whose id already exists")
+    parser.add_argument("--errors", type=str, help="Write invalid rows and their errors to this CSV file")
+    args = parser.parse_args()
+    
+    report = asyncio.run(bulk_import_recipes_from_csv(
+        args.file, chunk_size=args.chunk_size, update_existing=args.update, errors_path=args.errors
+    ))
+    print(
+        f"Done: {report['imported']} imported, {report['skipped']} skipped, {report['errors']} invalid "
+        f"of {report['rows']} rows in {report['seconds']:.1f}s"
+    )
+    for error in report["error_rows"][:20]:
+        print(f"  line {error['line']}: {error['error']}")
@@ -0,0 +1,147 @@
+"""
+Debounced rebuilds of data derived from the recipes
+
+Write endpoints mark the derived data (the sitemap, the catalog stats) dirty
+instead of rebuilding it. A single worker task waits until writes have been
+quiet for the debounce window (or until the oldest pending change reaches the
+maximum staleness) and then runs one rebuild for the whole burst. Builds never
+overlap: changes that arrive during a build are picked up by the next one.
+"""
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class DebouncedTask:
+    """
+    Coalesces rebuild requests into debounced, non-overlapping builds
+    """
+
+    def __init__(
+        self,
+        build: Callable[[], Awaitable[Any]],
+        debounce: float = 5,
+        max_delay: float = 60,
+        name: str = "task"
+    ):
+        self.build = build
+        self.name = name
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self.pending_changes = 0
+        self._first_dirty: Optional[float] = None
+        self._last_dirty: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.building = False
+        self.builds = 0
+        self.failures = 0
+        self.last_build_at: Optional[datetime] = None
+        self.last_build_ms: Optional[float] = None
+        self.last_build_changes = 0
+        self.last_error: Optional[str] = None
+
+    def mark_dirty(self, changes: int = 1):
+        """
+        Record `changes` writes affecting the built data and make sure a rebuild is scheduled.
+        Must be called from the event loop (i.e. from an async endpoint).
+        """
+        if changes <= 0:
+            return
+        now = time.monotonic()
+        if self._first_dirty is None:
+            self._first_dirty = now
+        self._last_dirty = now
+        self.pending_changes += changes
+
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def build_now(self):
+        """
+        Rebuild immediately (waiting for a build in progress to finish first),
+        clearing any pending changes
+        """
+        async with self._build_lock():
+            await self._build()
+
+    async def flush(self):
+        """
+        Rebuild now if there are pending changes, e.g. before shutting down
+        """
+        if self.pending_changes:
+            await self.build_now()
+
+    def state(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "dirty": self.pending_changes > 0,
+            "pending_changes": self.pending_changes,
+            "oldest_pending_seconds": round(now - self._first_dirty, 3) if self._first_dirty is not None else None,
+            "next_build_in_seconds": round(max(0.0, self._due_at() - now), 3) if self._first_dirty is not None else None,
+            "building": self.building,
+            "builds": self.builds,
+            "failures": self.failures,
+            "last_build_at": self.last_build_at.isoformat() if self.last_build_at else None,
+            "last_build_ms": round(self.last_build_ms, 1) if self.last_build_ms is not None else None,
+            "last_build_changes": self.last_build_changes,
+            "last_error": self.last_error,
+            "debounce_seconds": self.debounce,
+            "max_delay_seconds": self.max_delay,
+        }
+
+    def _due_at(self) -> float:
+        # Quiet for the debounce window, but never later than max_delay after the first change
+        return min(self._last_dirty + self.debounce, self._first_dirty + self.max_delay)
+
+    def _build_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _run(self):
+        while self.pending_changes:
+            delay = self._due_at() - time.monotonic()
+            if delay > 0:
+                # Sleep until due, waking early when a new write moves the deadline
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            async with self._build_lock():
+                # A manual build may have cleared the changes while we waited for the lock
+                if self.pending_changes:
+                    await self._build()
+
+    async def _build(self):
+        # Caller must hold the build lock. Writes landing during the build stay
+        # pending and schedule the next one.
+        changes = self.pending_changes
+        self.pending_changes = 0
+        self._first_dirty = self._last_dirty = None
+
+        self.building = True
+        start = time.perf_counter()
+        try:
+            await self.build()
+            self.builds += 1
+            self.last_error = None
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            print(f"Error building {self.name}: {e}")
+        finally:
+            self.building = False
+            self.last_build_ms = (time.perf_counter() - start) * 1000
+            self.last_build_at = datetime.now(timezone.utc)
+            self.last_build_changes = changes
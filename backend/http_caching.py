@@ -0,0 +1,110 @@
+"""
+HTTP caching helpers: validators (ETag / Last-Modified), conditional requests
+and per-endpoint Cache-Control policies shared by both FastAPI apps
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Response
+
+# Cache-Control policy per endpoint family. Recipes change rarely and are
+# revalidated cheaply with a 304, so shared caches may serve them stale
+# while revalidating in the background.
+CACHE_POLICIES = {
+    "recipe": "public, max-age=300, stale-while-revalidate=86400",
+    "listing": "public, max-age=60, stale-while-revalidate=600",
+    "navigation": "public, max-age=600, stale-while-revalidate=3600",
+    "count": "public, max-age=60",
+    "search": "public, max-age=30",
+    "sitemap": "public, max-age=600, stale-while-revalidate=3600",
+    "admin": "no-store",
+}
+
+# Suffixes that distinguish the ETag of each content-coding of a representation
+ETAG_ENCODING_SUFFIXES = {
+    "gzip": "-gzip",
+    "br": "-br",
+}
+
+
+def make_etag(recipe_id: Any, version: Any) -> str:
+    """
+    Build a strong ETag from a document id and its write version
+    """
+    digest = hashlib.sha1(f"{recipe_id}:{version}".encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB returns naive datetimes in UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def format_http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
+
+
+def is_not_modified(
+    request_headers: Mapping[str, str],
+    etag: Optional[str],
+    last_modified: Optional[datetime]
+) -> bool:
+    """
+    Evaluate If-None-Match / If-Modified-Since (RFC 9110). If-None-Match
+    takes precedence; If-Modified-Since is only used when it is absent.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison: a W/ prefix or a content-coding suffix does not prevent a match
+        candidates = set()
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/")
+            for suffix in ETAG_ENCODING_SUFFIXES.values():
+                if tag.endswith(f'{suffix}"'):
+                    tag = tag[:-len(suffix) - 1] + '"'
+            candidates.add(tag)
+        return etag in candidates
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since is None:
+            return False
+        # HTTP dates have one-second resolution
+        return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since)
+
+    return False
+
+
+def cache_headers(
+    policy: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None
+) -> Dict[str, str]:
+    """
+    Build the Cache-Control and validator headers for a response
+    """
+    headers = {"Cache-Control": CACHE_POLICIES[policy]}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = format_http_date(last_modified)
+    return headers
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    """
+    Headers-only 304 response carrying the current validators
+    """
+    return Response(status_code=304, headers=headers)
@@ -1,15 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Optional, Union
 import uuid
 
-from database import get_db
-from schemas import RecipeCreate, RecipeUpdate, RecipeResponse
+from database import get_db, pool_metrics
+from schemas import (
+    RecipeCreate, RecipeUpdate, RecipeResponse, RecipePage, RecipeCard, RecipeCardPage, RecipeSummary,
+    RecipeSummaryPage, RecipeSearchPage, BrandSummary, CategorySummary
+)
 import crud
-from sitemap_generator import generate_sitemap
+from sitemap_scheduler import sitemap_scheduler
+from startup_tasks import StartupTasks
+from read_cache import read_cache
+from http_caching import make_etag, is_not_modified, cache_headers, not_modified_response
+from api_responses import FastJSONResponse, CompressionMiddleware
+from recipe_stats import sql_recipe_stats
+
+app = FastAPI(title="Copycat Recipes API", default_response_class=FastJSONResponse)
 
-app = FastAPI(title="Copycat Recipes API")
+# Materialised catalog analytics, refreshed after bursts of writes
+recipe_stats = sql_recipe_stats()
 
 # Add CORS middleware to allow cross-origin requests from the frontend
 app.add_middleware(
@@ -20,78 +31,212 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiate brotli/gzip for larger responses
+app.add_middleware(CompressionMiddleware)
+
+def invalidate_navigation(brands: bool = True, categories: bool = True):
+    """
+    Drop the cached brand and/or category listings after a write
+    """
+    tags = []
+    if brands:
+        tags.append("brands")
+    if categories:
+        tags.append("categories")
+    read_cache.invalidate(*tags)
+
+# Response schema of each named `view=`; arbitrary `fields=` projections have none
+VIEW_SCHEMAS = {
+    "card": RecipeCard,
+    "summary": RecipeSummary,
+}
+
+def serialize_view(recipes, schema):
+    """
+    Validate projected rows (a list, or a cursor page) through a view's schema
+    """
+    if isinstance(recipes, dict):
+        return {**recipes, "recipes": serialize_view(recipes["recipes"], schema)}
+    return [schema.model_validate(recipe).model_dump(mode="json", by_alias=True) for recipe in recipes]
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Copycat Recipes API"}
 
 @app.post("/recipes/", response_model=RecipeResponse)
-async def create_recipe(recipe: RecipeCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+async def create_recipe(recipe: RecipeCreate, db: AsyncSession = Depends(get_db)):
     new_recipe = await crud.create_recipe(db=db, recipe=recipe)
+    invalidate_navigation()
     
     # Update sitemap after creating a new recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return new_recipe
 
-@app.get("/recipes/", response_model=List[RecipeResponse])
+@app.get(
+    "/recipes/",
+    response_model=Union[
+        List[RecipeResponse], RecipePage, List[RecipeSummary], RecipeSummaryPage, List[RecipeCard], RecipeCardPage
+    ]
+)
 async def read_recipes(
     skip: int = 0, 
     limit: int = 100,
     brand_name: Optional[str] = None,
     category: Optional[str] = None,
+    cursor: bool = False,
+    after: Optional[str] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    recipes = await crud.get_recipes(
-        db, skip=skip, limit=limit, brand_name=brand_name, category=category
-    )
+    # `view=summary`, `view=card` or `fields=a,b,c` select only the listed columns;
+    # the large content columns are read only for full recipes
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    
+    try:
+        # Keyset pagination is opt-in: `cursor=true` for the first page, then `after=<next_cursor>`
+        if cursor or after:
+            recipes = await crud.get_recipes_page(
+                db, limit=limit, after=after, sort=sort, brand_name=brand_name, category=category,
+                fields=field_list, view=view
+            )
+        else:
+            recipes = await crud.get_recipes(
+                db, skip=skip, limit=limit, brand_name=brand_name, category=category,
+                fields=field_list, view=view
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if field_list:
+        # Arbitrary projections match no schema, so they bypass validation
+        return FastJSONResponse(recipes)
+    if view:
+        return FastJSONResponse(serialize_view(recipes, VIEW_SCHEMAS[view]))
     return recipes
 
+# Declared before /recipes/{recipe_id} so "search" isn't parsed as an id
+@app.get("/recipes/search", response_model=RecipeSearchPage)
+async def search_recipes(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Full-text search, best matches first. Pass `next_cursor` as `after` for the next page.
+    """
+    try:
+        results = await crud.search_recipes(
+            db, q, limit=limit, after=after, brand_name=brand_name, category=category
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response.headers.update(cache_headers("search"))
+    return results
+
 @app.get("/recipes/{recipe_id}", response_model=RecipeResponse)
-async def read_recipe(recipe_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+async def read_recipe(recipe_id: uuid.UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    # updated_at is bumped on every write, so (id, updated_at) versions the row
+    if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+        validators = await crud.get_recipe_validators(db, recipe_id=recipe_id)
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        etag = make_etag(validators.id, validators.updated_at.isoformat())
+        if is_not_modified(request.headers, etag, validators.updated_at):
+            return not_modified_response(cache_headers("recipe", etag=etag, last_modified=validators.updated_at))
+    
     db_recipe = await crud.get_recipe(db, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    
+    etag = make_etag(db_recipe.id, db_recipe.updated_at.isoformat())
+    response.headers.update(cache_headers("recipe", etag=etag, last_modified=db_recipe.updated_at))
     return db_recipe
 
 @app.put("/recipes/{recipe_id}", response_model=RecipeResponse)
 async def update_recipe(
-    recipe_id: uuid.UUID, recipe: RecipeUpdate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)
+    recipe_id: uuid.UUID, recipe: RecipeUpdate, db: AsyncSession = Depends(get_db)
 ):
     db_recipe = await crud.get_recipe(db, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
     
     updated_recipe = await crud.update_recipe(db=db, recipe_id=recipe_id, recipe=recipe)
+    invalidate_navigation(brands=recipe.brand_name is not None, categories=recipe.category is not None)
     
     # Update sitemap after updating a recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return updated_recipe
 
 @app.delete("/recipes/{recipe_id}", response_model=RecipeResponse)
-async def delete_recipe(recipe_id: uuid.UUID, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+async def delete_recipe(recipe_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     db_recipe = await crud.delete_recipe(db, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    invalidate_navigation()
     
     # Update sitemap after deleting a recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return db_recipe
 
-@app.get("/brands/", response_model=List[str])
-async def get_brands(db: AsyncSession = Depends(get_db)):
-    # This is a simplified implementation - in a real app, you might want to use a distinct query
-    recipes = await crud.get_recipes(db, limit=1000)
-    brands = sorted(list(set(recipe.brand_name for recipe in recipes)))
-    return brands
+@app.get("/brands/", response_model=List[BrandSummary])
+async def get_brands(response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Get all brands with their recipe counts
+    """
+    response.headers.update(cache_headers("navigation"))
+    return await read_cache.get_or_load("brands", None, lambda: crud.get_brands(db), tags=["brands"])
+
+@app.get("/categories/", response_model=List[CategorySummary])
+async def get_categories(response: Response, db: AsyncSession = Depends(get_db)):
+    """
+    Get all categories with their recipe counts
+    """
+    response.headers.update(cache_headers("navigation"))
+    return await read_cache.get_or_load("categories", None, lambda: crud.get_categories(db), tags=["categories"])
+
+@app.get("/admin/db/pool")
+async def db_pool_endpoint(response: Response):
+    """
+    Connection pool usage and checkout wait times of each database engine
+    """
+    response.headers.update(cache_headers("admin"))
+    return pool_metrics()
+
+@app.get("/admin/stats")
+async def stats_endpoint(response: Response):
+    """
+    Recipe counts by brand and category, time averages and percentiles, and
+    recipes added per day, from the latest materialised snapshot (see
+    recipe_stats.RecipeStats.get for `as_of` and `stale`)
+    """
+    response.headers.update(cache_headers("admin"))
+    try:
+        return await recipe_stats.get()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-@app.get("/categories/", response_model=List[str])
-async def get_categories(db: AsyncSession = Depends(get_db)):
-    # This is a simplified implementation - in a real app, you might want to use a distinct query
-    recipes = await crud.get_recipes(db, limit=1000)
-    categories = sorted(list(set(recipe.category for recipe in recipes)))
-    return categories
+@app.get("/admin/export")
+async def export_endpoint(format: str = Query("csv", pattern="^(csv|parquet)$")):
+    """
+    Download every recipe as CSV or Parquet, streamed from a server-side cursor
+    """
+    # Imported on first use: the Parquet encoder is heavy and exports are rare
+    from recipe_export import SQL_COLUMNS, export_response, sql_batches
+    
+    return await export_response(sql_batches(), SQL_COLUMNS, format)
 
 @app.post("/sitemap/generate/", status_code=202)
 async def generate_sitemap_endpoint(background_tasks: BackgroundTasks):
@@ -99,10 +244,35 @@ async def generate_sitemap_endpoint(background_tasks: BackgroundTasks):
     Endpoint to manually trigger sitemap generation.
     This will run in the background to avoid blocking the request.
     """
-    background_tasks.add_task(generate_sitemap)
+    background_tasks.add_task(sitemap_scheduler.build_now)
     return {"message": "Sitemap generation started in the background"}
 
-# Generate sitemap on startup
+@app.get("/admin/sitemap/status")
+async def sitemap_status_endpoint(response: Response):
+    """
+    Pending changes, last build and build duration of the sitemap scheduler
+    """
+    response.headers.update(cache_headers("admin"))
+    return sitemap_scheduler.state()
+
+# Startup work that must not delay serving the first request
+startup_tasks = StartupTasks()
+
+@app.get("/health/ready")
+async def readiness_endpoint():
+    """
+    Readiness probe: 503 while startup work (the initial sitemap and stats) is still running
+    """
+    return startup_tasks.readiness_response()
+
+# Generate sitemap on startup, in the background: the previous sitemap files
+# stay in place until the new ones are written
 @app.on_event("startup")
 async def startup_event():
-    await generate_sitemap()
+    startup_tasks.start("sitemap", sitemap_scheduler.build_now())
+    startup_tasks.start("stats", recipe_stats.scheduler.build_now())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Don't lose writes still waiting out the debounce window
+    await sitemap_scheduler.flush()
@@ -0,0 +1,35 @@
+"""Add full-text search vector
+
+Revision ID: 3
+Revises: 2
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3'
+down_revision = '2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Weighted like the MongoDB text index: title > brand > category > ingredients.
+    # A stored generated column is kept up to date by Postgres on every write,
+    # and the GIN index makes matching independent of the table size.
+    op.execute("""
+        ALTER TABLE recipes ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english'::regconfig, coalesce(brand_name, '')), 'B') ||
+            setweight(to_tsvector('english'::regconfig, coalesce(category, '')), 'C') ||
+            setweight(jsonb_to_tsvector('english'::regconfig, coalesce(ingredients -> 'items', '[]'::jsonb), '["string"]'), 'D')
+        ) STORED
+    """)
+    op.create_index('ix_recipes_search_vector', 'recipes', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipes_search_vector', table_name='recipes')
+    op.drop_column('recipes', 'search_vector')
@@ -0,0 +1,31 @@
+"""Add keyset pagination indexes
+
+Revision ID: 2
+Revises: 1
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2'
+down_revision = '1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Composite indexes on (sort column, id) so that cursor pages on
+    # /recipes/ are a single index range scan regardless of depth.
+    op.create_index('ix_recipes_title_id', 'recipes', ['title', 'id'])
+    op.create_index('ix_recipes_created_at_id', 'recipes', ['created_at', 'id'])
+    op.create_index('ix_recipes_brand_name_title_id', 'recipes', ['brand_name', 'title', 'id'])
+    op.create_index('ix_recipes_category_title_id', 'recipes', ['category', 'title', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipes_category_title_id', table_name='recipes')
+    op.drop_index('ix_recipes_brand_name_title_id', table_name='recipes')
+    op.drop_index('ix_recipes_created_at_id', table_name='recipes')
+    op.drop_index('ix_recipes_title_id', table_name='recipes')
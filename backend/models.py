@@ -1,10 +1,27 @@
-from sqlalchemy import Column, String, Integer, Text, DateTime, func
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, Integer, Text, DateTime, Index, Computed, func
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 import uuid
 
 Base = declarative_base()
 
+# Deferred group of the large Text/JSONB columns. They are only read when a
+# query asks for them with undefer_group(CONTENT_GROUP), i.e. for full recipes.
+CONTENT_GROUP = "content"
+
+def content_column(*args, **kwargs):
+    return deferred(Column(*args, **kwargs), group=CONTENT_GROUP)
+
+# Weighted full-text document, maintained by Postgres (migration 3)
+SEARCH_CONFIG = "english"
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(brand_name, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(category, '')), 'C') || "
+    "setweight(jsonb_to_tsvector('english'::regconfig, coalesce(ingredients -> 'items', '[]'::jsonb), '[\"string\"]'), 'D')"
+)
+
 class Recipe(Base):
     __tablename__ = "recipes"
 
@@ -16,16 +33,28 @@ class Recipe(Base):
     cook_time = Column(Integer)
     total_time = Column(Integer)
     yield_amount = Column(Text, name="yield")  # "yield" is a Python keyword, so we use yield_amount
-    ingredients = Column(JSONB, nullable=False)
-    instructions = Column(Text, nullable=False)
-    storage_instructions = Column(Text)
-    recipe_variations = Column(Text)
-    special_equipment = Column(Text)
-    pro_tips = Column(Text)
-    nutritional_info = Column(JSONB)
-    faq = Column(JSONB)
-    serving_suggestions = Column(Text)
-    cost_comparison = Column(Text)
-    seo_meta_description = Column(Text)
+    ingredients = content_column(JSONB, nullable=False)
+    instructions = content_column(Text, nullable=False)
+    storage_instructions = content_column(Text)
+    recipe_variations = content_column(Text)
+    special_equipment = content_column(Text)
+    pro_tips = content_column(Text)
+    nutritional_info = content_column(JSONB)
+    faq = content_column(JSONB)
+    serving_suggestions = content_column(Text)
+    cost_comparison = content_column(Text)
+    seo_meta_description = content_column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Only used in WHERE/ORDER BY clauses, never loaded
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
+
+    __table_args__ = (
+        # Keyset pagination indexes, one per supported sort order
+        Index("ix_recipes_title_id", "title", "id"),
+        Index("ix_recipes_created_at_id", "created_at", "id"),
+        Index("ix_recipes_brand_name_title_id", "brand_name", "title", "id"),
+        Index("ix_recipes_category_title_id", "category", "title", "id"),
+        # Full-text search
+        Index("ix_recipes_search_vector", "search_vector", postgresql_using="gin"),
+    )
@@ -0,0 +1,162 @@
+"""
+Materialised brand and category counters for KnockoffKitchen.com
+
+The `brands` and `categories` collections hold one document per brand or
+category with the number of recipes in it, keyed by name. They are updated
+incrementally with `$inc` on every recipe write, so navigation endpoints read
+a handful of small documents instead of grouping the whole recipes collection.
+`reconcile_counters` recomputes them from the recipes to fix any drift.
+"""
+import argparse
+from collections import Counter
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+import pymongo
+
+from catalog_pages import slugify, category_description
+from mongodb_setup import (
+    get_recipes_collection,
+    get_brands_collection,
+    get_categories_collection
+)
+
+
+def counter_deltas(
+    old_recipe: Optional[Dict[str, Any]],
+    new_recipe: Optional[Dict[str, Any]]
+) -> Tuple[Counter, Counter]:
+    """
+    Compute the brand and category count changes caused by one recipe write.
+    Pass None as `old_recipe` for an insert and as `new_recipe` for a delete.
+    """
+    brand_deltas, category_deltas = Counter(), Counter()
+
+    if old_recipe:
+        if old_recipe.get("brand_name"):
+            brand_deltas[old_recipe["brand_name"]] -= 1
+        if old_recipe.get("category"):
+            category_deltas[old_recipe["category"]] -= 1
+
+    if new_recipe:
+        if new_recipe.get("brand_name"):
+            brand_deltas[new_recipe["brand_name"]] += 1
+        if new_recipe.get("category"):
+            category_deltas[new_recipe["category"]] += 1
+
+    return brand_deltas, category_deltas
+
+
+def _counter_update(name: str, delta: int, with_description: bool) -> pymongo.UpdateOne:
+    on_insert = {"slug": slugify(name)}
+    if with_description:
+        on_insert["description"] = category_description(name)
+    return pymongo.UpdateOne(
+        {"_id": name},
+        {"$inc": {"count": delta}, "$setOnInsert": on_insert},
+        upsert=True
+    )
+
+
+def apply_counter_deltas(brand_deltas: Dict[str, int], category_deltas: Dict[str, int]):
+    """
+    Apply count changes with one batched `$inc` per collection.
+    Counters that drop to zero are removed so they disappear from navigation.
+    """
+    for collection, deltas, with_description in (
+        (get_brands_collection(), brand_deltas, False),
+        (get_categories_collection(), category_deltas, True),
+    ):
+        operations = [
+            _counter_update(name, delta, with_description)
+            for name, delta in deltas.items()
+            if delta
+        ]
+        if not operations:
+            continue
+
+        collection.bulk_write(operations, ordered=False)
+        if any(delta < 0 for delta in deltas.values()):
+            collection.delete_many({"count": {"$lte": 0}})
+
+
+def record_recipe_change(
+    old_recipe: Optional[Dict[str, Any]],
+    new_recipe: Optional[Dict[str, Any]]
+):
+    """
+    Update the counters for a single recipe insert, update or delete
+    """
+    brand_deltas, category_deltas = counter_deltas(old_recipe, new_recipe)
+    apply_counter_deltas(brand_deltas, category_deltas)
+
+
+def record_recipe_changes(changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+    """
+    Update the counters for a batch of (old_recipe, new_recipe) changes in one round-trip per collection
+    """
+    brand_deltas, category_deltas = Counter(), Counter()
+    for old_recipe, new_recipe in changes:
+        brands, categories = counter_deltas(old_recipe, new_recipe)
+        brand_deltas.update(brands)
+        category_deltas.update(categories)
+    apply_counter_deltas(brand_deltas, category_deltas)
+
+
+def _reconcile_collection(collection, field: str, with_description: bool) -> int:
+    """
+    Recompute one counter collection from the recipes and fix any drift
+    """
+    recipes_collection = get_recipes_collection()
+    pipeline = [
+        {"$match": {field: {"$nin": [None, ""]}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+    ]
+    actual = {doc["_id"]: doc["count"] for doc in recipes_collection.aggregate(pipeline)}
+    stored = {doc["_id"]: doc.get("count", 0) for doc in collection.find({}, {"count": 1})}
+
+    operations = []
+    for name, count in actual.items():
+        if stored.get(name) != count:
+            on_insert = {"slug": slugify(name)}
+            if with_description:
+                on_insert["description"] = category_description(name)
+            operations.append(pymongo.UpdateOne(
+                {"_id": name},
+                {"$set": {"count": count}, "$setOnInsert": on_insert},
+                upsert=True
+            ))
+    for name in stored.keys() - actual.keys():
+        operations.append(pymongo.DeleteOne({"_id": name}))
+
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def reconcile_counters() -> Dict[str, int]:
+    """
+    Recompute brand and category counters from the recipes collection.
+    Returns the number of corrected entries per collection.
+    """
+    return {
+        "brands": _reconcile_collection(get_brands_collection(), "brand_name", False),
+        "categories": _reconcile_collection(get_categories_collection(), "category", True),
+    }
+
+
+def ensure_counters():
+    """
+    Build the counters once if they have never been populated
+    """
+    if get_brands_collection().find_one({}) is None and get_recipes_collection().find_one({}, {"_id": 1}):
+        corrected = reconcile_counters()
+        print(f"Built brand and category counters: {corrected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain brand and category counters")
+    parser.add_argument("--reconcile", action="store_true", help="Recompute counters from the recipes collection")
+    args = parser.parse_args()
+
+    if args.reconcile:
+        print(f"Corrected counters: {reconcile_counters()}")
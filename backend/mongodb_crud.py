@@ -3,6 +3,10 @@ CRUD operations for MongoDB
 """
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timezone
+import re
 import uuid
 
 from mongodb_setup import (
@@ -11,40 +15,179 @@ from mongodb_setup import (
     get_categories_collection,
     convert_mongodb_to_api
 )
+from pagination import parse_sort, encode_cursor, decode_cursor
+from mongodb_search import build_search_tokens, build_search_filter, touches_search_fields
+from mongodb_counters import record_recipe_change, record_recipe_changes
 
-async def create_recipe(recipe_data: Dict[str, Any]) -> Dict[str, Any]:
+# Fields needed by list and grid pages (recipe cards). Everything else -
+# introduction, instructions, faq, nutritional_info, ... - is detail-only.
+CARD_FIELDS = (
+    "title",
+    "slug",
+    "brand_name",
+    "category",
+    "image",
+    "image_url",
+    "image_alt",
+    "prep_time",
+    "cook_time",
+    "total_time",
+)
+
+# Predefined projections selectable with `view=`
+VIEWS = {
+    "card": CARD_FIELDS,
+}
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+
+def build_projection(
+    fields: Optional[List[str]] = None,
+    view: Optional[str] = None
+) -> Optional[Dict[str, int]]:
     """
-    Create a new recipe in MongoDB
+    Build a MongoDB projection from explicit field names and/or a named view.
+    Returns None (full documents) when neither is given.
     """
-    recipes_collection = get_recipes_collection()
+    if view and view not in VIEWS:
+        raise ValueError(f"Unknown view '{view}'. Use one of: {', '.join(VIEWS)}")
     
+    selected = list(VIEWS[view]) if view else []
+    for field in fields or []:
+        if not _FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name '{field}'")
+        if field not in selected:
+            selected.append(field)
+    
+    if not selected:
+        return None
+    
+    # _id is always returned and becomes `id` in the API response
+    return {field: 1 for field in selected}
+
+# Maximum number of recipes accepted by one bulk request
+MAX_BULK_SIZE = 1000
+
+# Fields read before an update: counters and search tokens are derived from them
+_DERIVED_FROM_FIELDS = {
+    "title": 1,
+    "brand_name": 1,
+    "category": 1,
+    "ingredients": 1,
+    "search_tokens": 1,
+    "version": 1,
+}
+
+def _prepare_new_recipe(recipe_data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """
+    Fill in the id and backend-maintained fields of a recipe about to be inserted
+    """
     # Generate a unique ID if not provided
     if '_id' not in recipe_data:
         recipe_data['_id'] = str(uuid.uuid4())
     
-    # Insert the recipe
-    result = recipes_collection.insert_one(recipe_data)
+    # Keep the prefix-search tokens in sync with the searchable fields
+    recipe_data['search_tokens'] = build_search_tokens(recipe_data)
+    
+    # Write version and timestamps used for the HTTP validators (ETag / Last-Modified)
+    recipe_data['version'] = 1
+    recipe_data['created_at'] = now
+    recipe_data['updated_at'] = now
+    return recipe_data
+
+def _prepare_update(recipe_data: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """
+    Build the $set document for an update, dropping backend-maintained fields
+    """
+    update_data = recipe_data.copy()
+    for field in ('_id', 'id', 'search_tokens', 'version', 'created_at'):
+        update_data.pop(field, None)
+    update_data['updated_at'] = now
+    return update_data
+
+async def create_recipe(recipe_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Create a new recipe in MongoDB
+    """
+    recipes_collection = get_recipes_collection()
+    
+    _prepare_new_recipe(recipe_data, datetime.now(timezone.utc))
+    
+    # Insert the recipe; the document written is exactly what we return,
+    # so there is no need to read it back
+    recipes_collection.insert_one(recipe_data)
     
-    # Get the inserted document
-    inserted_id = result.inserted_id
-    inserted_doc = recipes_collection.find_one({"_id": inserted_id})
+    # Keep the brand and category counters up to date
+    record_recipe_change(None, recipe_data)
     
     # Convert to API format
-    return convert_mongodb_to_api(inserted_doc)
+    return convert_mongodb_to_api(recipe_data)
+
+async def create_recipes(recipes_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Create many recipes with one unordered bulk_write.
+    Recipes that fail (e.g. duplicate slug) are reported without stopping the batch.
+    """
+    recipes_collection = get_recipes_collection()
+    
+    now = datetime.now(timezone.utc)
+    docs = [_prepare_new_recipe(recipe_data, now) for recipe_data in recipes_data]
+    
+    errors = []
+    if docs:
+        try:
+            recipes_collection.bulk_write([InsertOne(doc) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            errors = [
+                {"index": error["index"], "id": docs[error["index"]]["_id"], "message": error.get("errmsg", "")}
+                for error in e.details.get("writeErrors", [])
+            ]
+    
+    failed = {error["index"] for error in errors}
+    inserted = [doc for index, doc in enumerate(docs) if index not in failed]
+    record_recipe_changes((None, doc) for doc in inserted)
+    
+    return {
+        "inserted": [convert_mongodb_to_api(doc) for doc in inserted],
+        "errors": errors
+    }
 
 async def get_recipes(
     skip: int = 0,
     limit: int = 100,
     brand_name: Optional[str] = None,
     category: Optional[str] = None,
-    search_query: Optional[str] = None
+    search_query: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    view: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Get recipes from MongoDB with optional filtering
+    Get recipes from MongoDB with optional filtering.
+    `fields` and `view` restrict the returned fields; the projection is
+    applied by the server so unused fields never leave the database.
     """
     recipes_collection = get_recipes_collection()
     
     # Build query filter
+    query_filter = _build_filter(brand_name, category, search_query)
+    projection = build_projection(fields, view)
+    
+    # Execute query
+    cursor = recipes_collection.find(query_filter, projection).skip(skip).limit(limit)
+    
+    # Convert to list and API format
+    recipes = [convert_mongodb_to_api(doc) for doc in cursor]
+    
+    return recipes
+
+def _build_filter(
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    search_query: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Build the query filter shared by the offset and cursor listings
+    """
     query_filter = {}
     
     if brand_name:
@@ -54,20 +197,87 @@ async def get_recipes(
         query_filter["category"] = category
     
     if search_query:
-        # Text search across multiple fields
-        query_filter["$or"] = [
-            {"title": {"$regex": search_query, "$options": "i"}},
-            {"brand_name": {"$regex": search_query, "$options": "i"}},
-            {"category": {"$regex": search_query, "$options": "i"}}
-        ]
+        # Served by the text and search token indexes (see mongodb_search)
+        query_filter.update(build_search_filter(search_query))
     
-    # Execute query
-    cursor = recipes_collection.find(query_filter).skip(skip).limit(limit)
+    return query_filter
+
+def _keyset_filter(field: str, direction: int, value: Any, doc_id: Any) -> Dict[str, Any]:
+    """
+    Build the filter matching documents strictly after (value, doc_id) in the sort order.
     
-    # Convert to list and API format
-    recipes = [convert_mongodb_to_api(doc) for doc in cursor]
+    MongoDB sorts null/missing values before everything else, so documents without
+    the sort field come first in ascending order and last in descending order.
+    """
+    if direction == 1:
+        if value is None:
+            return {"$or": [
+                {field: None, "_id": {"$gt": doc_id}},
+                {field: {"$ne": None}}
+            ]}
+        return {"$or": [
+            {field: {"$gt": value}},
+            {field: value, "_id": {"$gt": doc_id}}
+        ]}
+    
+    if value is None:
+        return {field: None, "_id": {"$lt": doc_id}}
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": doc_id}},
+        {field: None}
+    ]}
+
+async def get_recipes_page(
+    limit: int = 100,
+    after: Optional[str] = None,
+    sort: Optional[str] = None,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    search_query: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    view: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Get a page of recipes using keyset (cursor) pagination.
     
-    return recipes
+    Unlike skip/limit, every page is a single index range scan on
+    (sort field, _id), so deep pages cost the same as the first one.
+    Returns the recipes and a `next_cursor` token (None on the last page).
+    """
+    recipes_collection = get_recipes_collection()
+    
+    field, direction = parse_sort(sort)
+    sort_key = sort or field
+    query_filter = _build_filter(brand_name, category, search_query)
+    projection = build_projection(fields, view)
+    if projection is not None:
+        # The sort field is needed to build the next cursor
+        projection[field] = 1
+    
+    if after:
+        value, doc_id = decode_cursor(after, sort_key)
+        keyset = _keyset_filter(field, direction, value, doc_id)
+        query_filter = {"$and": [query_filter, keyset]} if query_filter else keyset
+    
+    # Fetch one extra document to know whether there is a next page
+    cursor = (
+        recipes_collection.find(query_filter, projection)
+        .sort([(field, direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    docs = list(cursor)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(sort_key, last.get(field), last["_id"])
+    
+    return {
+        "recipes": [convert_mongodb_to_api(doc) for doc in docs],
+        "next_cursor": next_cursor
+    }
 
 async def get_recipe(recipe_id: str) -> Optional[Dict[str, Any]]:
     """
@@ -97,118 +307,227 @@ async def get_recipe_by_slug(slug: str) -> Optional[Dict[str, Any]]:
     
     return None
 
-async def update_recipe(recipe_id: str, recipe_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def get_recipe_validators(
+    recipe_id: Optional[str] = None,
+    slug: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
     """
-    Update a recipe
+    Get only the id, version and updated_at of a recipe, by id or slug.
+    The projection is covered by the (slug|_id, version, updated_at) indexes,
+    so conditional requests are answered without reading the document.
     """
     recipes_collection = get_recipes_collection()
     
-    # Remove _id from update data if present
-    update_data = recipe_data.copy()
-    if '_id' in update_data:
-        del update_data['_id']
+    query_filter = {"_id": recipe_id} if recipe_id is not None else {"slug": slug}
+    doc = recipes_collection.find_one(query_filter, {"_id": 1, "version": 1, "updated_at": 1})
+    
+    if doc:
+        return convert_mongodb_to_api(doc)
     
-    # Update the recipe
-    result = recipes_collection.update_one(
+    return None
+
+async def update_recipe(recipe_id: str, recipe_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Update a recipe in a single round-trip.
+    
+    find_one_and_update returns the document as it was before the write. The
+    updated document is rebuilt from it locally, and the previous brand,
+    category and searchable fields it carries keep counters and search tokens
+    in sync. Returns None if the recipe does not exist.
+    """
+    recipes_collection = get_recipes_collection()
+    
+    update_data = _prepare_update(recipe_data, datetime.now(timezone.utc))
+    before = recipes_collection.find_one_and_update(
         {"_id": recipe_id},
-        {"$set": update_data}
+        {"$set": update_data, "$inc": {"version": 1}},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.modified_count > 0:
-        # Get the updated document
-        updated_doc = recipes_collection.find_one({"_id": recipe_id})
-        return convert_mongodb_to_api(updated_doc)
+    if before is None:
+        return None
     
-    return None
+    updated_doc = {**before, **update_data, "version": before.get("version", 0) + 1}
+    
+    if touches_search_fields(update_data):
+        search_tokens = build_search_tokens(updated_doc)
+        if search_tokens != before.get("search_tokens"):
+            # Only for edits that change searchable words; guarded by version so
+            # a concurrent later edit (which writes its own tokens) wins
+            recipes_collection.update_one(
+                {"_id": recipe_id, "version": updated_doc["version"]},
+                {"$set": {"search_tokens": search_tokens}}
+            )
+            updated_doc["search_tokens"] = search_tokens
+    
+    # No-op unless the brand or category changed
+    record_recipe_change(before, updated_doc)
+    
+    return convert_mongodb_to_api(updated_doc)
+
+async def update_recipes(recipes_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Update many recipes, each given as a dict with its "id" and the fields to set.
+    
+    One read fetches the fields counters and search tokens depend on for the
+    whole batch, then one unordered bulk_write applies every update. Updates
+    that fail (e.g. duplicate slug) are reported without stopping the batch,
+    and only the applied ones count as updated.
+    """
+    recipes_collection = get_recipes_collection()
+    
+    updates = {}
+    positions = {}
+    for index, recipe_data in enumerate(recipes_data):
+        recipe_id = recipe_data.get("id", recipe_data.get("_id"))
+        if recipe_id is None:
+            raise ValueError("Every recipe in a bulk update needs an 'id'")
+        updates[str(recipe_id)] = recipe_data
+        positions[str(recipe_id)] = index
+    
+    current = {
+        doc["_id"]: doc
+        for doc in recipes_collection.find({"_id": {"$in": list(updates)}}, _DERIVED_FROM_FIELDS)
+    }
+    
+    now = datetime.now(timezone.utc)
+    operations = []
+    changes = []
+    for recipe_id, recipe_data in updates.items():
+        before = current.get(recipe_id)
+        if before is None:
+            continue
+        
+        update_data = _prepare_update(recipe_data, now)
+        if touches_search_fields(update_data):
+            update_data["search_tokens"] = build_search_tokens({**before, **update_data})
+        
+        operations.append(UpdateOne({"_id": recipe_id}, {"$set": update_data, "$inc": {"version": 1}}))
+        changes.append((before, {**before, **update_data}))
+    
+    errors = []
+    matched = len(operations)
+    if operations:
+        try:
+            matched = recipes_collection.bulk_write(operations, ordered=False).matched_count
+        except BulkWriteError as e:
+            matched = e.details.get("nMatched", 0)
+            errors = [
+                {
+                    "index": positions[changes[error["index"]][0]["_id"]],
+                    "id": changes[error["index"]][0]["_id"],
+                    "message": error.get("errmsg", "")
+                }
+                for error in e.details.get("writeErrors", [])
+            ]
+    
+    failed = {error["id"] for error in errors}
+    changes = [change for change in changes if change[0]["_id"] not in failed]
+    not_found = {recipe_id for recipe_id in updates if recipe_id not in current}
+    if matched < len(changes):
+        # Deleted between the read and the write
+        remaining = {doc["_id"] for doc in recipes_collection.find({"_id": {"$in": [before["_id"] for before, _ in changes]}}, {"_id": 1})}
+        not_found.update(before["_id"] for before, _ in changes if before["_id"] not in remaining)
+        changes = [change for change in changes if change[0]["_id"] in remaining]
+    record_recipe_changes(changes)
+    
+    updated = {before["_id"] for before, _ in changes}
+    return {
+        "updated": [recipe_id for recipe_id in updates if recipe_id in updated],
+        "not_found": [recipe_id for recipe_id in updates if recipe_id in not_found],
+        "errors": errors
+    }
 
 async def delete_recipe(recipe_id: str) -> Optional[Dict[str, Any]]:
     """
-    Delete a recipe
+    Delete a recipe in a single round-trip, returning the deleted document
     """
     recipes_collection = get_recipes_collection()
     
-    # Get the recipe before deleting
-    recipe = recipes_collection.find_one({"_id": recipe_id})
+    recipe = recipes_collection.find_one_and_delete({"_id": recipe_id})
     
     if recipe:
-        # Delete the recipe
-        recipes_collection.delete_one({"_id": recipe_id})
+        record_recipe_change(recipe, None)
         return convert_mongodb_to_api(recipe)
     
     return None
 
-async def get_brands() -> List[Dict[str, Any]]:
+async def delete_recipes(recipe_ids: List[str]) -> Dict[str, Any]:
     """
-    Get all unique brands from recipes
+    Delete many recipes with a single delete_many, keeping the counters in sync
     """
     recipes_collection = get_recipes_collection()
     
-    # Aggregate to get unique brands with counts
-    pipeline = [
-        {"$group": {
-            "_id": "$brand_name",
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
+    existing = list(recipes_collection.find(
+        {"_id": {"$in": recipe_ids}},
+        {"brand_name": 1, "category": 1}
+    ))
     
-    result = recipes_collection.aggregate(pipeline)
+    if existing:
+        recipes_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in existing]}})
+        record_recipe_changes((doc, None) for doc in existing)
     
-    # Format the result
-    brands = []
-    for doc in result:
-        brand_name = doc["_id"]
-        if brand_name:
-            # Generate slug from brand name
-            slug = brand_name.lower().replace(" ", "-").replace("&", "and")
-            brands.append({
-                "name": brand_name,
-                "slug": slug,
-                "count": doc["count"]
-            })
+    deleted = {doc["_id"] for doc in existing}
+    return {
+        "deleted": [recipe_id for recipe_id in recipe_ids if recipe_id in deleted],
+        "not_found": [recipe_id for recipe_id in recipe_ids if recipe_id not in deleted]
+    }
+
+async def get_brands() -> List[Dict[str, Any]]:
+    """
+    Get all brands with their recipe counts from the materialised counters
+    """
+    brands_collection = get_brands_collection()
     
-    return brands
+    return [
+        {"name": doc["_id"], "slug": doc["slug"], "count": doc["count"]}
+        for doc in brands_collection.find({"count": {"$gt": 0}}).sort("_id", 1)
+    ]
 
 async def get_categories() -> List[Dict[str, Any]]:
     """
-    Get all unique categories from recipes
+    Get all categories with their recipe counts from the materialised counters
     """
-    recipes_collection = get_recipes_collection()
-    
-    # Aggregate to get unique categories with counts
-    pipeline = [
-        {"$group": {
-            "_id": "$category",
-            "count": {"$sum": 1}
-        }},
-        {"$sort": {"_id": 1}}
+    categories_collection = get_categories_collection()
+    
+    return [
+        {
+            "name": doc["_id"],
+            "slug": doc["slug"],
+            "count": doc["count"],
+            "description": doc["description"]
+        }
+        for doc in categories_collection.find({"count": {"$gt": 0}}).sort("_id", 1)
     ]
-    
-    result = recipes_collection.aggregate(pipeline)
-    
-    # Format the result
-    categories = []
-    for doc in result:
-        category_name = doc["_id"]
-        if category_name:
-            # Generate slug from category name
-            slug = category_name.lower().replace(" ", "-").replace("&", "and")
-            
-            # Generate description
-            description = f"Delicious homemade {category_name.lower()} recipes that taste just like your favorite store-bought brands but healthier and more affordable."
-            
-            categories.append({
-                "name": category_name,
-                "slug": slug,
-                "count": doc["count"],
-                "description": description
-            })
-    
-    return categories
 
-async def get_recipe_count() -> int:
+async def get_recipe_count(
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    search_query: Optional[str] = None
+) -> int:
     """
-    Get the total number of recipes
+    Get the number of recipes, optionally for a brand, category and/or search.
+    
+    The unfiltered total comes from the collection metadata and single
+    filters from the materialised counters, so neither scans the recipes.
+    The brand + category combination and search matches are counted with
+    an index scan.
     """
+    if search_query:
+        recipes_collection = get_recipes_collection()
+        return recipes_collection.count_documents(_build_filter(brand_name, category, search_query))
+    
+    if brand_name and category:
+        recipes_collection = get_recipes_collection()
+        return recipes_collection.count_documents({"brand_name": brand_name, "category": category})
+    
+    if brand_name:
+        counter = get_brands_collection().find_one({"_id": brand_name}, {"count": 1})
+        return counter["count"] if counter else 0
+    
+    if category:
+        counter = get_categories_collection().find_one({"_id": category}, {"count": 1})
+        return counter["count"] if counter else 0
+    
     recipes_collection = get_recipes_collection()
-    return recipes_collection.count_documents({})
+    return recipes_collection.estimated_document_count()
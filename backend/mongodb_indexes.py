@@ -0,0 +1,174 @@
+"""
+Index management for the KnockoffKitchen.com MongoDB collections
+
+Every index the backend relies on is declared once, per collection, below.
+`ensure_indexes` creates the missing ones (it is idempotent and cheap when
+nothing is missing), and `check_query_plans` explains the queries the API
+issues and reports any that would fall back to a full collection scan.
+"""
+import argparse
+import sys
+from typing import Any, Dict, List, Optional
+
+import pymongo
+from pymongo import IndexModel
+
+from mongodb_setup import get_recipes_collection, get_related_collection
+from mongodb_search import SEARCH_WEIGHTS, TEXT_INDEX_NAME, TOKENS_INDEX_NAME, backfill_search_tokens
+
+ASC = pymongo.ASCENDING
+
+# Names are left to pymongo (e.g. "slug_1") so databases indexed by earlier
+# versions of the backend are recognised instead of conflicting
+RECIPE_INDEXES = [
+    # Detail pages are looked up by slug, which must be unique
+    IndexModel([("slug", ASC)], unique=True),
+
+    # Keyset pagination, one index per supported sort order and listing filter
+    IndexModel([("title", ASC), ("_id", ASC)]),
+    IndexModel([("created_at", ASC), ("_id", ASC)]),
+    IndexModel([("brand_name", ASC), ("title", ASC), ("_id", ASC)]),
+    IndexModel([("category", ASC), ("title", ASC), ("_id", ASC)]),
+
+    # Covering indexes for the validator lookups behind conditional GETs
+    IndexModel([("_id", ASC), ("version", ASC), ("updated_at", ASC)]),
+    IndexModel([("slug", ASC), ("_id", ASC), ("version", ASC), ("updated_at", ASC)]),
+
+    # Search: weighted text index for complete words, token index for prefixes
+    IndexModel(
+        [(field, pymongo.TEXT) for field in SEARCH_WEIGHTS],
+        weights=SEARCH_WEIGHTS,
+        default_language="english",
+        name=TEXT_INDEX_NAME
+    ),
+    IndexModel([("search_tokens", ASC)], name=TOKENS_INDEX_NAME),
+]
+
+# Neighbour table: LSH band lookups for incremental refreshes, and finding the
+# rows that list a recipe when it changes or is deleted
+RELATED_INDEXES = [
+    IndexModel([("bands", ASC)]),
+    IndexModel([("related.id", ASC)]),
+]
+
+# Representative queries issued by the API: (name, filter, sort)
+QUERY_PLAN_CHECKS = [
+    ("listing by title", {}, [("title", ASC), ("_id", ASC)]),
+    ("listing by newest", {}, [("created_at", -1), ("_id", -1)]),
+    ("brand listing", {"brand_name": "Oreo"}, [("title", ASC), ("_id", ASC)]),
+    ("category listing", {"category": "Cookies"}, [("title", ASC), ("_id", ASC)]),
+    ("recipe by slug", {"slug": "homemade-oreo-cookies"}, None),
+    ("search prefix", {"search_tokens": {"$regex": "^choc"}}, None),
+    ("search words", {"$text": {"$search": "chocolate"}}, None),
+]
+
+
+class QueryPlanError(RuntimeError):
+    """Raised by a strict plan check when a query would scan the whole collection"""
+
+
+def ensure_indexes(collection=None, indexes: Optional[List[IndexModel]] = None) -> List[str]:
+    """
+    Create the declared indexes that don't exist yet (the recipe indexes by
+    default). Returns the names created. Existing indexes that are no longer
+    declared are reported but never dropped.
+    """
+    if collection is None:
+        collection = get_recipes_collection()
+    if indexes is None:
+        indexes = RECIPE_INDEXES
+
+    existing = collection.index_information()
+    missing = [index for index in indexes if index.document["name"] not in existing]
+
+    created = []
+    if missing:
+        created = collection.create_indexes(missing)
+        print(f"Created {collection.name} indexes: {', '.join(created)}")
+
+    declared = {index.document["name"] for index in indexes} | {"_id_"}
+    undeclared = sorted(set(existing) - declared)
+    if undeclared:
+        print(f"{collection.name} indexes not declared in mongodb_indexes (candidates to drop): {', '.join(undeclared)}")
+
+    return created
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """
+    Flatten the stage names of an explain() plan tree
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def check_query_plans(recipes_collection=None, strict: bool = False) -> Dict[str, List[str]]:
+    """
+    Explain each representative query and report the ones whose winning plan
+    contains a COLLSCAN. Returns {query name: plan stages} for those queries;
+    with `strict`, raises QueryPlanError instead.
+    """
+    if recipes_collection is None:
+        recipes_collection = get_recipes_collection()
+
+    scans = {}
+    for name, query_filter, sort in QUERY_PLAN_CHECKS:
+        cursor = recipes_collection.find(query_filter).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = cursor.explain()
+        stages = plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            scans[name] = stages
+
+    for name, stages in scans.items():
+        print(f"Query plan check: '{name}' scans the collection ({' -> '.join(stages)})")
+
+    if scans and strict:
+        raise QueryPlanError(f"Queries without a usable index: {', '.join(scans)}")
+    return scans
+
+
+def prepare_indexes(strict: bool = False) -> Optional[Dict[str, List[str]]]:
+    """
+    Ensure the indexes, give recipes written before search tokens existed
+    their tokens (prefix search can't find them otherwise), then verify the
+    query plans. Meant to run off the request path at startup.
+    """
+    recipes_collection = get_recipes_collection()
+    ensure_indexes(recipes_collection)
+    ensure_indexes(get_related_collection(), RELATED_INDEXES)
+
+    backfilled = backfill_search_tokens(missing_only=True, ensure=False)
+    if backfilled:
+        print(f"Backfilled search tokens for {backfilled} recipes")
+    return check_query_plans(recipes_collection, strict=strict)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and verify the recipe indexes")
+    parser.add_argument("--ensure", action="store_true", help="Create missing indexes")
+    parser.add_argument("--check", action="store_true", help="Explain the API queries and report collection scans")
+    parser.add_argument("--strict", action="store_true", help="Exit with an error if any query scans the collection")
+    args = parser.parse_args()
+
+    if args.ensure:
+        ensure_indexes()
+        ensure_indexes(get_related_collection(), RELATED_INDEXES)
+
+    if args.check:
+        try:
+            scans = check_query_plans(strict=args.strict)
+        except QueryPlanError as e:
+            print(e)
+            sys.exit(1)
+        if not scans:
+            print("All checked queries use an index")
@@ -1,35 +1,58 @@
 """
 FastAPI main application with MongoDB backend for KnockoffKitchen.com
 """
-from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, BackgroundTasks, UploadFile, File, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 import os
-import uuid
-import pandas as pd
 import tempfile
 import asyncio
-import json
+from pymongo.errors import DuplicateKeyError
 
 # Import MongoDB utilities
 from mongodb_crud import (
     create_recipe,
     get_recipes,
+    get_recipes_page,
     get_recipe,
     get_recipe_by_slug,
+    get_recipe_validators,
     update_recipe,
     delete_recipe,
+    create_recipes,
+    update_recipes,
+    delete_recipes,
+    MAX_BULK_SIZE,
     get_brands,
     get_categories,
-    get_recipe_count
+    get_recipe_count,
+    build_projection
 )
+from mongodb_search import search_recipes
+from mongodb_counters import ensure_counters
+from mongodb_indexes import prepare_indexes
+from mongodb_related import (
+    get_related_recipes,
+    refresh_related,
+    remove_related,
+    affects_related,
+    RELATED_LIMIT
+)
+from read_cache import read_cache
+from http_caching import make_etag, is_not_modified, cache_headers, not_modified_response
+from api_responses import FastJSONResponse, PrecompressedJSON, CompressionMiddleware, choose_encoding, encode_etag
+
+# Recipe generation (pandas, the SQL models and the AI client) is imported on
+# first use in process_csv_background, keeping it out of the app's cold start
+from sitemap_scheduler import sitemap_scheduler
+from startup_tasks import StartupTasks
+from sitemap_generator import current_snapshot, restore_sitemap
+from recipe_stats import mongo_recipe_stats
 
-# Import recipe generation utilities
-from generate_recipes import process_csv
-from sitemap_generator import generate_sitemap
+app = FastAPI(title="KnockoffKitchen.com API", default_response_class=FastJSONResponse)
 
-app = FastAPI(title="KnockoffKitchen.com API")
+# Materialised catalog analytics, refreshed after bursts of writes
+recipe_stats = mongo_recipe_stats()
 
 # Add CORS middleware to allow cross-origin requests from the frontend
 app.add_middleware(
@@ -40,85 +63,364 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiate brotli/gzip for responses that are not precompressed
+app.add_middleware(CompressionMiddleware)
+
+# Listing pages deeper than this are not cached; crawlers walking every
+# page would only churn the cache
+CACHEABLE_LISTING_DEPTH = 1000
+
+def invalidate_recipe_reads(
+    recipe_ids: Iterable[str] = (),
+    brands: bool = True,
+    categories: bool = True,
+    count: bool = True
+):
+    """
+    Drop cached reads affected by a write to one or more recipes
+    """
+    tags = ["listings"]
+    tags.extend(f"recipe:{recipe_id}" for recipe_id in recipe_ids)
+    if brands:
+        tags.append("brands")
+    if categories:
+        tags.append("categories")
+    if count:
+        tags.append("count")
+    read_cache.invalidate(*tags)
+
+async def cached_json(
+    request: Request,
+    namespace: str,
+    params: Optional[Dict[str, Any]],
+    loader,
+    tags: List[str],
+    policy: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serve a JSON payload from the read cache. Payloads are cached rendered and
+    precompressed, so hits cost neither serialisation nor compression.
+    """
+    async def render():
+        data = await loader()
+        return None if data is None else PrecompressedJSON(data)
+    
+    payload = await read_cache.get_or_load(namespace, params, render, tags=tags)
+    return payload.response(request, {**cache_headers(policy), **(headers or {})})
+
+async def cached_count(
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    search: Optional[str] = None
+) -> int:
+    """
+    Recipe count for an optional brand/category/search filter, through the read cache
+    """
+    tags = ["count"]
+    if brand_name:
+        tags.append("brands")
+    if category:
+        tags.append("categories")
+    if search:
+        # Any write (including an update to a title) can change the matches
+        tags.append("listings")
+    
+    async def load():
+        return {"count": await get_recipe_count(brand_name=brand_name, category=category, search_query=search)}
+    
+    params = {"brand_name": brand_name, "category": category, "search": search}
+    result = await read_cache.get_or_load("count", params, load, tags=tags)
+    return result["count"]
+
+def recipe_cache_headers(recipe: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Cache-Control, ETag and Last-Modified headers for a recipe (or its validators)
+    """
+    etag = make_etag(recipe["id"], recipe.get("version", 0))
+    return cache_headers("recipe", etag=etag, last_modified=recipe.get("updated_at"))
+
+async def serve_recipe(request: Request, lookup: Dict[str, str]) -> Response:
+    """
+    Serve a recipe looked up by {"id": ...} or {"slug": ...} with HTTP validators.
+    
+    Conditional requests are answered from the read cache when possible and
+    otherwise from an index-only validator lookup, so a 304 never needs the
+    full document.
+    """
+    key = read_cache.make_key("recipe", lookup)
+    found, payload = read_cache.get(key)
+    
+    conditional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    if not found and conditional:
+        validators = await get_recipe_validators(recipe_id=lookup.get("id"), slug=lookup.get("slug"))
+        if validators is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        headers = recipe_cache_headers(validators)
+        if is_not_modified(request.headers, headers.get("ETag"), validators.get("updated_at")):
+            return not_modified_response(headers)
+    
+    if not found:
+        if "id" in lookup:
+            db_recipe = await get_recipe(lookup["id"])
+        else:
+            db_recipe = await get_recipe_by_slug(lookup["slug"])
+        if db_recipe is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        payload = PrecompressedJSON(db_recipe)
+        # Tagged with the id so that updates and deletes also drop slug lookups
+        read_cache.set(key, payload, tags=[f"recipe:{db_recipe['id']}"])
+    
+    headers = recipe_cache_headers(payload.data)
+    if is_not_modified(request.headers, headers.get("ETag"), payload.data.get("updated_at")):
+        return not_modified_response(headers)
+    
+    return payload.response(request, headers)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the KnockoffKitchen.com API"}
 
+def duplicate_key_detail(error: DuplicateKeyError) -> str:
+    """
+    Name the field and value a write collided on, e.g. an existing slug
+    """
+    key_value = (error.details or {}).get("keyValue") or {}
+    if not key_value:
+        return "A recipe with the same unique key already exists"
+    fields = ", ".join(f"{'id' if field == '_id' else field} '{value}'" for field, value in key_value.items())
+    return f"A recipe with {fields} already exists"
+
 @app.post("/recipes/", status_code=201)
 async def create_recipe_endpoint(recipe_data: Dict[str, Any], background_tasks: BackgroundTasks):
     """
-    Create a new recipe
+    Create a new recipe. Returns 409 if its slug (or id) is already taken.
     """
-    new_recipe = await create_recipe(recipe_data)
+    try:
+        new_recipe = await create_recipe(recipe_data)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=409, detail=duplicate_key_detail(e))
+    invalidate_recipe_reads()
+    background_tasks.add_task(refresh_related, [new_recipe["id"]])
     
     # Update sitemap after creating a new recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return new_recipe
 
 @app.get("/recipes/")
 async def read_recipes(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     brand_name: Optional[str] = None,
     category: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    cursor: bool = False,
+    after: Optional[str] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
+    include_count: bool = False
 ):
     """
-    Get recipes with optional filtering
+    Get recipes with optional filtering.
+    
+    Pass `cursor=true` (or an `after` token) to switch to keyset pagination:
+    the response is then `{"recipes": [...], "next_cursor": ...}` and the
+    next page is requested with `after=<next_cursor>`.
+    
+    Use `view=card` or a comma-separated `fields=` list to return only the
+    fields a listing page needs instead of full recipe documents.
+    
+    With `include_count=true` the total number of recipes matching the
+    brand/category filter and the search, if any, is returned in the
+    `X-Total-Count` header, so paginated pages don't need a separate
+    /recipes/count request.
     """
-    recipes = await get_recipes(
-        skip=skip, 
-        limit=limit, 
-        brand_name=brand_name, 
-        category=category,
-        search_query=search
-    )
-    return recipes
+    headers = {}
+    if include_count:
+        headers["X-Total-Count"] = str(await cached_count(brand_name, category, search))
+    
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    cursor_mode = bool(cursor or after)
+    
+    async def load():
+        if cursor_mode:
+            return await get_recipes_page(
+                limit=limit,
+                after=after,
+                sort=sort,
+                brand_name=brand_name,
+                category=category,
+                search_query=search,
+                fields=field_list,
+                view=view
+            )
+        
+        return await get_recipes(
+            skip=skip, 
+            limit=limit, 
+            brand_name=brand_name, 
+            category=category,
+            search_query=search,
+            fields=field_list,
+            view=view
+        )
+    
+    try:
+        # Cache only the first pages of each listing: the first cursor page
+        # (no `after` token) or offset pages within CACHEABLE_LISTING_DEPTH
+        cacheable = (not after) if cursor_mode else (skip + limit <= CACHEABLE_LISTING_DEPTH)
+        if cacheable:
+            params = {
+                "skip": skip, "limit": limit, "brand_name": brand_name, "category": category,
+                "search": search, "cursor": cursor, "sort": sort, "fields": field_list, "view": view
+            }
+            return await cached_json(request, "recipes", params, load, ["listings"], "listing", headers)
+        return FastJSONResponse(await load(), headers={**cache_headers("listing"), **headers})
+    except ValueError as e:
+        # Unknown sort order or view, invalid field name or malformed cursor token
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/recipes/count")
-async def get_count():
+async def get_count(
+    response: Response,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None
+):
     """
-    Get the total number of recipes
+    Get the number of recipes, optionally for a brand and/or category
     """
-    count = await get_recipe_count()
-    return {"count": count}
+    response.headers.update(cache_headers("count"))
+    return {"count": await cached_count(brand_name, category)}
 
 @app.get("/recipes/{recipe_id}")
-async def read_recipe(recipe_id: str):
+async def read_recipe(recipe_id: str, request: Request):
     """
     Get a recipe by ID
     """
-    db_recipe = await get_recipe(recipe_id)
-    if db_recipe is None:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    return db_recipe
+    return await serve_recipe(request, {"id": recipe_id})
+
+@app.get("/recipes/{recipe_id}/related")
+async def read_related_recipes(
+    recipe_id: str,
+    response: Response,
+    limit: int = Query(RELATED_LIMIT, ge=1, le=RELATED_LIMIT)
+):
+    """
+    Recipe cards similar to a recipe, most similar first, from the precomputed neighbour table
+    """
+    related = await get_related_recipes(recipe_id, limit)
+    if related is None:
+        # No neighbour row yet: either the recipe was just created or it doesn't exist
+        if await get_recipe_validators(recipe_id=recipe_id) is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        related = []
+    
+    response.headers.update(cache_headers("listing"))
+    return related
 
 @app.get("/recipes/slug/{slug}")
-async def read_recipe_by_slug(slug: str):
+async def read_recipe_by_slug(slug: str, request: Request):
     """
     Get a recipe by slug
     """
-    db_recipe = await get_recipe_by_slug(slug)
-    if db_recipe is None:
-        raise HTTPException(status_code=404, detail="Recipe not found")
-    return db_recipe
+    return await serve_recipe(request, {"slug": slug})
+
+def check_bulk_size(items: List[Any]):
+    if len(items) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_SIZE} recipes per bulk request")
+
+@app.post("/recipes/bulk", status_code=201)
+async def create_recipes_endpoint(recipes_data: List[Dict[str, Any]], background_tasks: BackgroundTasks):
+    """
+    Create many recipes in one request. Failed recipes are listed in `errors`.
+    """
+    check_bulk_size(recipes_data)
+    result = await create_recipes(recipes_data)
+    
+    # One cache invalidation and sitemap update for the whole batch
+    if result["inserted"]:
+        invalidate_recipe_reads()
+        background_tasks.add_task(refresh_related, [recipe["id"] for recipe in result["inserted"]])
+        sitemap_scheduler.mark_dirty(len(result["inserted"]))
+        recipe_stats.mark_dirty(len(result["inserted"]))
+    
+    return result
+
+@app.put("/recipes/bulk")
+async def update_recipes_endpoint(recipes_data: List[Dict[str, Any]], background_tasks: BackgroundTasks):
+    """
+    Update many recipes in one request. Each item needs an "id" plus the fields to set.
+    Failed updates (e.g. duplicate slug) are listed in `errors`; the rest are applied.
+    """
+    check_bulk_size(recipes_data)
+    try:
+        result = await update_recipes(recipes_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if result["updated"]:
+        # Side effects only for the updates that were applied
+        updated = set(result["updated"])
+        applied = [recipe for recipe in recipes_data if str(recipe.get("id", recipe.get("_id"))) in updated]
+        invalidate_recipe_reads(
+            result["updated"],
+            brands=any("brand_name" in recipe for recipe in applied),
+            categories=any("category" in recipe for recipe in applied),
+            count=False
+        )
+        if any(affects_related(recipe) for recipe in applied):
+            background_tasks.add_task(refresh_related, result["updated"])
+        sitemap_scheduler.mark_dirty(len(result["updated"]))
+        recipe_stats.mark_dirty(len(result["updated"]))
+    
+    return result
+
+@app.delete("/recipes/bulk")
+async def delete_recipes_endpoint(recipe_ids: List[str], background_tasks: BackgroundTasks):
+    """
+    Delete many recipes in one request, given a JSON list of ids
+    """
+    check_bulk_size(recipe_ids)
+    result = await delete_recipes(recipe_ids)
+    
+    if result["deleted"]:
+        invalidate_recipe_reads(result["deleted"])
+        background_tasks.add_task(remove_related, result["deleted"])
+        sitemap_scheduler.mark_dirty(len(result["deleted"]))
+        recipe_stats.mark_dirty(len(result["deleted"]))
+    
+    return result
 
 @app.put("/recipes/{recipe_id}")
 async def update_recipe_endpoint(
     recipe_id: str, recipe_data: Dict[str, Any], background_tasks: BackgroundTasks
 ):
     """
-    Update a recipe
+    Update a recipe. Returns 409 if the new slug is already taken.
     """
-    db_recipe = await get_recipe(recipe_id)
-    if db_recipe is None:
+    try:
+        updated_recipe = await update_recipe(recipe_id, recipe_data)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=409, detail=duplicate_key_detail(e))
+    if updated_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
     
-    updated_recipe = await update_recipe(recipe_id, recipe_data)
+    invalidate_recipe_reads(
+        [recipe_id],
+        brands="brand_name" in recipe_data,
+        categories="category" in recipe_data,
+        count=False
+    )
+    if affects_related(recipe_data):
+        background_tasks.add_task(refresh_related, [recipe_id])
     
     # Update sitemap after updating a recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return updated_recipe
 
@@ -130,36 +432,145 @@ async def delete_recipe_endpoint(recipe_id: str, background_tasks: BackgroundTas
     db_recipe = await delete_recipe(recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    invalidate_recipe_reads([recipe_id])
+    background_tasks.add_task(remove_related, [recipe_id])
     
     # Update sitemap after deleting a recipe
-    background_tasks.add_task(generate_sitemap)
+    sitemap_scheduler.mark_dirty()
+    recipe_stats.mark_dirty()
     
     return db_recipe
 
+@app.get("/search")
+async def search_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    view: Optional[str] = None
+):
+    """
+    Search recipes by title, brand, category and ingredients, ranked by relevance.
+    The last word of `q` is matched as a prefix for search-as-you-type.
+    """
+    try:
+        projection = build_projection(view=view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response.headers.update(cache_headers("search"))
+    return await search_recipes(
+        q,
+        skip=skip,
+        limit=limit,
+        brand_name=brand_name,
+        category=category,
+        projection=projection
+    )
+
 @app.get("/brands/")
-async def get_brands_endpoint():
+async def get_brands_endpoint(request: Request):
     """
     Get all brands
     """
-    brands = await get_brands()
-    return brands
+    return await cached_json(request, "brands", None, get_brands, ["brands"], "navigation")
 
 @app.get("/categories/")
-async def get_categories_endpoint():
+async def get_categories_endpoint(request: Request):
     """
     Get all categories
     """
-    categories = await get_categories()
-    return categories
+    return await cached_json(request, "categories", None, get_categories, ["categories"], "navigation")
+
+@app.get("/admin/cache/stats")
+async def cache_stats_endpoint(response: Response):
+    """
+    Hit/miss/eviction metrics and size of the read cache
+    """
+    response.headers.update(cache_headers("admin"))
+    return read_cache.stats()
+
+@app.get("/admin/stats")
+async def stats_endpoint(response: Response):
+    """
+    Recipe counts by brand and category, time averages and percentiles, and
+    recipes added per day, from the latest materialised snapshot (see
+    recipe_stats.RecipeStats.get for `as_of` and `stale`)
+    """
+    response.headers.update(cache_headers("admin"))
+    try:
+        return await recipe_stats.get()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/admin/export")
+async def export_endpoint(format: str = Query("csv", pattern="^(csv|parquet)$")):
+    """
+    Download every recipe as CSV or Parquet, streamed from a batched cursor
+    """
+    # Imported on first use: the Parquet encoder is heavy and exports are rare
+    from recipe_export import MONGO_COLUMNS, export_response, mongo_batches
+    
+    return await export_response(mongo_batches(), MONGO_COLUMNS, format)
+
+def serve_sitemap_file(request: Request, path: str) -> Response:
+    """
+    Serve a sitemap document from the latest in-memory snapshot, precompressed
+    and with validators
+    """
+    snapshot = current_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Sitemap is being generated", headers={"Retry-After": "30"})
+    sitemap_file = snapshot.files.get(path)
+    if sitemap_file is None:
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    
+    headers = cache_headers("sitemap", etag=sitemap_file.etag, last_modified=sitemap_file.last_modified)
+    if sitemap_file.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request.headers, sitemap_file.etag, sitemap_file.last_modified):
+        return not_modified_response(headers)
+    
+    body = sitemap_file.body
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding in sitemap_file.variants:
+        body = sitemap_file.variants[encoding]
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = encode_etag(headers["ETag"], encoding)
+    return Response(content=body, media_type=sitemap_file.media_type, headers=headers)
+
+@app.get("/sitemap.xml")
+async def sitemap_index(request: Request):
+    """
+    The sitemap index
+    """
+    return serve_sitemap_file(request, "sitemap.xml")
+
+@app.get("/sitemaps/{name}")
+async def sitemap_shard(request: Request, name: str):
+    """
+    A gzip-compressed sitemap shard listed in the index
+    """
+    return serve_sitemap_file(request, f"sitemaps/{name}")
 
 @app.post("/sitemap/generate/", status_code=202)
 async def generate_sitemap_endpoint(background_tasks: BackgroundTasks):
     """
     Endpoint to manually trigger sitemap generation
     """
-    background_tasks.add_task(generate_sitemap)
+    background_tasks.add_task(sitemap_scheduler.build_now)
     return {"message": "Sitemap generation started in the background"}
 
+@app.get("/admin/sitemap/status")
+async def sitemap_status_endpoint(response: Response):
+    """
+    Pending changes, last build and build duration of the sitemap scheduler
+    """
+    response.headers.update(cache_headers("admin"))
+    return sitemap_scheduler.state()
+
 @app.post("/admin/upload-csv/")
 async def upload_csv(
     background_tasks: BackgroundTasks,
@@ -193,23 +604,61 @@ async def process_csv_background(csv_path, limit, dry_run, use_ai):
     Process CSV file in the background
     """
     try:
+        from generate_recipes import process_csv
+        
         await process_csv(csv_path, limit, dry_run, use_ai)
         
         # Clean up the temporary file
         os.unlink(csv_path)
         
         # Update sitemap after processing
-        await generate_sitemap()
+        await sitemap_scheduler.build_now()
+        recipe_stats.mark_dirty()
         
         print("CSV processing completed successfully")
     except Exception as e:
         print(f"Error processing CSV: {e}")
 
-# Generate sitemap on startup
-@app.on_event("startup")
-async def startup_event():
+# Startup work that must not delay serving the first request
+startup_tasks = StartupTasks()
+
+@app.get("/health/ready")
+async def readiness_endpoint():
+    """
+    Readiness probe: 503 while startup work (counters, indexes, initial sitemap, stats) is still running
+    """
+    return startup_tasks.readiness_response()
+
+async def prepare_indexes_on_startup():
     try:
-        await generate_sitemap()
+        # Index builds and explain() are blocking driver calls
+        await asyncio.to_thread(prepare_indexes, os.environ.get("MONGODB_STRICT_QUERY_PLANS") == "1")
     except Exception as e:
-        print(f"Error generating sitemap: {e}")
-        print("Continuing startup without sitemap generation")
+        print(f"Error preparing recipe indexes: {e}")
+
+async def build_counters_on_startup():
+    try:
+        # Populate the brand and category counters on first run (a full $group)
+        await asyncio.to_thread(ensure_counters)
+    except Exception as e:
+        print(f"Error building brand and category counters: {e}")
+
+async def regenerate_sitemap_on_startup():
+    # Keep serving the previous sitemap until the new one is ready
+    await restore_sitemap()
+    await sitemap_scheduler.build_now()
+
+@app.on_event("startup")
+async def startup_event():
+    # Queries keep working (if slower) while indexes and counters are built, and
+    # the previous sitemap is served until the new one is built, so none of it
+    # needs to finish before the app starts accepting requests
+    startup_tasks.start("counters", build_counters_on_startup())
+    startup_tasks.start("indexes", prepare_indexes_on_startup())
+    startup_tasks.start("sitemap", regenerate_sitemap_on_startup())
+    startup_tasks.start("stats", recipe_stats.scheduler.build_now())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Don't lose writes still waiting out the debounce window
+    await sitemap_scheduler.flush()
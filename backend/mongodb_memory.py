@@ -0,0 +1,1948 @@
+"""
+In-memory MongoDB-compatible engine for KnockoffKitchen.com
+
+A drop-in stand-in for a pymongo client, used for development when no MongoDB
+server is reachable and for running benchmarks offline. It implements the part
+of the pymongo API the backend uses, with MongoDB semantics where they matter
+to the application:
+
+- find / find_one with projection, sort, skip, limit and batch_size, and the
+  query operators $and/$or/$nor, $eq/$ne/$gt/$gte/$lt/$lte, $in/$nin, $regex,
+  $exists, $not, $size, $all, $expr and $text
+- insert, update ($set, $unset, $inc, $setOnInsert, $push, $addToSet, $pull,
+  $min, $max, $currentDate, upserts), delete, find_one_and_update/delete,
+  replace_one and bulk_write with ordered/unordered error reporting
+- count_documents, estimated_document_count and distinct
+- aggregate with $match, $group, $sort, $skip, $limit, $addFields/$set,
+  $project, $unset, $unwind, $count, $facet and $replaceRoot, and the
+  expression operators listed in _EXPRESSION_OPERATORS
+- indexes: unique constraints, hash lookups for equality and $in, sorted
+  lookups for ranges and anchored regex prefixes, a weighted text index, and
+  explain() reporting IDHACK / IXSCAN / TEXT / COLLSCAN plans
+
+Documents are copied in and out, so callers can never mutate stored data.
+Text scores and stemming approximate MongoDB's; rankings are close, not equal.
+"""
+import bisect
+import copy
+import math
+import re
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from pymongo import (
+    DeleteMany,
+    DeleteOne,
+    IndexModel,
+    InsertOne,
+    ReplaceOne,
+    ReturnDocument,
+    UpdateMany,
+    UpdateOne
+)
+from pymongo.errors import BulkWriteError, DuplicateKeyError, InvalidOperation, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult
+)
+
+# Marks an absent field (distinct from a stored null)
+_MISSING = object()
+
+# Pipeline documents carry their text score under a key no stored field can have
+_SCORE_FIELD = "$textScore"
+
+
+# ---------------------------------------------------------------------------
+# Values: storage normalisation, copying and BSON ordering
+# ---------------------------------------------------------------------------
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _to_stored(value: Any) -> Any:
+    """
+    Copy a value the way a round-trip through BSON would change it: datetimes
+    become naive UTC with millisecond precision and tuples become lists
+    """
+    if isinstance(value, dict):
+        return {key: _to_stored(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_stored(item) for item in value]
+    if isinstance(value, datetime):
+        value = _naive_utc(value)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _copy(value: Any) -> Any:
+    # Stored scalars are immutable, so only containers need copying
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, Decimal128)) and not isinstance(value, bool)
+
+
+def _sort_key(value: Any) -> Tuple:
+    """
+    Hashable key ordering values like MongoDB: null < numbers < strings <
+    objects < arrays < binary < ObjectId < booleans < dates < regexes
+    """
+    if value is None or value is _MISSING:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, int(value))
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, Decimal128):
+        return (2, float(value.to_decimal()))
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((key, _sort_key(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (5, tuple(_sort_key(item) for item in value))
+    if isinstance(value, bytes):
+        return (6, value)
+    if isinstance(value, uuid.UUID):
+        return (6, value.bytes)
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, _naive_utc(value))
+    if isinstance(value, re.Pattern):
+        return (11, value.pattern)
+    return (10, str(value))
+
+
+def _truthy(value: Any) -> bool:
+    # Aggregation truthiness: only false, null, missing and zero are false
+    if value is None or value is _MISSING or value is False:
+        return False
+    if _is_number(value):
+        return value != 0
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Field paths
+# ---------------------------------------------------------------------------
+
+def _get_values(doc: Any, path: str) -> List[Any]:
+    """
+    All values at a dotted path, traversing arrays of subdocuments the way
+    query predicates do. An empty list means the field is missing.
+    """
+    values = [doc]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    next_values.append(value[int(part)])
+                for item in value:
+                    if isinstance(item, dict) and part in item:
+                        next_values.append(item[part])
+        values = next_values
+    return values
+
+
+def _candidates(values: List[Any]) -> Iterator[Any]:
+    # A predicate matches an array field if it matches the array or any element
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _get_path(doc: Dict[str, Any], path: str) -> Any:
+    """Value at a dotted path without array traversal, or _MISSING"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value: Any) -> bool:
+    """Set a dotted path, creating subdocuments. Returns whether the value changed."""
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        child = target.get(part)
+        if child is None:
+            child = target[part] = {}
+        elif not isinstance(child, (dict, list)):
+            raise OperationFailure(f"Cannot create field '{parts[-1]}' in element {{{part}: {child!r}}}", 28)
+        target = child
+
+    last = parts[-1]
+    if isinstance(target, list) and last.isdigit():
+        index = int(last)
+        while len(target) <= index:
+            target.append(None)
+        if type(target[index]) is type(value) and target[index] == value:
+            return False
+        target[index] = value
+        return True
+
+    old = target.get(last, _MISSING)
+    if type(old) is type(value) and old == value:
+        return False
+    target[last] = value
+    return True
+
+
+def _unset_path(doc: Dict[str, Any], path: str) -> bool:
+    parts = path.split(".")
+    parent = _get_path(doc, ".".join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(parent, dict) and parts[-1] in parent:
+        del parent[parts[-1]]
+        return True
+    return False
+
+
+def _assign(doc: Dict[str, Any], path: str, value: Any):
+    """Set a dotted path on a shallow copy, copying subdocuments along the way"""
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        child = target.get(part)
+        child = dict(child) if isinstance(child, dict) else {}
+        target[part] = child
+        target = child
+    target[parts[-1]] = value
+
+
+def _include_path(source: Dict[str, Any], target: Dict[str, Any], parts: List[str]):
+    head, rest = parts[0], parts[1:]
+    if head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = value
+    elif isinstance(value, dict):
+        child = target.setdefault(head, {})
+        if isinstance(child, dict):
+            _include_path(value, child, rest)
+    elif isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                projected = {}
+                _include_path(item, projected, rest)
+                items.append(projected)
+        target[head] = items
+
+
+def _exclude_path(doc: Dict[str, Any], parts: List[str]):
+    head, rest = parts[0], parts[1:]
+    if head not in doc:
+        return
+    if not rest:
+        del doc[head]
+        return
+    value = doc[head]
+    if isinstance(value, dict):
+        value = dict(value)
+        _exclude_path(value, rest)
+        doc[head] = value
+    elif isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                item = dict(item)
+                _exclude_path(item, rest)
+            items.append(item)
+        doc[head] = items
+
+
+# ---------------------------------------------------------------------------
+# Query matching
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=1024)
+def _compile_regex(pattern: str, options: str = "") -> re.Pattern:
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _is_operator_dict(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+
+def _matches_value(values: List[Any], target: Any) -> bool:
+    if isinstance(target, re.Pattern):
+        return any(isinstance(c, str) and target.search(c) for c in _candidates(values))
+    if target is None:
+        return not values or any(c is None for c in _candidates(values))
+    key = _sort_key(target)
+    return any(_sort_key(c) == key for c in _candidates(values))
+
+
+_in_cache: Dict[int, Tuple[list, set, list]] = {}
+
+
+def _in_targets(targets: list) -> Tuple[set, list]:
+    """
+    Hash keys of an $in list (plus its regexes and null flag), cached per list
+    object so large $in lists aren't re-hashed for every document
+    """
+    cached = _in_cache.get(id(targets))
+    if cached is not None and cached[0] is targets:
+        return cached[1], cached[2]
+    keys = {_sort_key(t) for t in targets if not isinstance(t, re.Pattern)}
+    patterns = [t for t in targets if isinstance(t, re.Pattern)]
+    if len(_in_cache) > 256:
+        _in_cache.clear()
+    _in_cache[id(targets)] = (targets, keys, patterns)
+    return keys, patterns
+
+
+def _matches_any(values: List[Any], targets: list) -> bool:
+    keys, patterns = _in_targets(targets)
+    if not values and _sort_key(None) in keys:
+        return True
+    for candidate in _candidates(values):
+        if _sort_key(candidate) in keys:
+            return True
+        if patterns and isinstance(candidate, str) and any(p.search(candidate) for p in patterns):
+            return True
+    return False
+
+
+def _compare(values: List[Any], target: Any, test: Callable[[Tuple, Tuple], bool]) -> bool:
+    # Comparison operators only match values of the same type bracket
+    target_key = _sort_key(target)
+    for candidate in _candidates(values):
+        key = _sort_key(candidate)
+        if key[0] == target_key[0] and test(key, target_key):
+            return True
+    return False
+
+
+def _match_operator(operator: str, argument: Any, values: List[Any], condition: Dict[str, Any], doc) -> bool:
+    if operator == "$eq":
+        return _matches_value(values, argument)
+    if operator == "$ne":
+        return not _matches_value(values, argument)
+    if operator == "$gt":
+        return _compare(values, argument, lambda a, b: a > b)
+    if operator == "$gte":
+        return _compare(values, argument, lambda a, b: a >= b)
+    if operator == "$lt":
+        return _compare(values, argument, lambda a, b: a < b)
+    if operator == "$lte":
+        return _compare(values, argument, lambda a, b: a <= b)
+    if operator == "$in":
+        return _matches_any(values, argument)
+    if operator == "$nin":
+        return not _matches_any(values, argument)
+    if operator == "$exists":
+        return bool(values) == bool(argument)
+    if operator == "$regex":
+        pattern = argument if isinstance(argument, re.Pattern) else _compile_regex(argument, condition.get("$options", ""))
+        return _matches_value(values, pattern)
+    if operator == "$options":
+        return True
+    if operator == "$not":
+        if isinstance(argument, re.Pattern):
+            return not _matches_value(values, argument)
+        return not all(
+            _match_operator(op, arg, values, argument, doc) for op, arg in argument.items()
+        )
+    if operator == "$size":
+        return any(isinstance(v, list) and len(v) == argument for v in values)
+    if operator == "$all":
+        return all(_matches_value(values, target) for target in argument)
+    if operator == "$elemMatch":
+        for value in values:
+            if not isinstance(value, list):
+                continue
+            for item in value:
+                if _is_operator_dict(argument):
+                    if all(_match_operator(op, arg, [item], argument, doc) for op, arg in argument.items()):
+                        return True
+                elif isinstance(item, dict) and match_document(item, argument):
+                    return True
+        return False
+    raise OperationFailure(f"unknown operator: {operator}", 2)
+
+
+def match_document(doc: Dict[str, Any], query_filter: Dict[str, Any], text_matches=None) -> bool:
+    """
+    Whether a document matches a query filter. `text_matches` holds the ids
+    selected by the filter's $text clause, if it has one.
+    """
+    for key, condition in query_filter.items():
+        if key == "$and":
+            if not all(match_document(doc, sub, text_matches) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_document(doc, sub, text_matches) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(match_document(doc, sub, text_matches) for sub in condition):
+                return False
+        elif key == "$text":
+            if text_matches is None:
+                raise OperationFailure("text index required for $text query", 27)
+            if _sort_key(doc.get("_id")) not in text_matches:
+                return False
+        elif key == "$expr":
+            if not _truthy(_evaluate(condition, doc)):
+                return False
+        elif key == "$comment":
+            continue
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}", 2)
+        else:
+            values = _get_values(doc, key)
+            if _is_operator_dict(condition):
+                if not all(
+                    _match_operator(op, arg, values, condition, doc) for op, arg in condition.items()
+                ):
+                    return False
+            elif not _matches_value(values, condition):
+                return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Sorting and projection
+# ---------------------------------------------------------------------------
+
+def _normalize_sort(key_or_list: Any, direction: Any = None) -> List[Tuple[str, Any]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, 1 if direction is None else direction)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [tuple(item) if isinstance(item, (list, tuple)) else (item, 1) for item in key_or_list]
+
+
+def _sort_value(doc: Dict[str, Any], path: str, descending: bool) -> Tuple:
+    values = list(_candidates(_get_values(doc, path)))
+    scalars = [v for v in values if not isinstance(v, list)] or values
+    if not scalars:
+        return _sort_key(None)
+    keys = [_sort_key(v) for v in scalars]
+    # Arrays sort by their smallest element ascending, largest descending
+    return max(keys) if descending else min(keys)
+
+
+def _sort_documents(docs: List[Dict[str, Any]], sort: List[Tuple[str, Any]], score_of=None) -> List[Dict[str, Any]]:
+    docs = list(docs)
+    # Stable sorts from the last key to the first give a multi-key, mixed-direction order
+    for field, direction in reversed(sort):
+        if isinstance(direction, dict):
+            if direction.get("$meta") != "textScore":
+                raise OperationFailure(f"Illegal $meta sort: {direction}", 17312)
+            docs.sort(key=lambda doc: score_of(doc) if score_of else doc.get(_SCORE_FIELD, 0), reverse=True)
+            continue
+        descending = direction in (-1, "descending", "desc")
+        docs.sort(key=lambda doc: _sort_value(doc, field, descending), reverse=descending)
+    return docs
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply an inclusion or exclusion projection, evaluating expression fields.
+    The result may share subdocuments with `doc`.
+    """
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    id_spec = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    excluded = [key for key, value in fields.items() if value is False or (_is_number(value) and value == 0)]
+
+    if excluded:
+        if len(excluded) != len(fields):
+            raise OperationFailure("Cannot do exclusion in inclusion projection", 31254)
+        result = dict(doc)
+        for path in excluded:
+            _exclude_path(result, path.split("."))
+        if id_spec in (0, False):
+            result.pop("_id", None)
+        return result
+
+    result = {}
+    if id_spec in (0, False):
+        pass
+    elif id_spec is True or _is_number(id_spec):
+        if "_id" in doc:
+            result["_id"] = doc["_id"]
+    else:
+        result["_id"] = _evaluate(id_spec, doc)
+
+    for path, spec in fields.items():
+        if spec is True or _is_number(spec):
+            _include_path(doc, result, path.split("."))
+        else:
+            value = _evaluate(spec, doc)
+            if value is not _MISSING:
+                _assign(result, path, value)
+
+    if _SCORE_FIELD in doc:
+        result[_SCORE_FIELD] = doc[_SCORE_FIELD]
+    return result
+
+
+def _output(doc: Dict[str, Any]) -> Dict[str, Any]:
+    result = _copy(doc)
+    result.pop(_SCORE_FIELD, None)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+# ---------------------------------------------------------------------------
+
+def _expression_path(value: Any, path: str) -> Any:
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [item[part] for item in value if isinstance(item, dict) and part in item]
+        else:
+            return _MISSING
+    return value
+
+
+def _evaluate(expression: Any, doc: Dict[str, Any]) -> Any:
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            name, _, path = expression[2:].partition(".")
+            variables = {"ROOT": doc, "CURRENT": doc, "NOW": datetime.utcnow()}
+            if name not in variables:
+                raise OperationFailure(f"Use of undefined variable: {name}", 17276)
+            value = variables[name]
+            return _expression_path(value, path) if path else value
+        if expression.startswith("$"):
+            return _expression_path(doc, expression[1:])
+        return expression
+    if isinstance(expression, list):
+        return [_value(_evaluate(item, doc)) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, argument = next(iter(expression.items()))
+            if operator.startswith("$"):
+                handler = _EXPRESSION_OPERATORS.get(operator)
+                if handler is None:
+                    raise OperationFailure(f"Unrecognized expression '{operator}'", 168)
+                return handler(argument, doc)
+        result = {}
+        for key, item in expression.items():
+            value = _evaluate(item, doc)
+            if value is not _MISSING:
+                result[key] = value
+        return result
+    return expression
+
+
+def _value(value: Any) -> Any:
+    return None if value is _MISSING else value
+
+
+def _arguments(argument: Any, doc: Dict[str, Any]) -> List[Any]:
+    if isinstance(argument, list):
+        return [_value(_evaluate(item, doc)) for item in argument]
+    return [_value(_evaluate(argument, doc))]
+
+
+def _numeric_arguments(argument: Any, doc: Dict[str, Any]) -> List[Any]:
+    # $sum/$avg/$min/$max take either several arguments or one array
+    values = _arguments(argument, doc)
+    if len(values) == 1 and isinstance(values[0], list):
+        values = values[0]
+    return values
+
+
+def _op_meta(argument, doc):
+    if argument != "textScore":
+        raise OperationFailure(f"Unsupported $meta field: {argument}", 17308)
+    if _SCORE_FIELD not in doc:
+        raise OperationFailure("query requires text score metadata, but it is not available", 40218)
+    return doc[_SCORE_FIELD]
+
+
+def _op_regex_match(argument, doc):
+    value = _value(_evaluate(argument["input"], doc))
+    if value is None:
+        return False
+    if not isinstance(value, str):
+        raise OperationFailure("$regexMatch needs 'input' to be of type string", 51104)
+    regex = argument["regex"]
+    pattern = regex if isinstance(regex, re.Pattern) else _compile_regex(regex, argument.get("options", ""))
+    return pattern.search(value) is not None
+
+
+def _op_cond(argument, doc):
+    if isinstance(argument, dict):
+        condition, then, otherwise = argument["if"], argument["then"], argument["else"]
+    else:
+        condition, then, otherwise = argument
+    return _value(_evaluate(then if _truthy(_evaluate(condition, doc)) else otherwise, doc))
+
+
+def _op_if_null(argument, doc):
+    values = _arguments(argument, doc)
+    for value in values[:-1]:
+        if value is not None:
+            return value
+    return values[-1]
+
+
+def _op_add(argument, doc):
+    values = _arguments(argument, doc)
+    if any(value is None for value in values):
+        return None
+    dates = [value for value in values if isinstance(value, datetime)]
+    total = sum(value for value in values if not isinstance(value, datetime))
+    if dates:
+        return dates[0] + timedelta(milliseconds=total)
+    return total
+
+
+def _op_subtract(argument, doc):
+    left, right = _arguments(argument, doc)
+    if left is None or right is None:
+        return None
+    if isinstance(left, datetime) and isinstance(right, datetime):
+        return int((_naive_utc(left) - _naive_utc(right)).total_seconds() * 1000)
+    if isinstance(left, datetime):
+        return left - timedelta(milliseconds=right)
+    return left - right
+
+
+def _op_multiply(argument, doc):
+    values = _arguments(argument, doc)
+    if any(value is None for value in values):
+        return None
+    return math.prod(values)
+
+
+def _op_divide(argument, doc):
+    left, right = _arguments(argument, doc)
+    if left is None or right is None:
+        return None
+    if right == 0:
+        raise OperationFailure("can't $divide by zero", 2)
+    return left / right
+
+
+def _op_round(argument, doc, rounding=round):
+    values = _arguments(argument, doc)
+    value, places = values[0], (values[1] if len(values) > 1 else 0)
+    if value is None:
+        return None
+    if rounding is round:
+        return round(value, places) if places else int(round(value))
+    factor = 10 ** places
+    return math.trunc(value * factor) / factor if places else math.trunc(value)
+
+
+def _comparison(test):
+    def handler(argument, doc):
+        left, right = _arguments(argument, doc)
+        return test(_sort_key(left), _sort_key(right))
+    return handler
+
+
+def _op_min_max(pick):
+    def handler(argument, doc):
+        values = [v for v in _numeric_arguments(argument, doc) if v is not None]
+        return pick(values, key=_sort_key) if values else None
+    return handler
+
+
+def _op_sum(argument, doc):
+    return sum(v for v in _numeric_arguments(argument, doc) if _is_number(v))
+
+
+def _op_avg(argument, doc):
+    values = [v for v in _numeric_arguments(argument, doc) if _is_number(v)]
+    return sum(values) / len(values) if values else None
+
+
+def _op_concat(argument, doc):
+    values = _arguments(argument, doc)
+    if any(value is None for value in values):
+        return None
+    return "".join(values)
+
+
+def _op_size(argument, doc):
+    value = _arguments(argument, doc)[0]
+    if not isinstance(value, list):
+        raise OperationFailure("The argument to $size must be an array", 17124)
+    return len(value)
+
+
+def _op_in(argument, doc):
+    value, array = _arguments(argument, doc)
+    if not isinstance(array, list):
+        raise OperationFailure("$in requires an array as a second argument", 40081)
+    key = _sort_key(value)
+    return any(_sort_key(item) == key for item in array)
+
+
+def _op_array_elem_at(argument, doc):
+    array, index = _arguments(argument, doc)
+    if not isinstance(array, list):
+        return None
+    try:
+        return array[index]
+    except IndexError:
+        return _MISSING
+
+
+def _op_to_string(argument, doc):
+    value = _arguments(argument, doc)[0]
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return _op_date_to_string({"date": value}, doc)
+    return str(value)
+
+
+def _op_date_to_string(argument, doc):
+    date = _value(_evaluate(argument["date"], doc))
+    if date is None:
+        return _value(_evaluate(argument.get("onNull"), doc)) if "onNull" in argument else None
+    date = _naive_utc(date)
+    fmt = argument.get("format", "%Y-%m-%dT%H:%M:%S.%LZ")
+    return date.strftime(fmt.replace("%L", f"{date.microsecond // 1000:03d}"))
+
+
+def _date_part(attribute):
+    def handler(argument, doc):
+        date = _arguments(argument if not isinstance(argument, dict) else argument["date"], doc)[0]
+        return None if date is None else getattr(_naive_utc(date), attribute)
+    return handler
+
+
+def _string_op(transform):
+    def handler(argument, doc):
+        value = _arguments(argument, doc)[0]
+        return "" if value is None else transform(str(value))
+    return handler
+
+
+_EXPRESSION_OPERATORS: Dict[str, Callable[[Any, Dict[str, Any]], Any]] = {
+    "$meta": _op_meta,
+    "$literal": lambda argument, doc: argument,
+    "$regexMatch": _op_regex_match,
+    "$cond": _op_cond,
+    "$ifNull": _op_if_null,
+    "$toLower": _string_op(str.lower),
+    "$toUpper": _string_op(str.upper),
+    "$toString": _op_to_string,
+    "$strLenCP": lambda argument, doc: len(_arguments(argument, doc)[0]),
+    "$concat": _op_concat,
+    "$add": _op_add,
+    "$subtract": _op_subtract,
+    "$multiply": _op_multiply,
+    "$divide": _op_divide,
+    "$mod": lambda argument, doc: _arguments(argument, doc)[0] % _arguments(argument, doc)[1],
+    "$abs": lambda argument, doc: abs(_arguments(argument, doc)[0]),
+    "$floor": lambda argument, doc: math.floor(_arguments(argument, doc)[0]),
+    "$ceil": lambda argument, doc: math.ceil(_arguments(argument, doc)[0]),
+    "$round": _op_round,
+    "$trunc": lambda argument, doc: _op_round(argument, doc, rounding=math.trunc),
+    "$eq": _comparison(lambda a, b: a == b),
+    "$ne": _comparison(lambda a, b: a != b),
+    "$gt": _comparison(lambda a, b: a > b),
+    "$gte": _comparison(lambda a, b: a >= b),
+    "$lt": _comparison(lambda a, b: a < b),
+    "$lte": _comparison(lambda a, b: a <= b),
+    "$cmp": _comparison(lambda a, b: (a > b) - (a < b)),
+    "$and": lambda argument, doc: all(_truthy(_evaluate(item, doc)) for item in argument),
+    "$or": lambda argument, doc: any(_truthy(_evaluate(item, doc)) for item in argument),
+    "$not": lambda argument, doc: not _truthy(_arguments(argument, doc)[0]),
+    "$in": _op_in,
+    "$size": _op_size,
+    "$arrayElemAt": _op_array_elem_at,
+    "$sum": _op_sum,
+    "$avg": _op_avg,
+    "$min": _op_min_max(min),
+    "$max": _op_min_max(max),
+    "$dateToString": _op_date_to_string,
+    "$year": _date_part("year"),
+    "$month": _date_part("month"),
+    "$dayOfMonth": _date_part("day"),
+    "$hour": _date_part("hour"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Aggregation pipeline
+# ---------------------------------------------------------------------------
+
+def _percentiles(values: List[Any], percentiles: List[float]) -> List[Optional[float]]:
+    # Nearest-rank percentiles; MongoDB's "approximate" method may differ slightly
+    numbers = sorted(v for v in values if _is_number(v))
+    if not numbers:
+        return [None for _ in percentiles]
+    return [numbers[max(math.ceil(p * len(numbers)) - 1, 0)] for p in percentiles]
+
+
+def _accumulate(spec: Dict[str, Any], docs: List[Dict[str, Any]]) -> Any:
+    operator, argument = next(iter(spec.items()))
+    if operator == "$count":
+        return len(docs)
+    if operator in ("$percentile", "$median"):
+        values = [_value(_evaluate(argument["input"], doc)) for doc in docs]
+        if operator == "$median":
+            return _percentiles(values, [0.5])[0]
+        return _percentiles(values, argument["p"])
+
+    values = [_evaluate(argument, doc) for doc in docs]
+    present = [value for value in values if value is not _MISSING]
+    if operator == "$sum":
+        return sum(value for value in present if _is_number(value))
+    if operator == "$avg":
+        numbers = [value for value in present if _is_number(value)]
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ("$min", "$max"):
+        non_null = [value for value in present if value is not None]
+        if not non_null:
+            return None
+        return (min if operator == "$min" else max)(non_null, key=_sort_key)
+    if operator == "$first":
+        return _value(values[0]) if values else None
+    if operator == "$last":
+        return _value(values[-1]) if values else None
+    if operator == "$push":
+        return present
+    if operator == "$addToSet":
+        unique = {}
+        for value in present:
+            unique.setdefault(_sort_key(value), value)
+        return list(unique.values())
+    raise OperationFailure(f"unknown group operator '{operator}'", 15952)
+
+
+def _group(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "_id" not in spec:
+        raise OperationFailure("a group specification must include an _id", 15955)
+    groups: Dict[Tuple, Tuple[Any, List[Dict[str, Any]]]] = {}
+    for doc in docs:
+        group_id = _value(_evaluate(spec["_id"], doc))
+        groups.setdefault(_sort_key(group_id), (group_id, []))[1].append(doc)
+
+    results = []
+    for group_id, members in groups.values():
+        result = {"_id": group_id}
+        for field, accumulator in spec.items():
+            if field != "_id":
+                result[field] = _accumulate(accumulator, members)
+        results.append(result)
+    return results
+
+
+def _unwind(docs: List[Dict[str, Any]], spec: Any) -> List[Dict[str, Any]]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    index_field = spec.get("includeArrayIndex")
+
+    results = []
+    for doc in docs:
+        value = _get_path(doc, path)
+        if isinstance(value, list) and value:
+            for index, item in enumerate(value):
+                unwound = dict(doc)
+                _assign(unwound, path, item)
+                if index_field:
+                    unwound[index_field] = index
+                results.append(unwound)
+        elif isinstance(value, list) or value is _MISSING or value is None:
+            if keep_empty:
+                unwound = dict(doc)
+                if isinstance(value, list):
+                    _exclude_path(unwound, path.split("."))
+                if index_field:
+                    unwound[index_field] = None
+                results.append(unwound)
+        else:
+            unwound = dict(doc)
+            if index_field:
+                unwound[index_field] = None
+            results.append(unwound)
+    return results
+
+
+def _add_fields(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(doc)
+    for path, expression in spec.items():
+        value = _evaluate(expression, doc)
+        if value is not _MISSING:
+            _assign(result, path, value)
+    return result
+
+
+def run_pipeline(docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Run aggregation stages over documents. Stages never mutate their input
+    documents; they copy what they change.
+    """
+    for stage in pipeline:
+        if len(stage) != 1:
+            raise OperationFailure("A pipeline stage specification object must contain exactly one field.", 40323)
+        name, spec = next(iter(stage.items()))
+
+        if name == "$match":
+            if "$text" in spec:
+                raise OperationFailure("$match with $text is only allowed as the first pipeline stage", 17313)
+            docs = [doc for doc in docs if match_document(doc, spec)]
+        elif name in ("$addFields", "$set"):
+            docs = [_add_fields(doc, spec) for doc in docs]
+        elif name == "$project":
+            docs = [_project(doc, spec) for doc in docs]
+        elif name == "$unset":
+            fields = [spec] if isinstance(spec, str) else spec
+            docs = [_project(doc, {field: 0 for field in fields}) for doc in docs]
+        elif name == "$group":
+            docs = _group(docs, spec)
+        elif name == "$sort":
+            docs = _sort_documents(docs, _normalize_sort(spec))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == "$unwind":
+            docs = _unwind(docs, spec)
+        elif name == "$facet":
+            docs = [{field: [_output(doc) for doc in run_pipeline(list(docs), stages)]
+                     for field, stages in spec.items()}]
+        elif name == "$replaceRoot":
+            docs = [_evaluate(spec["newRoot"], doc) for doc in docs]
+        else:
+            raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'", 40324)
+    return docs
+
+
+# ---------------------------------------------------------------------------
+# Indexes
+# ---------------------------------------------------------------------------
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+def _regex_prefix(pattern: str) -> Optional[str]:
+    """Literal prefix of an anchored regex, or None if it has none"""
+    if not pattern.startswith("^"):
+        return None
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in _REGEX_META:
+            # A quantifier makes the preceding character optional
+            if char in "*?{" and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+        i += 1
+    return "".join(prefix) or None
+
+
+class _Index:
+    """
+    Secondary index on the first field of an index key pattern: a hash map
+    from value to document keys for equality, plus a sorted list of values
+    for ranges and prefixes. Unique indexes also enforce the full key.
+    """
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool, info: Dict[str, Any]):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.info = info
+        self.entries: Dict[Tuple, set] = {}
+        self.unique_entries: Dict[Tuple, Tuple] = {}
+        self._sorted: Optional[List[Tuple]] = None
+
+    def _value_keys(self, doc: Dict[str, Any]) -> set:
+        values = _get_values(doc, self.field)
+        if not values:
+            return {_sort_key(None)}
+        keys = set()
+        for value in values:
+            if isinstance(value, list):
+                keys.update(_sort_key(item) for item in value)
+                if not value:
+                    keys.add(_sort_key(value))
+            else:
+                keys.add(_sort_key(value))
+        return keys
+
+    def _unique_key(self, doc: Dict[str, Any]) -> Tuple:
+        key = []
+        for field, _ in self.keys:
+            value = _get_path(doc, field)
+            key.append(_sort_key(None if value is _MISSING else value))
+        return tuple(key)
+
+    def conflict(self, doc_key: Tuple, doc: Dict[str, Any]) -> bool:
+        if not self.unique:
+            return False
+        owner = self.unique_entries.get(self._unique_key(doc))
+        return owner is not None and owner != doc_key
+
+    def add(self, doc_key: Tuple, doc: Dict[str, Any]):
+        for key in self._value_keys(doc):
+            ids = self.entries.get(key)
+            if ids is None:
+                ids = self.entries[key] = set()
+                if self._sorted is not None:
+                    bisect.insort(self._sorted, key)
+            ids.add(doc_key)
+        if self.unique:
+            self.unique_entries[self._unique_key(doc)] = doc_key
+
+    def remove(self, doc_key: Tuple, doc: Dict[str, Any]):
+        for key in self._value_keys(doc):
+            ids = self.entries.get(key)
+            if ids is None:
+                continue
+            ids.discard(doc_key)
+            if not ids:
+                del self.entries[key]
+                if self._sorted is not None:
+                    del self._sorted[bisect.bisect_left(self._sorted, key)]
+        if self.unique:
+            unique_key = self._unique_key(doc)
+            if self.unique_entries.get(unique_key) == doc_key:
+                del self.unique_entries[unique_key]
+
+    def clear(self):
+        self.entries.clear()
+        self.unique_entries.clear()
+        self._sorted = None
+
+    def _lookup(self, key: Tuple) -> List[Tuple]:
+        return sorted(self.entries.get(key, ()))
+
+    def _range(self, low: Tuple, low_inclusive: bool, high: Tuple, high_inclusive: bool) -> List[Tuple]:
+        if self._sorted is None:
+            self._sorted = sorted(self.entries)
+        start = (bisect.bisect_left if low_inclusive else bisect.bisect_right)(self._sorted, low)
+        end = (bisect.bisect_right if high_inclusive else bisect.bisect_left)(self._sorted, high)
+        doc_keys = []
+        seen = set()
+        for key in self._sorted[start:end]:
+            for doc_key in sorted(self.entries[key]):
+                if doc_key not in seen:
+                    seen.add(doc_key)
+                    doc_keys.append(doc_key)
+        return doc_keys
+
+    def candidates(self, condition: Any) -> Optional[List[Tuple]]:
+        """
+        Keys of the documents that may satisfy a condition on the indexed
+        field (a superset of the matches), or None if the index can't help
+        """
+        if isinstance(condition, re.Pattern):
+            prefix = _regex_prefix(condition.pattern) if not condition.flags & (re.I | re.M | re.X) else None
+            return None if prefix is None else self._range((3, prefix), True, (3, prefix + "\U0010ffff"), False)
+        if isinstance(condition, list):
+            return None
+        if not _is_operator_dict(condition):
+            return self._lookup(_sort_key(condition))
+
+        if "$eq" in condition and not isinstance(condition["$eq"], list):
+            return self._lookup(_sort_key(condition["$eq"]))
+        if "$in" in condition:
+            doc_keys, seen = [], set()
+            for target in condition["$in"]:
+                found = self.candidates(target)
+                if found is None:
+                    return None
+                for doc_key in found:
+                    if doc_key not in seen:
+                        seen.add(doc_key)
+                        doc_keys.append(doc_key)
+            return doc_keys
+        if "$regex" in condition:
+            regex = condition["$regex"]
+            if isinstance(regex, re.Pattern):
+                return self.candidates(regex)
+            if set(condition.get("$options", "")) & set("imx"):
+                return None
+            prefix = _regex_prefix(regex)
+            return None if prefix is None else self._range((3, prefix), True, (3, prefix + "\U0010ffff"), False)
+
+        bounds = [op for op in ("$gt", "$gte", "$lt", "$lte") if op in condition]
+        if not bounds:
+            return None
+        rank = _sort_key(condition[bounds[0]])[0]
+        low, low_inclusive, high, high_inclusive = (rank,), True, (rank + 1,), False
+        for op in bounds:
+            key = _sort_key(condition[op])
+            if op in ("$gt", "$gte"):
+                low, low_inclusive = key, op == "$gte"
+            else:
+                high, high_inclusive = key, op == "$lte"
+        return self._range(low, low_inclusive, high, high_inclusive)
+
+
+_STOP_WORDS = frozenset(
+    "a about an and are as at be been but by for from has have he her his how i if in into is it its "
+    "of on or our she so than that the their them then there these they this to was we were what "
+    "when which who will with you your".split()
+)
+_TEXT_WORD = re.compile(r"\w+")
+
+
+def _stem(word: str) -> str:
+    # A light approximation of the Snowball English stemmer MongoDB uses
+    if len(word) > 3:
+        if word.endswith("sses"):
+            word = word[:-2]
+        elif word.endswith("ies"):
+            word = word[:-2]
+        elif word.endswith("s") and not word.endswith(("ss", "us")):
+            word = word[:-1]
+    if len(word) > 4:
+        for suffix in ("ing", "ed"):
+            if word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def _text_terms(text: str) -> List[str]:
+    return [_stem(word) for word in _TEXT_WORD.findall(text.lower()) if word not in _STOP_WORDS]
+
+
+class _TextIndex:
+    """
+    Weighted inverted index: stemmed term -> {document key: score}.
+    A term's score in a field is weight * (0.5 + 0.5 * frequency / field length).
+    """
+
+    def __init__(self, name: str, weights: Dict[str, int], info: Dict[str, Any]):
+        self.name = name
+        self.weights = weights
+        self.info = info
+        self.keys = [(field, "text") for field in weights]
+        self.unique = False
+        self.postings: Dict[str, Dict[Tuple, float]] = {}
+        self.doc_terms: Dict[Tuple, Tuple[str, ...]] = {}
+
+    def _texts(self, doc: Dict[str, Any], field: str) -> List[str]:
+        return [value for value in _candidates(_get_values(doc, field)) if isinstance(value, str)]
+
+    def conflict(self, doc_key, doc) -> bool:
+        return False
+
+    def add(self, doc_key: Tuple, doc: Dict[str, Any]):
+        scores: Dict[str, float] = {}
+        for field, weight in self.weights.items():
+            for text in self._texts(doc, field):
+                terms = _text_terms(text)
+                for term, frequency in Counter(terms).items():
+                    scores[term] = scores.get(term, 0.0) + weight * (0.5 + 0.5 * frequency / len(terms))
+        for term, score in scores.items():
+            self.postings.setdefault(term, {})[doc_key] = score
+        self.doc_terms[doc_key] = tuple(scores)
+
+    def remove(self, doc_key: Tuple, doc: Dict[str, Any]):
+        for term in self.doc_terms.pop(doc_key, ()):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_key, None)
+                if not posting:
+                    del self.postings[term]
+
+    def clear(self):
+        self.postings.clear()
+        self.doc_terms.clear()
+
+    def search(self, query: str, docs: Dict[Tuple, Dict[str, Any]]) -> Dict[Tuple, float]:
+        """
+        Score documents for a $search string: any term matches, "quoted
+        phrases" are required and -negated terms exclude
+        """
+        phrases = [phrase.lower().strip() for phrase in re.findall(r'"([^"]*)"', query)]
+        positive, negative = [], []
+        for word in re.sub(r'"[^"]*"', " ", query).split():
+            if word.startswith("-"):
+                negative.extend(_text_terms(word[1:]))
+            else:
+                positive.extend(_text_terms(word))
+        for phrase in phrases:
+            positive.extend(_text_terms(phrase))
+
+        scores: Dict[Tuple, float] = {}
+        for term in set(positive):
+            for doc_key, score in self.postings.get(term, {}).items():
+                scores[doc_key] = scores.get(doc_key, 0.0) + score
+        for term in negative:
+            for doc_key in self.postings.get(term, ()):
+                scores.pop(doc_key, None)
+        for phrase in filter(None, phrases):
+            scores = {
+                doc_key: score for doc_key, score in scores.items()
+                if any(phrase in text.lower() for field in self.weights for text in self._texts(docs[doc_key], field))
+            }
+        return scores
+
+
+# ---------------------------------------------------------------------------
+# Updates
+# ---------------------------------------------------------------------------
+
+def _validate_update(update: Any):
+    if isinstance(update, list):
+        raise OperationFailure("Aggregation pipeline updates are not supported by the in-memory engine", 2)
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> bool:
+    """Apply update operators to a stored copy. Returns whether anything changed."""
+    changed = False
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            if operator in ("$set", "$setOnInsert"):
+                changed |= _set_path(doc, path, _to_stored(value))
+            elif operator == "$unset":
+                changed |= _unset_path(doc, path)
+            elif operator == "$inc":
+                current = _get_path(doc, path)
+                if current is _MISSING or current is None:
+                    changed |= _set_path(doc, path, value)
+                elif not _is_number(current):
+                    raise OperationFailure(f"Cannot apply $inc to a value of non-numeric type. "
+                                           f"{{_id: {doc.get('_id')!r}}} has the field '{path}' of non-numeric type", 14)
+                else:
+                    changed |= _set_path(doc, path, current + value) or value != 0
+            elif operator in ("$min", "$max"):
+                current = _get_path(doc, path)
+                replace = current is _MISSING or (
+                    _sort_key(value) < _sort_key(current) if operator == "$min" else _sort_key(value) > _sort_key(current)
+                )
+                if replace:
+                    changed |= _set_path(doc, path, _to_stored(value))
+            elif operator == "$currentDate":
+                changed |= _set_path(doc, path, _to_stored(datetime.now(timezone.utc)))
+            elif operator in ("$push", "$addToSet"):
+                current = _get_path(doc, path)
+                if current is _MISSING:
+                    current = []
+                    _set_path(doc, path, current)
+                elif not isinstance(current, list):
+                    raise OperationFailure(f"The field '{path}' must be an array", 2)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in items:
+                    item = _to_stored(item)
+                    if operator == "$push" or all(_sort_key(existing) != _sort_key(item) for existing in current):
+                        current.append(item)
+                        changed = True
+            elif operator == "$pull":
+                current = _get_path(doc, path)
+                if isinstance(current, list):
+                    if _is_operator_dict(value):
+                        kept = [item for item in current
+                                if not all(_match_operator(op, arg, [item], value, doc) for op, arg in value.items())]
+                    elif isinstance(value, dict):
+                        # A document condition matches subdocuments like a query
+                        kept = [item for item in current
+                                if not (isinstance(item, dict) and match_document(item, value))]
+                    else:
+                        kept = [item for item in current if _sort_key(item) != _sort_key(value)]
+                    if len(kept) != len(current):
+                        current[:] = kept
+                        changed = True
+            elif operator == "$rename":
+                current = _get_path(doc, path)
+                if current is not _MISSING:
+                    _unset_path(doc, path)
+                    _set_path(doc, value, current)
+                    changed = True
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}", 9)
+    return changed
+
+
+def _upsert_seed(query_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """The document an upsert starts from: the filter's equality conditions"""
+    doc = {}
+    for key, value in query_filter.items():
+        if key == "$and":
+            for sub in value:
+                for path, item in _upsert_seed(sub).items():
+                    _set_path(doc, path, item)
+        elif key.startswith("$") or isinstance(value, re.Pattern):
+            continue
+        elif _is_operator_dict(value):
+            if "$eq" in value:
+                _set_path(doc, key, _to_stored(value["$eq"]))
+        else:
+            _set_path(doc, key, _to_stored(value))
+    return doc
+
+
+# ---------------------------------------------------------------------------
+# Client, database, collection and cursor
+# ---------------------------------------------------------------------------
+
+class MemoryCursor:
+    """Lazy query cursor with pymongo's chaining API"""
+
+    def __init__(self, collection: "MemoryCollection", query_filter: Dict[str, Any],
+                 projection: Any = None, skip: int = 0, limit: int = 0, sort: Any = None):
+        self._collection = collection
+        self._filter = query_filter
+        self._projection = projection
+        self._skip = skip
+        self._limit = limit
+        self._sort = _normalize_sort(sort) if sort else None
+        self._batch_size = 0
+        self._results: Optional[Iterator[Dict[str, Any]]] = None
+
+    def _check_unused(self):
+        if self._results is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def sort(self, key_or_list: Any, direction: Any = None) -> "MemoryCursor":
+        self._check_unused()
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> "MemoryCursor":
+        self._check_unused()
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._check_unused()
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> "MemoryCursor":
+        # Results are already in memory; accepted for API compatibility
+        self._check_unused()
+        self._batch_size = batch_size
+        return self
+
+    def hint(self, index: Any) -> "MemoryCursor":
+        return self
+
+    def max_time_ms(self, max_time_ms: int) -> "MemoryCursor":
+        return self
+
+    def clone(self) -> "MemoryCursor":
+        return MemoryCursor(self._collection, self._filter, self._projection, self._skip, self._limit, self._sort)
+
+    def rewind(self) -> "MemoryCursor":
+        self._results = None
+        return self
+
+    def close(self):
+        self._results = iter(())
+
+    @property
+    def alive(self) -> bool:
+        return self._results is None or self._results.__length_hint__() > 0
+
+    def explain(self) -> Dict[str, Any]:
+        docs, plan, examined = self._collection._find(
+            self._filter, self._projection, self._sort, self._skip, self._limit
+        )
+        return {
+            "queryPlanner": {
+                "namespace": self._collection.full_name,
+                "parsedQuery": self._filter,
+                "winningPlan": plan,
+            },
+            "executionStats": {"nReturned": len(docs), "totalDocsExamined": examined},
+            "ok": 1.0,
+        }
+
+    def __iter__(self) -> "MemoryCursor":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._results is None:
+            docs, _, _ = self._collection._find(self._filter, self._projection, self._sort, self._skip, self._limit)
+            self._results = iter(docs)
+        return next(self._results)
+
+    next = __next__
+
+    def __enter__(self) -> "MemoryCursor":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MemoryCollection:
+    """A collection stored as an insertion-ordered dict of documents by _id"""
+
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._docs: Dict[Tuple, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def with_options(self, **kwargs) -> "MemoryCollection":
+        return self
+
+    # -- storage -----------------------------------------------------------
+
+    def _duplicate_key_error(self, index_name: str, keys: List[Tuple[str, Any]], doc: Dict[str, Any]) -> DuplicateKeyError:
+        key_value = {field: _value(_get_path(doc, field)) for field, _ in keys}
+        message = f"E11000 duplicate key error collection: {self.full_name} index: {index_name} dup key: {key_value}"
+        details = {"code": 11000, "errmsg": message, "keyPattern": dict(keys), "keyValue": key_value}
+        return DuplicateKeyError(message, 11000, details)
+
+    def _insert(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        # Caller holds the lock; `doc` is already a stored copy with an _id
+        doc_key = _sort_key(doc["_id"])
+        if doc_key in self._docs:
+            raise self._duplicate_key_error("_id_", [("_id", 1)], doc)
+        for index in self._indexes.values():
+            if index.conflict(doc_key, doc):
+                raise self._duplicate_key_error(index.name, index.keys, doc)
+        self._docs[doc_key] = doc
+        for index in self._indexes.values():
+            index.add(doc_key, doc)
+        return doc
+
+    def _replace(self, old: Dict[str, Any], new: Dict[str, Any]):
+        doc_key = _sort_key(old["_id"])
+        if _sort_key(new.get("_id")) != doc_key:
+            raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+        for index in self._indexes.values():
+            if index.conflict(doc_key, new):
+                raise self._duplicate_key_error(index.name, index.keys, new)
+        for index in self._indexes.values():
+            index.remove(doc_key, old)
+            index.add(doc_key, new)
+        self._docs[doc_key] = new
+
+    def _remove(self, doc: Dict[str, Any]):
+        doc_key = _sort_key(doc["_id"])
+        del self._docs[doc_key]
+        for index in self._indexes.values():
+            index.remove(doc_key, doc)
+
+    # -- query planning ----------------------------------------------------
+
+    def _text_index(self) -> Optional[_TextIndex]:
+        for index in self._indexes.values():
+            if isinstance(index, _TextIndex):
+                return index
+        return None
+
+    def _index_scan(self, query_filter: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], List[Tuple]]]:
+        """Pick the most selective index for a filter: (plan, candidate keys) or None"""
+        best = None
+        for field, condition in query_filter.items():
+            if field.startswith("$"):
+                continue
+            if field == "_id":
+                if not _is_operator_dict(condition) and not isinstance(condition, re.Pattern):
+                    doc_key = _sort_key(condition)
+                    return {"stage": "IDHACK"}, [doc_key] if doc_key in self._docs else []
+                if _is_operator_dict(condition) and "$in" in condition and not any(
+                    isinstance(value, re.Pattern) for value in condition["$in"]
+                ):
+                    doc_keys = list(dict.fromkeys(_sort_key(value) for value in condition["$in"]))
+                    plan = {"stage": "IXSCAN", "indexName": "_id_", "keyPattern": {"_id": 1}}
+                    return {"stage": "FETCH", "inputStage": plan}, [k for k in doc_keys if k in self._docs]
+            for index in self._indexes.values():
+                if not isinstance(index, _Index) or index.field != field:
+                    continue
+                found = index.candidates(condition)
+                if found is not None and (best is None or len(found) < len(best[1])):
+                    plan = {"stage": "IXSCAN", "indexName": index.name, "keyPattern": dict(index.keys)}
+                    best = ({"stage": "FETCH", "inputStage": plan}, found)
+        if best is not None:
+            return best
+
+        if query_filter.get("$and"):
+            scans = [scan for scan in map(self._index_scan, query_filter["$and"]) if scan is not None]
+            if scans:
+                return min(scans, key=lambda scan: len(scan[1]))
+
+        if query_filter.get("$or"):
+            scans = [self._index_scan(branch) for branch in query_filter["$or"]]
+            if all(scan is not None for scan in scans):
+                doc_keys, seen = [], set()
+                for _, found in scans:
+                    for doc_key in found:
+                        if doc_key not in seen:
+                            seen.add(doc_key)
+                            doc_keys.append(doc_key)
+                plan = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [scan[0] for scan in scans]}}
+                return plan, doc_keys
+        return None
+
+    def _select(self, query_filter: Optional[Dict[str, Any]], sort=None, stop_after: Optional[int] = None):
+        """
+        Plan and run a filter. Returns (plan, matching documents, text scores
+        by document key or None, documents examined). Caller holds the lock.
+        """
+        query_filter = query_filter or {}
+        if not isinstance(query_filter, dict):
+            query_filter = {"_id": query_filter}
+
+        scores = None
+        doc_keys = None
+        if "$text" in query_filter:
+            index = self._text_index()
+            if index is None:
+                raise OperationFailure("text index required for $text query", 27)
+            scores = index.search(query_filter["$text"].get("$search", ""), self._docs)
+            doc_keys = sorted(scores)
+            plan = {"stage": "TEXT_MATCH", "inputStage": {"stage": "TEXT", "indexName": index.name}}
+        else:
+            scan = self._index_scan(query_filter)
+            if scan is not None:
+                plan, doc_keys = scan
+            elif sort and any(
+                isinstance(index, _Index) and index.field == sort[0][0] for index in self._indexes.values()
+            ):
+                # No usable predicate, but an index provides the sort order
+                index = next(i for i in self._indexes.values() if isinstance(i, _Index) and i.field == sort[0][0])
+                plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": index.name,
+                                                         "keyPattern": dict(index.keys)}}
+            elif sort and sort[0][0] == "_id":
+                plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "_id_", "keyPattern": {"_id": 1}}}
+            else:
+                plan = {"stage": "COLLSCAN"}
+
+        docs = self._docs.values() if doc_keys is None else (self._docs[k] for k in doc_keys if k in self._docs)
+        matched, examined = [], 0
+        for doc in docs:
+            examined += 1
+            if match_document(doc, query_filter, scores):
+                matched.append(doc)
+                if stop_after is not None and len(matched) >= stop_after:
+                    break
+        return plan, matched, scores, examined
+
+    def _find(self, query_filter, projection, sort, skip, limit):
+        limit = abs(limit or 0)
+        with self._lock:
+            stop_after = skip + limit if limit and not sort else None
+            plan, docs, scores, examined = self._select(query_filter, sort, stop_after)
+            score_of = None
+            if scores is not None:
+                score_of = lambda doc: scores.get(_sort_key(doc["_id"]), 0.0)
+            if sort:
+                docs = _sort_documents(docs, sort, score_of)
+            if skip:
+                docs = docs[skip:]
+            if limit:
+                docs = docs[:limit]
+            results = []
+            for doc in docs:
+                if score_of is not None:
+                    doc = {**doc, _SCORE_FIELD: score_of(doc)}
+                results.append(_output(_project(doc, projection)))
+            return results, plan, examined
+
+    # -- reads -------------------------------------------------------------
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Any = None, skip: int = 0,
+             limit: int = 0, sort: Any = None, batch_size: int = 0, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter or {}, projection, skip, limit, sort)
+
+    def find_one(self, filter: Any = None, projection: Any = None, *args, sort: Any = None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return next(iter(MemoryCursor(self, filter or {}, projection, limit=1, sort=sort)), None)
+
+    def count_documents(self, filter: Dict[str, Any], skip: int = 0, limit: int = 0, **kwargs) -> int:
+        with self._lock:
+            count = len(self._select(filter)[1]) - skip
+        count = max(count, 0)
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        with self._lock:
+            docs = self._select(filter)[1]
+            values = {}
+            for doc in docs:
+                for value in _get_values(doc, key):
+                    for item in (value if isinstance(value, list) else [value]):
+                        values.setdefault(_sort_key(item), item)
+        return [_copy(values[k]) for k in sorted(values)]
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        pipeline = list(pipeline)
+        with self._lock:
+            if pipeline and "$match" in pipeline[0]:
+                # The leading $match is planned against the indexes (and may use $text)
+                _, docs, scores, _ = self._select(pipeline.pop(0)["$match"])
+                if scores is not None:
+                    docs = [{**doc, _SCORE_FIELD: scores[_sort_key(doc["_id"])]} for doc in docs]
+            else:
+                docs = list(self._docs.values())
+            docs = run_pipeline(docs, pipeline)
+            return iter([_output(doc) for doc in docs])
+
+    # -- writes ------------------------------------------------------------
+
+    def _prepare_insert(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        # Like pymongo, assign a missing _id on the caller's document
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        return _to_stored(document)
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        stored = self._prepare_insert(document)
+        with self._lock:
+            self._insert(stored)
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        if not documents:
+            raise TypeError("documents must be a non-empty list")
+        self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([document["_id"] for document in documents], True)
+
+    def _update(self, query_filter, update, upsert=False, multi=False, sort=None):
+        """Returns (matched, modified, upserted _id, [(before, after)]). Caller holds the lock."""
+        _validate_update(update)
+        docs = self._select(query_filter)[1]
+        if sort:
+            docs = _sort_documents(docs, _normalize_sort(sort))
+        if not multi:
+            docs = docs[:1]
+
+        changes, modified = [], 0
+        for old in docs:
+            new = _copy(old)
+            if _apply_update(new, update, inserting=False):
+                self._replace(old, new)
+                modified += 1
+            else:
+                new = old
+            changes.append((old, new))
+
+        upserted_id = None
+        if not docs and upsert:
+            new = _upsert_seed(query_filter)
+            _apply_update(new, update, inserting=True)
+            if "_id" not in new:
+                new = {"_id": ObjectId(), **new}
+            self._insert(new)
+            upserted_id = new["_id"]
+            changes.append((None, new))
+        return len(docs), modified, upserted_id, changes
+
+    def _update_result(self, matched: int, modified: int, upserted_id: Any) -> UpdateResult:
+        raw = {"n": matched + (1 if upserted_id is not None else 0), "nModified": modified,
+               "updatedExisting": matched > 0, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        with self._lock:
+            matched, modified, upserted_id, _ = self._update(filter, update, upsert, sort=kwargs.get("sort"))
+        return self._update_result(matched, modified, upserted_id)
+
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        with self._lock:
+            matched, modified, upserted_id, _ = self._update(filter, update, upsert, multi=True)
+        return self._update_result(matched, modified, upserted_id)
+
+    def _replace_one(self, query_filter, replacement, upsert=False):
+        if any(key.startswith("$") for key in replacement):
+            raise ValueError("replacement can not include $ operators")
+        docs = self._select(query_filter)[1][:1]
+        if docs:
+            old = docs[0]
+            new = _to_stored({"_id": old["_id"], **{k: v for k, v in replacement.items() if k != "_id"}})
+            self._replace(old, new)
+            return 1, 1, None
+        if upsert:
+            new = _to_stored({**_upsert_seed(query_filter), **replacement})
+            if "_id" not in new:
+                new = {"_id": ObjectId(), **new}
+            self._insert(new)
+            return 0, 0, new["_id"]
+        return 0, 0, None
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        with self._lock:
+            return self._update_result(*self._replace_one(filter, replacement, upsert))
+
+    def _delete(self, query_filter, multi: bool, sort=None) -> List[Dict[str, Any]]:
+        docs = self._select(query_filter, stop_after=None if multi or sort else 1)[1]
+        if sort:
+            docs = _sort_documents(docs, _normalize_sort(sort))
+        if not multi:
+            docs = docs[:1]
+        for doc in docs:
+            self._remove(doc)
+        return docs
+
+    def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        with self._lock:
+            return DeleteResult({"n": len(self._delete(filter, multi=False)), "ok": 1.0}, True)
+
+    def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        with self._lock:
+            return DeleteResult({"n": len(self._delete(filter, multi=True)), "ok": 1.0}, True)
+
+    def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any], projection: Any = None,
+                            sort: Any = None, upsert: bool = False,
+                            return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        with self._lock:
+            _, _, _, changes = self._update(filter, update, upsert, sort=sort)
+            if not changes:
+                return None
+            before, after = changes[0]
+            doc = after if return_document == ReturnDocument.AFTER else before
+            return None if doc is None else _output(_project(doc, projection))
+
+    def find_one_and_delete(self, filter: Dict[str, Any], projection: Any = None, sort: Any = None, **kwargs):
+        with self._lock:
+            docs = self._delete(filter, multi=False, sort=sort)
+            return _output(_project(docs[0], projection)) if docs else None
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        """
+        Apply InsertOne/UpdateOne/UpdateMany/ReplaceOne/DeleteOne/DeleteMany
+        operations. pymongo's operation classes keep their arguments in
+        private slots, which are read here.
+        """
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        with self._lock:
+            for position, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(self._prepare_insert(request._doc))
+                        result["nInserted"] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany)):
+                        matched, modified, upserted_id, _ = self._update(
+                            request._filter, request._doc, bool(request._upsert), multi=isinstance(request, UpdateMany)
+                        )
+                        self._count_update(result, position, matched, modified, upserted_id)
+                    elif isinstance(request, ReplaceOne):
+                        matched, modified, upserted_id = self._replace_one(
+                            request._filter, request._doc, bool(request._upsert)
+                        )
+                        self._count_update(result, position, matched, modified, upserted_id)
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        result["nRemoved"] += len(self._delete(request._filter, multi=isinstance(request, DeleteMany)))
+                    else:
+                        raise TypeError(f"{request!r} is not a valid request")
+                except (OperationFailure, ValueError) as e:
+                    details = getattr(e, "details", None) or {}
+                    error = {"index": position, "code": getattr(e, "code", None) or 2,
+                             "errmsg": details.get("errmsg", str(e)), "op": getattr(request, "_doc", None)}
+                    error.update({k: details[k] for k in ("keyPattern", "keyValue") if k in details})
+                    result["writeErrors"].append(error)
+                    if ordered:
+                        break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    @staticmethod
+    def _count_update(result: Dict[str, Any], position: int, matched: int, modified: int, upserted_id: Any):
+        result["nMatched"] += matched
+        result["nModified"] += modified
+        if upserted_id is not None:
+            result["nUpserted"] += 1
+            result["upserted"].append({"index": position, "_id": upserted_id})
+
+    # -- indexes -----------------------------------------------------------
+
+    def create_index(self, keys: Any, **kwargs) -> str:
+        return self.create_indexes([IndexModel(keys, **kwargs)])[0]
+
+    def create_indexes(self, indexes: List[IndexModel], **kwargs) -> List[str]:
+        names = []
+        with self._lock:
+            for model in indexes:
+                spec = dict(model.document)
+                name = spec.pop("name")
+                keys = list(spec.pop("key").items())
+                names.append(name)
+
+                existing = self._indexes.get(name)
+                if existing is not None:
+                    if existing.info["key"] != keys:
+                        raise OperationFailure(
+                            f"An existing index has the same name as the requested index: {name}", 86
+                        )
+                    continue
+                for other_name, other in self._indexes.items():
+                    if other.info["key"] == keys:
+                        raise OperationFailure(f"Index already exists with a different name: {other_name}", 85)
+
+                info = {"v": 2, "key": keys, **spec}
+                text_fields = [field for field, kind in keys if kind == "text"]
+                if text_fields:
+                    if self._text_index() is not None:
+                        raise OperationFailure("An equivalent index already exists (only one text index per collection)", 85)
+                    weights = {field: 1 for field in text_fields}
+                    weights.update(spec.get("weights", {}))
+                    index = _TextIndex(name, weights, info)
+                else:
+                    index = _Index(name, keys, bool(spec.get("unique")), info)
+
+                for doc_key, doc in self._docs.items():
+                    if index.conflict(doc_key, doc):
+                        raise self._duplicate_key_error(name, keys, doc)
+                    index.add(doc_key, doc)
+                self._indexes[name] = index
+        return names
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        information = {"_id_": {"v": 2, "key": [("_id", 1)]}}
+        for name, index in self._indexes.items():
+            information[name] = copy.deepcopy(index.info)
+        return information
+
+    def list_indexes(self) -> Iterator[Dict[str, Any]]:
+        return iter([{"name": name, **info} for name, info in self.index_information().items()])
+
+    def drop_index(self, index_or_name: Any):
+        name = index_or_name if isinstance(index_or_name, str) else IndexModel(index_or_name).document["name"]
+        with self._lock:
+            if self._indexes.pop(name, None) is None:
+                raise OperationFailure(f"index not found with name [{name}]", 27)
+
+    def drop_indexes(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+            self._indexes.clear()
+        self.database.drop_collection(self.name)
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = MemoryCollection(self, name)
+            return collection
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    def drop_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def command(self, command: Any, **kwargs) -> Dict[str, Any]:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "isMaster", "ismaster"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"no such command: '{name}'", 59)
+
+
+class MemoryClient:
+    """In-memory replacement for pymongo.MongoClient"""
+
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, MemoryDatabase] = {}
+        self._lock = threading.Lock()
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        with self._lock:
+            database = self._databases.get(name)
+            if database is None:
+                database = self._databases[name] = MemoryDatabase(self, name)
+            return database
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.get_database(name)
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_database(name)
+
+    def list_database_names(self) -> List[str]:
+        return list(self._databases)
+
+    def drop_database(self, name: str):
+        with self._lock:
+            self._databases.pop(name, None)
+
+    def close(self):
+        pass
@@ -0,0 +1,361 @@
+"""
+Precomputed "related recipes" for KnockoffKitchen.com
+
+Every recipe gets a row in the `related_recipes` collection holding its
+nearest neighbours, ready to render as cards, so serving related recipes is a
+single `_id` lookup.
+
+Similarity is the Jaccard similarity of feature sets (title words, brand,
+category and ingredient words), estimated from MinHash signatures computed
+with NumPy. Signatures are split into LSH bands; recipes sharing a band are
+candidates, so neither the offline build nor the incremental refresh after a
+write ever compares all pairs of recipes.
+
+NumPy is imported on first use, so serving related recipes (a plain lookup)
+doesn't add it to the API's cold start.
+"""
+import argparse
+import re
+import threading
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set
+
+import pymongo
+
+if TYPE_CHECKING:
+    import numpy as np
+
+from mongodb_setup import get_recipes_collection, get_related_collection
+from mongodb_search import tokenize
+from mongodb_crud import CARD_FIELDS
+
+# Number of neighbours kept per recipe
+RELATED_LIMIT = 8
+
+# Estimated Jaccard similarity below which recipes are not considered related
+MIN_SIMILARITY = 0.1
+
+# MinHash signature length, split into BANDS bands of ROWS_PER_BAND values.
+# Pairs with similarity s become candidates with probability 1 - (1 - s^2)^32,
+# about 0.3 at s = 0.1 and 0.99 at s = 0.35.
+NUM_PERMUTATIONS = 64
+BANDS = 32
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+# Buckets this large only say "same brand and category" and are skipped
+# during the offline build to keep it linear
+MAX_BUCKET_SIZE = 2000
+
+# Features are repeated to weight a field more heavily in the Jaccard similarity
+FEATURE_WEIGHTS = {"title": 2, "brand": 3, "category": 2, "ingredients": 1}
+
+# Words that say nothing about what a recipe is
+IGNORED_WORDS = {
+    "homemade", "copycat", "recipe", "easy", "best", "the", "and", "with", "of",
+    "cup", "cups", "tbsp", "tsp", "tablespoon", "tablespoons", "teaspoon", "teaspoons",
+    "oz", "ounce", "ounces", "lb", "lbs", "pound", "pounds", "g", "grams", "ml", "pinch",
+    "large", "small", "medium", "chopped", "minced", "sliced", "to", "taste", "optional",
+}
+
+_NUMBER = re.compile(r"^\d+$")
+
+# Refreshes read neighbour lists and write them back whole, so two running at
+# once (background tasks share the threadpool) would drop each other's
+# changes to rows they both touch. Reentrant: a refresh may remove a recipe.
+_write_lock = threading.RLock()
+
+
+@lru_cache(maxsize=None)
+def _hash_functions():
+    """
+    Universal hash functions h(x) = (a * x + b) mod p over 32-bit feature hashes.
+    With a, b < p < 2^32 the products fit in uint64 without overflow.
+    """
+    import numpy as np
+
+    prime = np.uint64(4294967291)
+    random = np.random.RandomState(1729)
+    a = random.randint(1, 2**32 - 5, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    b = random.randint(0, 2**32 - 5, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    return prime, a, b
+
+# Fields read to build features and neighbour cards
+SOURCE_FIELDS = {field: 1 for field in ("ingredients",) + CARD_FIELDS}
+
+
+def affects_related(update_data: Dict[str, Any]) -> bool:
+    """
+    Whether an update changes a recipe's features or its card
+    """
+    return any(field in SOURCE_FIELDS for field in update_data)
+
+
+def _words(text: Any) -> List[str]:
+    return [w for w in tokenize(text) if w not in IGNORED_WORDS and not _NUMBER.match(w)]
+
+
+def recipe_features(recipe: Dict[str, Any]) -> Set[str]:
+    """
+    The weighted feature set describing a recipe
+    """
+    fields = {
+        "title": _words(recipe.get("title")),
+        "brand": [recipe["brand_name"].lower()] if recipe.get("brand_name") else [],
+        "category": [recipe["category"].lower()] if recipe.get("category") else [],
+        "ingredients": [],
+    }
+    ingredients = recipe.get("ingredients") or {}
+    if isinstance(ingredients, dict):
+        for item in ingredients.get("items") or []:
+            fields["ingredients"].extend(_words(item))
+
+    features = set()
+    for field, values in fields.items():
+        for value in values:
+            for copy in range(FEATURE_WEIGHTS[field]):
+                features.add(f"{field}:{value}:{copy}")
+    return features
+
+
+def minhash_signature(features: Iterable[str]) -> Optional["np.ndarray"]:
+    """
+    MinHash signature of a feature set (None for an empty set)
+    """
+    import numpy as np
+
+    prime, a, b = _hash_functions()
+    hashes = np.fromiter(
+        (zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.uint64
+    )
+    if hashes.size == 0:
+        return None
+    permuted = (hashes[:, None] * a[None, :] + b[None, :]) % prime
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: "np.ndarray") -> List[int]:
+    """
+    One LSH key per band: the band number in the high bits, a hash of its values in the low 32
+    """
+    bands = signature.reshape(BANDS, ROWS_PER_BAND)
+    return [(band << 32) | zlib.crc32(bands[band].tobytes()) for band in range(BANDS)]
+
+
+def similarities(signature: "np.ndarray", candidates: "np.ndarray") -> "np.ndarray":
+    """
+    Estimated Jaccard similarity of one signature against a matrix of signatures
+    """
+    return (candidates == signature).mean(axis=1)
+
+
+def _card(recipe: Dict[str, Any], score: float) -> Dict[str, Any]:
+    card = {"id": recipe["_id"], "score": round(float(score), 4)}
+    for field in CARD_FIELDS:
+        if recipe.get(field) is not None:
+            card[field] = recipe[field]
+    return card
+
+
+def _top_candidates(scores: "np.ndarray", candidate_ids: List[Any]) -> List[int]:
+    """
+    Positions of the best candidates above MIN_SIMILARITY, highest score first
+    (ties by id for a stable order)
+    """
+    import numpy as np
+
+    keep = np.flatnonzero(scores >= MIN_SIMILARITY)
+    if keep.size > RELATED_LIMIT:
+        keep = keep[np.argpartition(-scores[keep], RELATED_LIMIT - 1)[:RELATED_LIMIT]]
+    return sorted(keep, key=lambda i: (-scores[i], str(candidate_ids[i])))
+
+
+def rebuild_related(batch_size: int = 1000) -> int:
+    """
+    Recompute the whole neighbour table. Returns the number of rows written.
+    """
+    with _write_lock:
+        return _rebuild_related(batch_size)
+
+
+def _rebuild_related(batch_size: int) -> int:
+    import numpy as np
+
+    recipes_collection = get_recipes_collection()
+    related_collection = get_related_collection()
+
+    # Every row written from here on is stamped at or after `started`
+    # (at millisecond precision, as BSON stores it)
+    started = datetime.now(timezone.utc)
+    started = started.replace(microsecond=started.microsecond // 1000 * 1000)
+    recipes, signatures = [], []
+    for recipe in recipes_collection.find({}, SOURCE_FIELDS).batch_size(batch_size):
+        signature = minhash_signature(recipe_features(recipe))
+        if signature is not None:
+            recipes.append(recipe)
+            signatures.append(signature)
+
+    if not recipes:
+        related_collection.delete_many({})
+        return 0
+
+    matrix = np.vstack(signatures)
+    keys = np.array([band_keys(signature) for signature in signatures], dtype=np.int64)
+    ids = [recipe["_id"] for recipe in recipes]
+    cards = {recipe["_id"]: recipe for recipe in recipes}
+
+    # Group rows by key in each band once: bucket members are contiguous in `order`
+    band_groups = []
+    for band in range(BANDS):
+        _, inverse, counts = np.unique(keys[:, band], return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        band_groups.append((inverse, order, starts, counts))
+
+    operations = []
+    for row in range(len(recipes)):
+        members = []
+        for inverse, order, starts, counts in band_groups:
+            bucket = inverse[row]
+            if 1 < counts[bucket] <= MAX_BUCKET_SIZE:
+                members.append(order[starts[bucket]:starts[bucket] + counts[bucket]])
+
+        neighbours = []
+        if members:
+            candidates = np.unique(np.concatenate(members))
+            candidates = candidates[candidates != row]
+            scores = similarities(matrix[row], matrix[candidates])
+            candidate_ids = [ids[i] for i in candidates]
+            neighbours = [
+                _card(cards[candidate_ids[i]], scores[i]) for i in _top_candidates(scores, candidate_ids)
+            ]
+
+        operations.append(pymongo.ReplaceOne(
+            {"_id": ids[row]},
+            {
+                "signature": matrix[row].tolist(),
+                "bands": keys[row].tolist(),
+                "related": neighbours,
+                "updated_at": started,
+            },
+            upsert=True
+        ))
+        if len(operations) >= batch_size:
+            related_collection.bulk_write(operations, ordered=False)
+            operations = []
+
+    if operations:
+        related_collection.bulk_write(operations, ordered=False)
+
+    # Drop rows this rebuild didn't write: their recipes no longer exist
+    related_collection.delete_many({"updated_at": {"$lt": started}})
+    return len(recipes)
+
+
+def refresh_related(recipe_ids: Iterable[Any]):
+    """
+    Recompute the neighbours of created or updated recipes and update the rows
+    of recipes that list them or should now list them. Candidates come from an
+    indexed lookup on the LSH band keys.
+
+    Rows that lose a neighbour this way are not backfilled from further down
+    their ranking; the periodic full rebuild restores them.
+    """
+    with _write_lock:
+        _refresh_related(recipe_ids)
+
+
+def _refresh_related(recipe_ids: Iterable[Any]):
+    import numpy as np
+
+    recipes_collection = get_recipes_collection()
+    related_collection = get_related_collection()
+    now = datetime.now(timezone.utc)
+
+    for recipe in recipes_collection.find({"_id": {"$in": list(recipe_ids)}}, SOURCE_FIELDS):
+        recipe_id = recipe["_id"]
+        signature = minhash_signature(recipe_features(recipe))
+        if signature is None:
+            remove_related([recipe_id])
+            continue
+        keys = band_keys(signature)
+
+        rows = list(related_collection.find(
+            {"$or": [{"bands": {"$in": keys}}, {"related.id": recipe_id}], "_id": {"$ne": recipe_id}},
+            {"signature": 1, "related": 1}
+        ))
+        rows = [row for row in rows if row.get("signature")]
+
+        neighbours = []
+        updates = []
+        if rows:
+            scores = similarities(signature, np.array([row["signature"] for row in rows], dtype=np.uint32))
+
+            row_ids = [row["_id"] for row in rows]
+            top = _top_candidates(scores, row_ids)
+            cards = {
+                doc["_id"]: doc
+                for doc in recipes_collection.find(
+                    {"_id": {"$in": [row_ids[i] for i in top]}}, {field: 1 for field in CARD_FIELDS}
+                )
+            }
+            neighbours = [_card(cards[row_ids[i]], scores[i]) for i in top if row_ids[i] in cards]
+
+            # Insert, move or drop this recipe in each candidate's own neighbour list
+            for row, score in zip(rows, scores):
+                listed = [entry for entry in row.get("related", []) if entry["id"] != recipe_id]
+                if score >= MIN_SIMILARITY:
+                    listed.append(_card(recipe, score))
+                listed.sort(key=lambda entry: (-entry["score"], str(entry["id"])))
+                listed = listed[:RELATED_LIMIT]
+                if listed != row.get("related", []):
+                    updates.append(pymongo.UpdateOne(
+                        {"_id": row["_id"]}, {"$set": {"related": listed, "updated_at": now}}
+                    ))
+
+        updates.append(pymongo.ReplaceOne(
+            {"_id": recipe_id},
+            {"signature": signature.tolist(), "bands": keys, "related": neighbours, "updated_at": now},
+            upsert=True
+        ))
+        related_collection.bulk_write(updates, ordered=False)
+
+
+def remove_related(recipe_ids: Iterable[Any]):
+    """
+    Drop deleted recipes' rows and remove them from other recipes' neighbours
+    """
+    recipe_ids = list(recipe_ids)
+    related_collection = get_related_collection()
+    with _write_lock:
+        related_collection.delete_many({"_id": {"$in": recipe_ids}})
+        related_collection.update_many(
+            {"related.id": {"$in": recipe_ids}},
+            {"$pull": {"related": {"id": {"$in": recipe_ids}}}}
+        )
+
+
+async def get_related_recipes(recipe_id: str, limit: int = RELATED_LIMIT) -> Optional[List[Dict[str, Any]]]:
+    """
+    Related recipe cards for a recipe, or None if it has no neighbour row yet
+    """
+    row = get_related_collection().find_one({"_id": recipe_id}, {"related": 1})
+    if row is None:
+        return None
+    return row.get("related", [])[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the related recipes table")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute neighbours for every recipe")
+    parser.add_argument("--recipe", type=str, help="Print the related recipes of a recipe id")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"Rebuilt related recipes for {rebuild_related()} recipes")
+
+    if args.recipe:
+        row = get_related_collection().find_one({"_id": args.recipe}, {"related": 1})
+        for entry in (row or {}).get("related", []):
+            print(f"{entry['score']:.3f}  {entry.get('title')}")
@@ -0,0 +1,221 @@
+"""
+Indexed, ranked full-text search over recipes for KnockoffKitchen.com
+
+Complete words are matched through a weighted MongoDB text index and ranked by
+text score. The word still being typed is matched as a prefix against the
+`search_tokens` array, a lower-cased token list stored on every recipe at write
+time; an anchored regex on that field is served by its multikey index, so no
+query ever scans the whole collection.
+"""
+import re
+import argparse
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
+
+import pymongo
+
+from mongodb_setup import get_recipes_collection, convert_mongodb_to_api
+
+# Fields covered by search, with their relevance weights in the text index
+SEARCH_WEIGHTS = {
+    "title": 10,
+    "brand_name": 5,
+    "category": 3,
+    "ingredients.items": 1,
+}
+
+TEXT_INDEX_NAME = "recipe_text_search"
+TOKENS_INDEX_NAME = "recipe_search_tokens"
+
+# Prefixes shorter than this match too many tokens to be useful
+MIN_PREFIX_LENGTH = 2
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Split text into lower-case alphanumeric tokens
+    """
+    if not text:
+        return []
+    return _TOKEN.findall(str(text).lower())
+
+
+def build_search_tokens(recipe: Dict[str, Any]) -> List[str]:
+    """
+    Build the sorted, de-duplicated token list stored as `search_tokens`
+    """
+    tokens = set()
+    tokens.update(tokenize(recipe.get("title")))
+    tokens.update(tokenize(recipe.get("brand_name")))
+    tokens.update(tokenize(recipe.get("category")))
+
+    ingredients = recipe.get("ingredients") or {}
+    items = ingredients.get("items", []) if isinstance(ingredients, dict) else ingredients
+    for item in items or []:
+        tokens.update(tokenize(item))
+
+    return sorted(tokens)
+
+
+def touches_search_fields(update_data: Dict[str, Any]) -> bool:
+    """
+    Whether an update changes any field that feeds `search_tokens`
+    """
+    return any(field in update_data for field in ("title", "brand_name", "category", "ingredients"))
+
+
+def parse_query(query: str) -> Tuple[List[str], Optional[str]]:
+    """
+    Split a search query into complete terms and a trailing prefix.
+
+    The last word counts as a prefix unless the query ends with whitespace,
+    which is how search-as-you-type input looks while a word is being typed.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return [], None
+
+    if query[-1:].isspace() or len(terms[-1]) < MIN_PREFIX_LENGTH:
+        return terms, None
+
+    return terms[:-1], terms[-1]
+
+
+def build_search_filter(query: str) -> Dict[str, Any]:
+    """
+    Build an index-served filter matching recipes for a search query
+    """
+    terms, prefix = parse_query(query)
+
+    query_filter = {}
+    if terms:
+        query_filter["$text"] = {"$search": " ".join(terms)}
+    if prefix:
+        query_filter["search_tokens"] = {"$regex": f"^{re.escape(prefix)}"}
+
+    if not query_filter:
+        # Nothing searchable (e.g. only punctuation): match nothing
+        query_filter["search_tokens"] = {"$in": []}
+
+    return query_filter
+
+
+async def search_recipes(
+    query: str,
+    skip: int = 0,
+    limit: int = 20,
+    brand_name: Optional[str] = None,
+    category: Optional[str] = None,
+    projection: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """
+    Search recipes, ranked by relevance.
+
+    Complete terms contribute their weighted text score; a prefix that starts
+    the title adds a bonus so search-as-you-type favours title matches.
+    Returns the page of recipes and whether more results follow.
+    """
+    recipes_collection = get_recipes_collection()
+
+    terms, prefix = parse_query(query)
+    match = build_search_filter(query)
+    if brand_name:
+        match["brand_name"] = brand_name
+    if category:
+        match["category"] = category
+
+    score = {"$meta": "textScore"} if terms else 0
+    if prefix:
+        title_bonus = {"$cond": [
+            {"$regexMatch": {
+                "input": {"$toLower": {"$ifNull": ["$title", ""]}},
+                "regex": f"(^|[^a-z0-9]){re.escape(prefix)}"
+            }},
+            SEARCH_WEIGHTS["title"],
+            0
+        ]}
+        score = {"$add": [score, title_bonus]}
+
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"_score": score}},
+        {"$sort": {"_score": -1, "title": 1, "_id": 1}},
+        {"$skip": skip},
+        # Fetch one extra document to know whether there is a next page
+        {"$limit": limit + 1},
+    ]
+    if projection:
+        pipeline.append({"$project": {**projection, "_score": 1}})
+
+    docs = list(recipes_collection.aggregate(pipeline))
+    has_more = len(docs) > limit
+
+    recipes = []
+    for doc in docs[:limit]:
+        recipe = convert_mongodb_to_api(doc)
+        recipe["score"] = recipe.pop("_score", 0)
+        recipes.append(recipe)
+
+    return {
+        "query": query,
+        "recipes": recipes,
+        "skip": skip,
+        "limit": limit,
+        "has_more": has_more
+    }
+
+
+def backfill_search_tokens(batch_size: int = 1000, missing_only: bool = False, ensure: bool = True) -> int:
+    """
+    Compute `search_tokens` for every recipe (or only those without any) and
+    ensure the search indexes. Recipes written before search tokens were
+    maintained have none; startup index preparation backfills them.
+    """
+    recipes_collection = get_recipes_collection()
+    if ensure:
+        # Imported here: mongodb_indexes reads the search index declarations from this module
+        from mongodb_indexes import ensure_indexes
+        ensure_indexes(recipes_collection)
+
+    query = {"search_tokens": {"$exists": False}} if missing_only else {}
+    fields = {"title": 1, "brand_name": 1, "category": 1, "ingredients": 1}
+    updated = 0
+    batch = []
+
+    for doc in recipes_collection.find(query, fields).batch_size(batch_size):
+        batch.append(pymongo.UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"search_tokens": build_search_tokens(doc)}}
+        ))
+        if len(batch) >= batch_size:
+            updated += recipes_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+
+    if batch:
+        updated += recipes_collection.bulk_write(batch, ordered=False).modified_count
+
+    return updated
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Recipe search maintenance and ad-hoc queries")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Compute search tokens for all recipes and create the search indexes")
+    parser.add_argument("--query", type=str, help="Run a search query and print the results")
+    parser.add_argument("--limit", type=int, default=10, help="Number of results to print")
+    args = parser.parse_args()
+
+    if args.backfill:
+        updated = backfill_search_tokens()
+        print(f"Updated search tokens for {updated} recipes")
+
+    if args.query:
+        results = await search_recipes(args.query, limit=args.limit)
+        for recipe in results["recipes"]:
+            print(f"{recipe['score']:6.2f}  {recipe.get('title')}  ({recipe.get('brand_name')})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -16,78 +16,49 @@ DB_NAME = "knockoffkitchen"
 RECIPES_COLLECTION = "recipes"
 BRANDS_COLLECTION = "brands"
 CATEGORIES_COLLECTION = "categories"
+RELATED_COLLECTION = "related_recipes"
+
+# Fields maintained by the backend that are never exposed through the API
+INTERNAL_FIELDS = ("search_tokens",)
+
+# URI scheme selecting the in-memory engine instead of a MongoDB server
+MEMORY_URI_SCHEME = "memory://"
 
 # Global client variable
 _client = None
 
 def get_database():
     """
-    Get a connection to the MongoDB database
+    Get a connection to the MongoDB database.
+    
+    Falls back to the in-memory engine when the server can't be reached, so
+    the API keeps working (without persistence) during development. Set
+    MONGODB_URI=memory:// to use the in-memory engine explicitly.
     """
     global _client
-    try:
-        if _client is None:
-            _client = MongoClient(MONGODB_URI)
-            # Test the connection
-            _client.admin.command('ping')
-            print("MongoDB connection successful")
-        return _client[DB_NAME]
-    except Exception as e:
-        print(f"MongoDB connection error: {e}")
-        # Return a mock database for development
-        return MockDatabase()
-
-class MockDatabase:
-    """Mock database for development when MongoDB is not available"""
-    def __getitem__(self, name):
-        return MockCollection()
-
-class MockCollection:
-    """Mock collection for development when MongoDB is not available"""
-    def find(self, *args, **kwargs):
-        return []
-    
-    def find_one(self, *args, **kwargs):
-        return None
-    
-    def insert_one(self, *args, **kwargs):
-        return MockInsertResult()
-    
-    def insert_many(self, *args, **kwargs):
-        return []
-    
-    def update_one(self, *args, **kwargs):
-        return MockUpdateResult()
-    
-    def delete_one(self, *args, **kwargs):
-        return MockDeleteResult()
-    
-    def count_documents(self, *args, **kwargs):
-        return 0
-    
-    def distinct(self, *args, **kwargs):
-        return []
-    
-    def create_index(self, *args, **kwargs):
-        return None
+    if _client is None:
+        if MONGODB_URI.startswith(MEMORY_URI_SCHEME):
+            use_memory_database()
+        else:
+            try:
+                client = MongoClient(MONGODB_URI)
+                # Test the connection
+                client.admin.command('ping')
+                _client = client
+                print("MongoDB connection successful")
+            except Exception as e:
+                print(f"MongoDB connection error: {e}")
+                print("Using the in-memory database; data will not be persisted")
+                use_memory_database()
+    return _client[DB_NAME]
 
-class MockInsertResult:
-    """Mock insert result"""
-    @property
-    def inserted_id(self):
-        return "mock_id"
-
-class MockUpdateResult:
-    """Mock update result"""
-    @property
-    def modified_count(self):
-        return 0
-
-class MockDeleteResult:
-    """Mock delete result"""
-    @property
-    def deleted_count(self):
-        return 0
+def use_memory_database():
+    """
+    Switch to a fresh in-memory database (development, tests and offline benchmarks)
+    """
+    global _client
+    from mongodb_memory import MemoryClient
+    _client = MemoryClient()
 
 def get_recipes_collection():
     """
@@ -110,6 +81,13 @@ def get_categories_collection():
     db = get_database()
     return db[CATEGORIES_COLLECTION]
 
+def get_related_collection():
+    """
+    Get the related recipes (precomputed neighbour table) collection
+    """
+    db = get_database()
+    return db[RELATED_COLLECTION]
+
 def convert_sqlalchemy_to_mongodb(recipe_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Convert SQLAlchemy model data to MongoDB document format
@@ -136,6 +114,9 @@ def convert_mongodb_to_api(mongo_doc: Dict[str, Any]) -> Dict[str, Any]:
         api_data['id'] = str(api_data['_id'])
         del api_data['_id']
     
+    for field in INTERNAL_FIELDS:
+        api_data.pop(field, None)
+    
     return api_data
 
 async def migrate_data_to_mongodb(recipes: List[Dict[str, Any]]):
@@ -146,21 +127,30 @@ async def migrate_data_to_mongodb(recipes: List[Dict[str, Any]]):
     
     # Clear existing data
     recipes_collection.delete_many({})
+    get_brands_collection().delete_many({})
+    get_categories_collection().delete_many({})
     
     # Insert new data
     if recipes:
+        # Imported here to avoid a circular import (mongodb_search uses this module)
+        from mongodb_search import build_search_tokens
+        
         # Convert data to MongoDB format
         mongo_recipes = [convert_sqlalchemy_to_mongodb(recipe) for recipe in recipes]
+        for recipe in mongo_recipes:
+            recipe['search_tokens'] = build_search_tokens(recipe)
         
         # Insert into MongoDB
         recipes_collection.insert_many(mongo_recipes)
         
+        # Rebuild the brand and category counters with one batched $inc per collection
+        from mongodb_counters import record_recipe_changes
+        record_recipe_changes((None, recipe) for recipe in mongo_recipes)
+        
         print(f"Migrated {len(mongo_recipes)} recipes to MongoDB")
     else:
         print("No recipes to migrate")
     
-    # Create indexes for better query performance
-    recipes_collection.create_index("title")
-    recipes_collection.create_index("brand_name")
-    recipes_collection.create_index("category")
-    recipes_collection.create_index("slug", unique=True)
+    # Create the declared indexes (imported here to avoid a circular import)
+    from mongodb_indexes import ensure_indexes
+    ensure_indexes(recipes_collection)
@@ -0,0 +1,73 @@
+"""
+Keyset (cursor) pagination helpers shared by the MongoDB and PostgreSQL backends
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+# Sort orders that can be paginated with a cursor. A leading "-" means descending.
+# Every order is made stable by using the document id as a tie-breaker.
+SORT_FIELDS = ("title", "created_at")
+DEFAULT_SORT = "title"
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor token cannot be decoded or does not match the sort order"""
+
+
+def parse_sort(sort: Optional[str]) -> Tuple[str, int]:
+    """
+    Parse a sort parameter such as "title" or "-created_at" into (field, direction)
+    """
+    sort = sort or DEFAULT_SORT
+    direction = -1 if sort.startswith("-") else 1
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Unsupported sort order '{sort}'. Use one of: {', '.join(SORT_FIELDS)}")
+    return field, direction
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+        if "$uuid" in value:
+            return uuid.UUID(value["$uuid"])
+    return value
+
+
+def encode_cursor(sort: str, sort_value: Any, doc_id: Any) -> str:
+    """
+    Encode the position after a document as an opaque, URL-safe token
+    """
+    payload = {"s": sort, "v": _encode_value(sort_value), "id": _encode_value(doc_id)}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sort: str) -> Tuple[Any, Any]:
+    """
+    Decode a cursor token into (sort_value, doc_id) for the given sort order
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, doc_id = _decode_value(payload["v"]), _decode_value(payload["id"])
+        token_sort = payload["s"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+
+    if token_sort != sort:
+        raise InvalidCursorError(f"Cursor was issued for sort order '{token_sort}', not '{sort}'")
+
+    return value, doc_id
@@ -0,0 +1,193 @@
+"""
+In-process read cache with write-driven invalidation for KnockoffKitchen.com
+
+Entries are kept in a bounded LRU with a per-entry TTL and a total size cap in
+bytes. Every entry carries tags (e.g. "recipe:<id>", "listings", "brands") so
+write endpoints can invalidate exactly the entries they affect.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "tags")
+
+    def __init__(self, value: Any, size: int, expires_at: float, tags: Tuple[str, ...]):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.tags = tags
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximate the memory held by a cached value by its JSON size.
+    Values that know their own footprint (e.g. pre-rendered bodies) report `cache_size`.
+    """
+    size = getattr(value, "cache_size", None)
+    if size is not None:
+        return size
+    return len(json.dumps(value, default=str))
+
+
+class ReadCache:
+    """
+    Bounded LRU + TTL cache keyed by normalised query parameters
+    """
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(namespace: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Build a cache key that is independent of parameter order and omitted defaults
+        """
+        items = []
+        for name, value in (params or {}).items():
+            if value is None or value == "":
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            elif isinstance(value, (list, tuple)):
+                value = ",".join(str(v) for v in value)
+            items.append((name, value))
+        return f"{namespace}?{urlencode(sorted(items))}"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Return (found, value) for a key, counting the hit or miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None):
+        """
+        Store a value, evicting least recently used entries to respect the caps
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        entry = _Entry(value, size, time.monotonic() + (ttl or self.default_ttl), tuple(tags))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = entry
+            self._bytes += size
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        params: Optional[Dict[str, Any]],
+        loader: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the cached value for (namespace, params), loading and caching it on a miss.
+        None results (e.g. not found) are not cached.
+        """
+        key = self.make_key(namespace, params)
+        found, value = self.get(key)
+        if found:
+            return value
+
+        value = await loader()
+        if value is not None:
+            self.set(key, value, tags=tags, ttl=ttl)
+        return value
+
+    def invalidate(self, *tags: str) -> int:
+        """
+        Drop every entry carrying any of the given tags. Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: str):
+        # Caller must hold the lock
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Shared cache for API reads, sized from the environment
+read_cache = ReadCache(
+    max_entries=int(os.environ.get("READ_CACHE_MAX_ENTRIES", 4096)),
+    max_bytes=int(os.environ.get("READ_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    default_ttl=float(os.environ.get("READ_CACHE_TTL", 300)),
+)
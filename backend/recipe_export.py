@@ -0,0 +1,381 @@
+"""
+Streaming recipe export for KnockoffKitchen.com
+
+Recipes are read in batches from a server-side cursor (`stream_scalars` with
+`yield_per` on Postgres, a batched cursor on MongoDB) and encoded as they
+arrive: CSV a batch at a time, Parquet one row group per batch. Only the
+current batch is held in memory, so exporting the whole catalog takes the same
+memory as exporting a page of it.
+
+The same stream backs the `/admin/export` endpoints of both APIs and the
+command line:
+
+    python recipe_export.py recipes.parquet --format parquet
+"""
+import argparse
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from http_caching import cache_headers
+
+# Columns of a SQL export, in file order (every column of the recipes table)
+SQL_COLUMNS = (
+    "id", "title", "brand_name", "category", "prep_time", "cook_time", "total_time", "yield",
+    "ingredients", "instructions", "storage_instructions", "recipe_variations", "special_equipment",
+    "pro_tips", "nutritional_info", "faq", "serving_suggestions", "cost_comparison",
+    "seo_meta_description", "created_at", "updated_at",
+)
+
+# Columns of a MongoDB export. Documents have no fixed schema: fields not
+# listed here are collected as a JSON object in `extra`, so the export is a
+# full dump of every document.
+MONGO_COLUMNS = (
+    "id", "slug", "title", "brand_name", "category", "introduction", "prep_time", "cook_time",
+    "total_time", "yield", "ingredients", "instructions", "storage_instructions", "recipe_variations",
+    "special_equipment", "pro_tips", "nutritional_info", "faq", "serving_suggestions", "cost_comparison",
+    "seo_meta_description", "image", "image_url", "image_alt", "image_title", "created_at", "updated_at",
+    "extra",
+)
+
+# Backend-maintained MongoDB fields that are not part of a recipe
+MONGO_INTERNAL_FIELDS = ("search_tokens", "version")
+
+# Structured columns, exported as JSON text
+JSON_COLUMNS = ("ingredients", "nutritional_info", "faq")
+
+INTEGER_COLUMNS = ("prep_time", "cook_time", "total_time")
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+
+# Rows per database round trip, CSV chunk and Parquet row group
+BATCH_SIZE = 5000
+
+EXPORT_FORMATS = {
+    "csv": {"media_type": "text/csv; charset=utf-8", "extension": "csv"},
+    "parquet": {"media_type": "application/vnd.apache.parquet", "extension": "parquet"},
+}
+
+
+def parquet_available() -> bool:
+    # pyarrow is optional and slow to import, so it is only loaded by the Parquet encoder
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+
+    fields = []
+    for column in columns:
+        if column in INTEGER_COLUMNS:
+            fields.append(pa.field(column, pa.int32()))
+        elif column in TIMESTAMP_COLUMNS:
+            fields.append(pa.field(column, pa.timestamp("us", tz="UTC")))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    # MongoDB returns naive UTC datetimes
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+_UNCONVERTIBLE = object()
+
+
+def _column_value(column: str, value: Any) -> Any:
+    """
+    Convert a value to its column's type: int for times, an aware datetime for
+    timestamps, text otherwise (structures as JSON). Returns _UNCONVERTIBLE for
+    values that don't fit, e.g. a time written as "10 minutes".
+    """
+    if value is None:
+        return None
+    if column in INTEGER_COLUMNS:
+        if isinstance(value, bool):
+            return _UNCONVERTIBLE
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+        return _UNCONVERTIBLE
+    if column in TIMESTAMP_COLUMNS:
+        return _timestamp(value) if isinstance(value, datetime) else _UNCONVERTIBLE
+    if column in JSON_COLUMNS or isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value if isinstance(value, str) else str(value)
+
+
+def export_row(recipe: Dict[str, Any], columns=SQL_COLUMNS) -> Dict[str, Any]:
+    """
+    Flatten a recipe (a MongoDB document or the columns of a SQL row) into export
+    values matching the column types, so every batch fits the Parquet schema
+    """
+    recipe = dict(recipe)
+    row = {}
+    for column in columns:
+        if column == "extra":
+            continue
+        if column == "id":
+            value = recipe.pop("id", recipe.pop("_id", None))
+        elif column == "yield":
+            value = recipe.pop("yield", recipe.pop("yield_amount", None))
+        else:
+            value = recipe.pop(column, None)
+        converted = _column_value(column, value)
+        if converted is _UNCONVERTIBLE:
+            # Kept as is in `extra` when the export has it
+            recipe[column] = value
+            converted = None
+        row[column] = converted
+    if "extra" in columns:
+        row["extra"] = json.dumps(recipe, default=str, sort_keys=True) if recipe else None
+    return row
+
+
+def sql_row(recipe) -> Dict[str, Any]:
+    """
+    Column values of an ORM Recipe
+    """
+    values = {column: getattr(recipe, column, None) for column in SQL_COLUMNS if column != "yield"}
+    values["yield"] = recipe.yield_amount
+    return values
+
+
+class CsvEncoder:
+    """
+    Encodes batches of export rows as CSV, the header first
+    """
+
+    def __init__(self, columns):
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=columns)
+        self._writer.writeheader()
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        for row in rows:
+            self._writer.writerow({
+                column: value.isoformat() if isinstance(value, datetime) else value
+                for column, value in row.items()
+            })
+        return self._drain()
+
+    def close(self) -> bytes:
+        # The header alone, for an empty export
+        return self._drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what the Parquet writer emits until drained
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetEncoder:
+    """
+    Encodes each batch of export rows as one Parquet row group; the footer is
+    emitted by close()
+    """
+
+    def __init__(self, columns):
+        if not parquet_available():
+            raise RuntimeError("Parquet export requires pyarrow")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._table = pa.Table.from_pylist
+        self.schema = _parquet_schema(columns)
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(pa.PythonFile(self._sink, mode="w"), self.schema, compression="zstd")
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        if rows:
+            self._writer.write_table(self._table(rows, schema=self.schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def create_encoder(export_format: str, columns):
+    if export_format == "csv":
+        return CsvEncoder(columns)
+    if export_format == "parquet":
+        return ParquetEncoder(columns)
+    raise ValueError(f"Unknown export format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+
+
+# Engine shared by every SQL export, created on first use with the "bulk"
+# profile (few connections, long command timeouts); its pool is reported as
+# "export" by /admin/db/pool
+_export_engine = None
+
+
+def export_engine():
+    global _export_engine
+    if _export_engine is None:
+        from database import create_engine
+        _export_engine = create_engine("bulk", name="export")
+    return _export_engine
+
+
+async def sql_batches(batch_size: int = BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Export rows of every SQL recipe, a batch at a time, from a server-side cursor
+    """
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from models import Recipe
+    from crud import FULL_RECIPE
+
+    async with AsyncSession(export_engine()) as session:
+        result = await session.stream_scalars(
+            select(Recipe).options(FULL_RECIPE).order_by(Recipe.id).execution_options(yield_per=batch_size)
+        )
+        async for recipes in result.partitions():
+            yield [export_row(sql_row(recipe)) for recipe in recipes]
+            # Don't let the identity map grow with the whole table
+            session.expunge_all()
+
+
+async def mongo_batches(batch_size: int = BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Export rows of every MongoDB recipe, a batch at a time
+    """
+    from mongodb_setup import get_recipes_collection
+
+    projection = {field: 0 for field in MONGO_INTERNAL_FIELDS}
+    cursor = get_recipes_collection().find({}, projection).sort("_id", 1).batch_size(batch_size)
+    try:
+        while True:
+            # The driver blocks while fetching the next batch
+            docs = await asyncio.to_thread(lambda: list(islice(cursor, batch_size)))
+            if not docs:
+                break
+            yield [export_row(doc, MONGO_COLUMNS) for doc in docs]
+    finally:
+        cursor.close()
+
+
+async def stream_export(
+    batches: AsyncIterator[List[Dict[str, Any]]], columns, export_format: str
+) -> AsyncIterator[bytes]:
+    """
+    Encode batches of export rows with the given columns into a stream of file chunks
+    """
+    encoder = create_encoder(export_format, columns)
+    async for rows in batches:
+        chunk = encoder.encode(rows)
+        if chunk:
+            yield chunk
+    chunk = encoder.close()
+    if chunk:
+        yield chunk
+
+
+def export_filename(export_format: str) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return f"recipes-{stamp}.{EXPORT_FORMATS[export_format]['extension']}"
+
+
+async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def export_response(batches: AsyncIterator[List[Dict[str, Any]]], columns, export_format: str) -> StreamingResponse:
+    """
+    Streaming download of an export, for the /admin/export endpoints.
+    The first chunk is encoded before the response starts, so a failing query
+    or encoder is reported with an error status rather than a truncated file.
+    """
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    stream = stream_export(batches, columns, export_format)
+    try:
+        first = await stream.__anext__()
+    except Exception as e:
+        await stream.aclose()
+        print(f"Error exporting recipes: {e}")
+        raise HTTPException(status_code=500, detail=f"Export failed: {e}")
+
+    headers = cache_headers("admin")
+    headers["Content-Disposition"] = f'attachment; filename="{export_filename(export_format)}"'
+    return StreamingResponse(
+        _prepend(first, stream),
+        media_type=EXPORT_FORMATS[export_format]["media_type"],
+        headers=headers
+    )
+
+
+async def export_to_file(file_path: str, export_format: str, backend: str = "sql", batch_size: int = BATCH_SIZE) -> int:
+    """
+    Export every recipe to a file. Returns the number of bytes written.
+    """
+    if backend == "sql":
+        batches, columns = sql_batches(batch_size), SQL_COLUMNS
+    else:
+        batches, columns = mongo_batches(batch_size), MONGO_COLUMNS
+    written = 0
+    try:
+        with open(file_path, "wb") as f:
+            async for chunk in stream_export(batches, columns, export_format):
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        if _export_engine is not None:
+            await _export_engine.dispose()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every recipe to CSV or Parquet")
+    parser.add_argument("file", help="Output file")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--backend", choices=["sql", "mongodb"], default="sql")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per batch / Parquet row group")
+    args = parser.parse_args()
+
+    size = asyncio.run(export_to_file(args.file, args.format, args.backend, args.batch_size))
+    print(f"Exported recipes to {args.file} ({size} bytes)")
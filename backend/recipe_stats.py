@@ -0,0 +1,269 @@
+"""
+Catalog analytics for KnockoffKitchen.com
+
+Recipe counts by brand and category, prep/cook/total time averages and
+percentiles, and recipes added per day, aggregated by the database: one
+`$facet` pipeline on MongoDB, a few GROUP BY queries on Postgres. Nothing but
+the aggregated rows reaches Python.
+
+The result is materialised in memory. Writes mark it dirty and a debounced
+task, like the sitemap's, recomputes it once per burst of writes, so
+`/admin/stats` serves the latest snapshot without touching the database.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from debounced_task import DebouncedTask
+
+logger = logging.getLogger(__name__)
+
+TIME_FIELDS = ("prep_time", "cook_time", "total_time")
+
+# Percentiles reported for each time field
+PERCENTILES = (0.5, 0.9, 0.95)
+
+# Days covered by recipes_per_day
+DAILY_WINDOW_DAYS = 365
+
+# MongoDB error code for an unknown $group accumulator ($percentile before 7.0)
+UNKNOWN_ACCUMULATOR = 15952
+
+# Cleared when the server turns out not to support $percentile
+_mongo_percentile_supported = True
+
+
+def _since() -> datetime:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=DAILY_WINDOW_DAYS - 1)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(float(value), 2) if value is not None else None
+
+
+def _time_stats(average: Optional[float], percentiles: Optional[List[float]]) -> Dict[str, Any]:
+    stats = {"avg": _round(average)}
+    for p, value in zip(PERCENTILES, percentiles or [None] * len(PERCENTILES)):
+        stats[f"p{int(p * 100)}"] = _round(value)
+    return stats
+
+
+def build_stats(
+    total: int,
+    brands: List[Any],
+    categories: List[Any],
+    times: Dict[str, Dict[str, Any]],
+    per_day: List[Any]
+) -> Dict[str, Any]:
+    """
+    Assemble the stats document from (name, count) and (day, count) rows
+    """
+    by_count = lambda rows: sorted(rows, key=lambda row: (-row[1], row[0]))
+    return {
+        "total_recipes": total,
+        "recipes_by_brand": {name: count for name, count in by_count(brands) if name is not None},
+        "recipes_by_category": {name: count for name, count in by_count(categories) if name is not None},
+        "times": times,
+        "recipes_per_day": [{"date": day, "count": count} for day, count in sorted(per_day) if day is not None],
+    }
+
+
+def mongo_stats_pipeline(since: datetime, percentiles: bool = True) -> List[Dict[str, Any]]:
+    """
+    One pass over the recipes computing every statistic in a $facet.
+    $percentile needs MongoDB 7.0 or later; pass percentiles=False for older
+    servers and use mongo_sorted_percentiles instead.
+    """
+    time_group = {"_id": None}
+    for field in TIME_FIELDS:
+        time_group[f"{field}_avg"] = {"$avg": f"${field}"}
+        if percentiles:
+            time_group[f"{field}_percentiles"] = {
+                "$percentile": {"input": f"${field}", "p": list(PERCENTILES), "method": "approximate"}
+            }
+
+    return [
+        {"$project": {"_id": 0, "brand_name": 1, "category": 1, "created_at": 1, **{field: 1 for field in TIME_FIELDS}}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "brands": [{"$group": {"_id": "$brand_name", "count": {"$sum": 1}}}],
+            "categories": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+            "times": [{"$group": time_group}],
+            "per_day": [
+                {"$match": {"created_at": {"$gte": since}}},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "count": {"$sum": 1}
+                }},
+            ],
+        }},
+    ]
+
+
+def mongo_sorted_percentiles(collection, field: str) -> List[Optional[float]]:
+    """
+    Nearest-rank percentiles of a numeric field from a count and one sorted
+    $skip/$limit per percentile, for servers without $percentile
+    """
+    # Comparisons only match the same type bracket: this selects every number
+    numeric = {field: {"$gte": float("-inf")}}
+    count = collection.count_documents(numeric)
+    if not count:
+        return [None for _ in PERCENTILES]
+
+    values = []
+    for p in PERCENTILES:
+        rank = max(math.ceil(p * count) - 1, 0)
+        rows = list(collection.aggregate([
+            {"$match": numeric},
+            {"$project": {"_id": 0, field: 1}},
+            {"$sort": {field: 1}},
+            {"$skip": rank},
+            {"$limit": 1},
+        ], allowDiskUse=True))
+        values.append(rows[0][field] if rows else None)
+    return values
+
+
+def compute_mongo_stats() -> Dict[str, Any]:
+    """
+    Aggregate the MongoDB recipes collection
+    """
+    global _mongo_percentile_supported
+    from pymongo.errors import OperationFailure
+    from mongodb_setup import get_recipes_collection
+
+    collection = get_recipes_collection()
+    since = _since()
+    result = None
+    if _mongo_percentile_supported:
+        try:
+            result = next(collection.aggregate(mongo_stats_pipeline(since), allowDiskUse=True))
+        except OperationFailure as e:
+            if e.code != UNKNOWN_ACCUMULATOR:
+                raise
+            logger.warning("$percentile is not supported by this MongoDB server; computing percentiles by sorting")
+            _mongo_percentile_supported = False
+    if result is None:
+        result = next(collection.aggregate(mongo_stats_pipeline(since, percentiles=False), allowDiskUse=True))
+        times = result["times"][0] if result["times"] else {}
+        for field in TIME_FIELDS:
+            times[f"{field}_percentiles"] = mongo_sorted_percentiles(collection, field)
+    else:
+        times = result["times"][0] if result["times"] else {}
+    return build_stats(
+        total=result["total"][0]["count"] if result["total"] else 0,
+        brands=[(row["_id"], row["count"]) for row in result["brands"]],
+        categories=[(row["_id"], row["count"]) for row in result["categories"]],
+        times={
+            field: _time_stats(times.get(f"{field}_avg"), times.get(f"{field}_percentiles"))
+            for field in TIME_FIELDS
+        },
+        per_day=[(row["_id"], row["count"]) for row in result["per_day"]],
+    )
+
+
+async def compute_sql_stats() -> Dict[str, Any]:
+    """
+    Aggregate the Postgres recipes table
+    """
+    from sqlalchemy import Float, func, literal_column, select
+    from sqlalchemy.dialects.postgresql import ARRAY, array
+    from database import AsyncSessionLocal
+    from models import Recipe
+    import crud
+
+    columns = [func.count()]
+    for field in TIME_FIELDS:
+        column = getattr(Recipe, field)
+        columns.append(func.avg(column))
+        # One sort per column for all percentiles
+        columns.append(
+            func.percentile_cont(array(PERCENTILES)).within_group(column).cast(ARRAY(Float))
+        )
+
+    # Literal arguments, so the GROUP BY expression matches the selected one
+    # (asyncpg would bind repeated parameters separately)
+    day = func.to_char(func.timezone(literal_column("'UTC'"), Recipe.created_at), literal_column("'YYYY-MM-DD'"))
+
+    async with AsyncSessionLocal() as db:
+        totals = (await db.execute(select(*columns))).one()
+        brands = await crud.count_recipes_by(db, Recipe.brand_name)
+        categories = await crud.count_recipes_by(db, Recipe.category)
+        per_day = (await db.execute(
+            select(day, func.count()).where(Recipe.created_at >= _since()).group_by(day)
+        )).all()
+
+    return build_stats(
+        total=totals[0],
+        brands=brands,
+        categories=categories,
+        times={
+            field: _time_stats(totals[1 + 2 * i], totals[2 + 2 * i])
+            for i, field in enumerate(TIME_FIELDS)
+        },
+        per_day=per_day,
+    )
+
+
+class RecipeStats:
+    """
+    The latest materialised stats and the scheduler refreshing them after writes
+    """
+
+    def __init__(self, compute, debounce: float = 2, max_delay: float = 30):
+        self.compute = compute
+        self.scheduler = DebouncedTask(self.refresh, debounce=debounce, max_delay=max_delay, name="recipe stats")
+        self._stats: Optional[Dict[str, Any]] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        stats = await self.compute()
+        stats["as_of"] = datetime.now(timezone.utc).isoformat()
+        stats["refresh_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        self._stats = stats
+        return stats
+
+    def mark_dirty(self, changes: int = 1):
+        self.scheduler.mark_dirty(changes)
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        The latest stats, computing them first if there are none yet. They
+        reflect the catalog at `as_of`; `stale` is set while writes since then
+        are waiting for the next refresh (due in `refresh_in_seconds`). A
+        refresh runs once writes have been quiet for STATS_DEBOUNCE_SECONDS,
+        and no later than STATS_MAX_DELAY_SECONDS after the first pending write.
+        """
+        if self._stats is None:
+            await self.scheduler.build_now()
+            if self._stats is None:
+                raise RuntimeError(self.scheduler.last_error or "Recipe stats are unavailable")
+        state = self.scheduler.state()
+        return {
+            **self._stats,
+            "stale": state["dirty"] or state["building"],
+            "pending_changes": state["pending_changes"],
+            "refresh_in_seconds": state["next_build_in_seconds"],
+        }
+
+
+def _scheduler_settings() -> Dict[str, float]:
+    return {
+        "debounce": float(os.environ.get("STATS_DEBOUNCE_SECONDS", 2)),
+        "max_delay": float(os.environ.get("STATS_MAX_DELAY_SECONDS", 30)),
+    }
+
+
+def mongo_recipe_stats() -> RecipeStats:
+    # The driver blocks while the aggregation runs
+    return RecipeStats(lambda: asyncio.to_thread(compute_mongo_stats), **_scheduler_settings())
+
+
+def sql_recipe_stats() -> RecipeStats:
+    return RecipeStats(compute_sql_stats, **_scheduler_settings())
@@ -36,6 +36,8 @@ logger = logging.getLogger(__name__)
 
 # Import the sitemap generator
 from backend.sitemap_generator import generate_sitemap
+from backend.mongodb_counters import reconcile_counters
+from backend.mongodb_related import rebuild_related
 
 
 async def main():
@@ -50,6 +52,16 @@ async def main():
         sitemap_path = await generate_sitemap()
         logger.info(f"Sitemap generated successfully at {sitemap_path}")
         
+        # Fix any drift in the brand and category counters
+        logger.info("Reconciling brand and category counters")
+        corrected = reconcile_counters()
+        logger.info(f"Counters reconciled: {corrected}")
+        
+        # Recompute related recipes, restoring neighbours the incremental refreshes dropped
+        logger.info("Rebuilding related recipes")
+        rebuilt = rebuild_related()
+        logger.info(f"Related recipes rebuilt for {rebuilt} recipes")
+        
         # Add more scheduled tasks here as needed
         # For example:
         # - Clean up old files
@@ -57,3 +57,54 @@ class RecipeResponse(RecipeBase):
     class Config:
         from_attributes = True
         populate_by_name = True
+
+class RecipePage(BaseModel):
+    recipes: List[RecipeResponse]
+    next_cursor: Optional[str] = None
+
+class RecipeCard(BaseModel):
+    """Fields of a recipe card on list and grid pages (`view=card`)"""
+    id: uuid.UUID
+    title: str
+    brand_name: str
+    category: str
+    prep_time: Optional[int] = None
+    cook_time: Optional[int] = None
+    total_time: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+        populate_by_name = True
+
+class RecipeCardPage(BaseModel):
+    recipes: List[RecipeCard]
+    next_cursor: Optional[str] = None
+
+class RecipeSummary(RecipeCard):
+    """Recipe without the deferred content columns, for list views (`view=summary`)"""
+    yield_amount: Optional[str] = Field(None, alias="yield")
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+        populate_by_name = True
+
+class RecipeSummaryPage(BaseModel):
+    recipes: List[RecipeSummary]
+    next_cursor: Optional[str] = None
+
+class RecipeSearchResult(RecipeSummary):
+    rank: float
+
+class RecipeSearchPage(BaseModel):
+    recipes: List[RecipeSearchResult]
+    next_cursor: Optional[str] = None
+
+class BrandSummary(BaseModel):
+    name: str
+    slug: str
+    count: int
+
+class CategorySummary(BrandSummary):
+    description: str
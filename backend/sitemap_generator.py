@@ -1,165 +1,459 @@
 """
-Generate sitemap.xml for the website
+Generate the sitemap for the website
+
+public/sitemap.xml is a sitemap index pointing at gzip-compressed shards in
+public/sitemaps/: static pages, recipes split by category, brands and
+categories, each holding at most SHARD_SIZE URLs (the protocol allows 50,000).
+Recipe URLs carry their `updated_at` as lastmod; brand and category pages the
+latest update of their recipes.
+
+Shards are built one at a time from batched cursors, so memory is bounded by
+the shard size. Each shard's content hash is recorded in a manifest and a
+shard is only rewritten when its hash changes, so a one-recipe edit rewrites
+one shard and the index. Files are written to a temporary file and renamed
+into place, so readers never see a half-written sitemap.
+
+Each build also produces an in-memory snapshot of every document, already
+gzip-compressed, with ETag and Last-Modified validators, which the API
+serves directly.
 """
 import os
+import re
+import json
+import shutil
 import asyncio
-from datetime import datetime
-from xml.dom import minidom
-from xml.etree import ElementTree as ET
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import pymongo
 
+from api_responses import compress, brotli
 # Import MongoDB utilities
 from mongodb_setup import get_recipes_collection, get_brands_collection, get_categories_collection
+from catalog_pages import slugify
 
 # Base URL for the website
 BASE_URL = "https://knockoffkitchen.com"
 
-async def generate_sitemap():
+# Where the sitemap index and its shards are published, plus a copy of the
+# index in the backend directory for reference. SITEMAP_PUBLIC_DIR and
+# SITEMAP_BACKEND_COPY redirect them, e.g. so benchmarks don't overwrite the
+# published files.
+PUBLIC_DIR = os.environ.get(
+    "SITEMAP_PUBLIC_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public")
+)
+SITEMAP_PATH = os.path.join(PUBLIC_DIR, "sitemap.xml")
+SHARD_DIR = os.path.join(PUBLIC_DIR, "sitemaps")
+SHARD_URL = f"{BASE_URL}/sitemaps"
+BACKEND_SITEMAP_PATH = os.environ.get(
+    "SITEMAP_BACKEND_COPY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sitemap.xml")
+)
+
+# Shard name -> content hash, lastmod and URL count of the last build
+MANIFEST_NAME = ".manifest.json"
+
+STATIC_PAGES = ["/", "/recipes", "/brands", "/categories", "/about", "/contact"]
+
+# Maximum URLs per shard
+SHARD_SIZE = 50000
+
+# Documents fetched per cursor round trip
+BATCH_SIZE = 5000
+
+# The sitemap protocol requires quotes to be entity-escaped as well
+XML_ENTITIES = {"'": "&apos;", '"': "&quot;"}
+_NEEDS_ESCAPING = re.compile(r"[&<>'\"]")
+
+# Characters replaced in category slugs used as shard file names
+_UNSAFE_NAME_CHARS = re.compile(r"[^a-z0-9-]+")
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+# (loc, lastmod or None, changefreq, priority)
+SitemapURL = Tuple[str, Optional[str], str, str]
+
+
+def format_lastmod(value: Any) -> Optional[str]:
     """
-    Generate sitemap.xml for the website
+    W3C datetime for a stored timestamp (naive datetimes from the driver are UTC)
     """
-    print("Generating sitemap.xml...")
-    
-    # Create root element
-    root = ET.Element("urlset")
-    root.set("xmlns", "http://www.sitemaps.org/schemas/sitemap/0.9")
-    
-    # Add static pages
-    static_pages = [
-        "/",
-        "/recipes",
-        "/brands",
-        "/categories",
-        "/about",
-        "/contact"
-    ]
-    
-    for page in static_pages:
-        url = ET.SubElement(root, "url")
-        loc = ET.SubElement(url, "loc")
-        loc.text = f"{BASE_URL}{page}"
-        lastmod = ET.SubElement(url, "lastmod")
-        lastmod.text = datetime.now().strftime("%Y-%m-%d")
-        changefreq = ET.SubElement(url, "changefreq")
-        changefreq.text = "weekly"
-        priority = ET.SubElement(url, "priority")
-        priority.text = "0.8"
-    
-    # Add recipe pages
-    recipes_collection = get_recipes_collection()
-    recipes = list(recipes_collection.find({}, {"slug": 1}))
-    
-    # If no recipes found, just continue with empty list
-    if not recipes:
-        recipes = []
-    
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        return value.isoformat(timespec="seconds")
+    return value.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def chunked(name: str, urls: Iterable[SitemapURL], size: int = SHARD_SIZE) -> Iterator[Tuple[str, List[SitemapURL]]]:
+    """
+    Split a stream of URLs into shards named `name`, `name-2`, `name-3`, ...
+    """
+    shard, number = [], 1
+    for url in urls:
+        shard.append(url)
+        if len(shard) == size:
+            yield (name if number == 1 else f"{name}-{number}"), shard
+            shard, number = [], number + 1
+    if shard:
+        yield (name if number == 1 else f"{name}-{number}"), shard
+
+
+def sitemap_shards(batch_size: int = BATCH_SIZE, shard_size: int = SHARD_SIZE) -> Iterator[Tuple[str, List[SitemapURL]]]:
+    """
+    Yield (shard name, URLs) for the whole site, one shard in memory at a time.
+    Names are unique within a build: different categories can share a slug
+    ("Cookies" and "cookies", or "Cookies 2" and the second "Cookies" shard),
+    so a repeated name gets a `_2`, `_3`, ... suffix, which slugs never contain.
+    """
+    emitted = set()
+    for name, shard in _site_shards(batch_size, shard_size):
+        unique, number = name, 2
+        while unique in emitted:
+            unique, number = f"{name}_{number}", number + 1
+        emitted.add(unique)
+        yield unique, shard
+
+
+def _site_shards(batch_size: int, shard_size: int) -> Iterator[Tuple[str, List[SitemapURL]]]:
+    yield from chunked("pages", ((f"{BASE_URL}{page}", None, "weekly", "0.8") for page in STATIC_PAGES), shard_size)
+
+    # Recipes in (category, title, _id) order, which the category listing index serves,
+    # so each category's recipes arrive together
+    brand_lastmod: Dict[str, str] = {}
+    category_lastmod: Dict[str, str] = {}
+    recipes = get_recipes_collection().find(
+        {}, {"slug": 1, "brand_name": 1, "category": 1, "created_at": 1, "updated_at": 1}
+    ).sort([("category", pymongo.ASCENDING), ("title", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]).batch_size(batch_size)
+
+    current, shard, number = None, [], 1
     for recipe in recipes:
-        url = ET.SubElement(root, "url")
-        loc = ET.SubElement(url, "loc")
-        loc.text = f"{BASE_URL}/recipes/{recipe.get('slug')}"
-        lastmod = ET.SubElement(url, "lastmod")
-        lastmod.text = datetime.now().strftime("%Y-%m-%d")
-        changefreq = ET.SubElement(url, "changefreq")
-        changefreq.text = "monthly"
-        priority = ET.SubElement(url, "priority")
-        priority.text = "0.7"
-    
-    # Add brand pages
-    brands_collection = get_brands_collection()
-    # Check if brands_collection is not None and has find method
-    if hasattr(brands_collection, 'find'):
-        brands = list(brands_collection.find({}, {"slug": 1}))
-        
-        for brand in brands:
-            url = ET.SubElement(root, "url")
-            loc = ET.SubElement(url, "loc")
-            loc.text = f"{BASE_URL}/brands/{brand.get('slug')}"
-            lastmod = ET.SubElement(url, "lastmod")
-            lastmod.text = datetime.now().strftime("%Y-%m-%d")
-            changefreq = ET.SubElement(url, "changefreq")
-            changefreq.text = "monthly"
-            priority = ET.SubElement(url, "priority")
-            priority.text = "0.6"
-    else:
-        # If brands collection doesn't exist, get unique brands from recipes
-        recipes_collection = get_recipes_collection()
-        brands = recipes_collection.distinct("brand_name")
-        
-        for brand_name in brands:
-            if brand_name:
-                # Generate slug from brand name
-                slug = brand_name.lower().replace(" ", "-").replace("&", "and")
-                
-                url = ET.SubElement(root, "url")
-                loc = ET.SubElement(url, "loc")
-                loc.text = f"{BASE_URL}/brands/{slug}"
-                lastmod = ET.SubElement(url, "lastmod")
-                lastmod.text = datetime.now().strftime("%Y-%m-%d")
-                changefreq = ET.SubElement(url, "changefreq")
-                changefreq.text = "monthly"
-                priority = ET.SubElement(url, "priority")
-                priority.text = "0.6"
-    
-    # Add category pages
-    categories_collection = get_categories_collection()
-    # Check if categories_collection is not None and has find method
-    if hasattr(categories_collection, 'find'):
-        categories = list(categories_collection.find({}, {"slug": 1}))
-        
-        for category in categories:
-            url = ET.SubElement(root, "url")
-            loc = ET.SubElement(url, "loc")
-            loc.text = f"{BASE_URL}/categories/{category.get('slug')}"
-            lastmod = ET.SubElement(url, "lastmod")
-            lastmod.text = datetime.now().strftime("%Y-%m-%d")
-            changefreq = ET.SubElement(url, "changefreq")
-            changefreq.text = "monthly"
-            priority = ET.SubElement(url, "priority")
-            priority.text = "0.6"
-    else:
-        # If categories collection doesn't exist, get unique categories from recipes
-        recipes_collection = get_recipes_collection()
-        categories = recipes_collection.distinct("category")
-        
-        for category_name in categories:
-            if category_name:
-                # Generate slug from category name
-                slug = category_name.lower().replace(" ", "-").replace("&", "and")
-                
-                url = ET.SubElement(root, "url")
-                loc = ET.SubElement(url, "loc")
-                loc.text = f"{BASE_URL}/categories/{slug}"
-                lastmod = ET.SubElement(url, "lastmod")
-                lastmod.text = datetime.now().strftime("%Y-%m-%d")
-                changefreq = ET.SubElement(url, "changefreq")
-                changefreq.text = "monthly"
-                priority = ET.SubElement(url, "priority")
-                priority.text = "0.6"
-    
-    # Create XML string
-    tree = ET.ElementTree(root)
-    xml_string = ET.tostring(root, encoding="utf-8")
-    
-    # Pretty print XML
-    xml_dom = minidom.parseString(xml_string)
-    pretty_xml = xml_dom.toprettyxml(indent="  ")
-    
-    # Save to file
-    sitemap_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "public", "sitemap.xml")
-    os.makedirs(os.path.dirname(sitemap_path), exist_ok=True)
-    
-    with open(sitemap_path, "w", encoding="utf-8") as f:
-        f.write(pretty_xml)
-    
-    print(f"Sitemap generated at {sitemap_path}")
-    
-    # Also save a copy to the backend directory for reference
-    backend_sitemap_path = os.path.join(os.path.dirname(__file__), "sitemap.xml")
-    with open(backend_sitemap_path, "w", encoding="utf-8") as f:
-        f.write(pretty_xml)
-    
-    print(f"Sitemap copy saved at {backend_sitemap_path}")
-    
-    return pretty_xml
+        category = recipe.get("category") or ""
+        if category != current:
+            if shard:
+                yield _recipe_shard_name(current, number), shard
+            current, shard, number = category, [], 1
+        elif len(shard) == shard_size:
+            yield _recipe_shard_name(current, number), shard
+            shard, number = [], number + 1
+
+        lastmod = format_lastmod(recipe.get("updated_at") or recipe.get("created_at"))
+        shard.append((f"{BASE_URL}/recipes/{recipe.get('slug')}", lastmod, "monthly", "0.7"))
+
+        if lastmod:
+            for latest, key in ((brand_lastmod, recipe.get("brand_name")), (category_lastmod, category)):
+                if key and lastmod > latest.get(key, ""):
+                    latest[key] = lastmod
+    if shard:
+        yield _recipe_shard_name(current, number), shard
+
+    # Brand and category documents are kept up to date by the counters
+    brands = get_brands_collection().find({"count": {"$gt": 0}}, {"slug": 1}).sort("_id", pymongo.ASCENDING)
+    yield from chunked("brands", (
+        (f"{BASE_URL}/brands/{brand.get('slug')}", brand_lastmod.get(brand["_id"]), "monthly", "0.6")
+        for brand in brands.batch_size(batch_size)
+    ), shard_size)
+
+    categories = get_categories_collection().find({"count": {"$gt": 0}}, {"slug": 1}).sort("_id", pymongo.ASCENDING)
+    yield from chunked("categories", (
+        (f"{BASE_URL}/categories/{category.get('slug')}", category_lastmod.get(category["_id"]), "monthly", "0.6")
+        for category in categories.batch_size(batch_size)
+    ), shard_size)
+
+
+def _recipe_shard_name(category: str, number: int) -> str:
+    # Only [a-z0-9-], so every shard can be served from /sitemaps/{name}
+    slug = _UNSAFE_NAME_CHARS.sub("-", slugify(category)).strip("-")
+    name = f"recipes-{slug or 'uncategorized'}"
+    return name if number == 1 else f"{name}-{number}"
+
+
+def render_urlset(urls: List[SitemapURL]) -> bytes:
+    """
+    Render a <urlset> document
+    """
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n', f'<urlset xmlns="{SITEMAP_NS}">\n']
+    append = lines.append
+    for loc, lastmod, changefreq, priority in urls:
+        if _NEEDS_ESCAPING.search(loc):
+            loc = escape(loc, XML_ENTITIES)
+        if lastmod:
+            append(
+                f"  <url>\n    <loc>{loc}</loc>\n    <lastmod>{lastmod}</lastmod>\n"
+                f"    <changefreq>{changefreq}</changefreq>\n    <priority>{priority}</priority>\n  </url>\n"
+            )
+        else:
+            append(
+                f"  <url>\n    <loc>{loc}</loc>\n"
+                f"    <changefreq>{changefreq}</changefreq>\n    <priority>{priority}</priority>\n  </url>\n"
+            )
+    append("</urlset>\n")
+    return "".join(lines).encode("utf-8")
+
+
+def render_index(shards: List[Tuple[str, Optional[str]]]) -> bytes:
+    """
+    Render the <sitemapindex> document for (shard name, lastmod) pairs
+    """
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n', f'<sitemapindex xmlns="{SITEMAP_NS}">\n']
+    for name, lastmod in shards:
+        lines.append(
+            f"  <sitemap>\n"
+            f"    <loc>{escape(f'{SHARD_URL}/{name}.xml.gz', XML_ENTITIES)}</loc>\n"
+            + (f"    <lastmod>{lastmod}</lastmod>\n" if lastmod else "")
+            + f"  </sitemap>\n"
+        )
+    lines.append("</sitemapindex>\n")
+    return "".join(lines).encode("utf-8")
+
+
+class SitemapFile:
+    """
+    One sitemap document as served: its body, precompressed variants and validators
+    """
+    __slots__ = ("body", "media_type", "variants", "etag", "last_modified")
+
+    def __init__(
+        self,
+        body: bytes,
+        media_type: str,
+        digest: str,
+        last_modified: datetime,
+        variants: Optional[Dict[str, bytes]] = None
+    ):
+        self.body = body
+        self.media_type = media_type
+        self.variants = variants or {}
+        self.etag = f'"{digest[:20]}"'
+        self.last_modified = last_modified
+
+
+class SitemapSnapshot:
+    """
+    Every sitemap document of one build, keyed by URL path relative to the
+    site root (e.g. "sitemap.xml", "sitemaps/brands.xml.gz"). Never mutated:
+    each build creates a new snapshot and swaps it in.
+    """
+    __slots__ = ("files", "built_at", "stats")
+
+    def __init__(self, files: Dict[str, SitemapFile], built_at: datetime, stats: Dict[str, int]):
+        self.files = files
+        self.built_at = built_at
+        self.stats = stats
+
+
+# Snapshot of the latest build, served by the API
+_snapshot: Optional[SitemapSnapshot] = None
+
+
+def current_snapshot() -> Optional[SitemapSnapshot]:
+    return _snapshot
+
+
+def shard_path(name: str) -> str:
+    return f"sitemaps/{name}.xml.gz"
+
+
+def index_file(index: bytes, modified: datetime) -> SitemapFile:
+    variants = {"gzip": compress(index, "gzip", cached=True)}
+    if brotli is not None:
+        variants["br"] = compress(index, "br", cached=True)
+    return SitemapFile(index, "application/xml", hashlib.sha256(index).hexdigest(), modified, variants)
+
+
+def load_snapshot(index_path: str = SITEMAP_PATH, shard_dir: str = SHARD_DIR) -> Optional[SitemapSnapshot]:
+    """
+    Rebuild the snapshot of the last build from the files on disk, e.g. to
+    serve it after a restart while the next build runs. Returns None if the
+    files are missing or incomplete.
+    """
+    try:
+        with open(os.path.join(shard_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(index_path, "rb") as f:
+            index = f.read()
+        index_modified = datetime.fromtimestamp(os.path.getmtime(index_path), timezone.utc)
+
+        files = {"sitemap.xml": index_file(index, index_modified)}
+        for name, entry in manifest.items():
+            with open(os.path.join(shard_dir, f"{name}.xml.gz"), "rb") as f:
+                compressed = f.read()
+            modified = datetime.fromisoformat(entry["modified"]) if entry.get("modified") else index_modified
+            files[shard_path(name)] = SitemapFile(compressed, "application/gzip", entry["hash"], modified)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    stats = {"shards": len(manifest), "written": 0, "removed": 0, "urls": sum(e.get("urls", 0) for e in manifest.values())}
+    return SitemapSnapshot(files, index_modified, stats)
+
+
+def write_atomically(path: str, data: bytes):
+    """
+    Write a file so that `path` is replaced in a single rename
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".sitemap-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_sitemap_index(
+    shards: Iterable[Tuple[str, List[SitemapURL]]],
+    index_path: str = SITEMAP_PATH,
+    shard_dir: str = SHARD_DIR,
+    previous_snapshot: Optional[SitemapSnapshot] = None
+) -> SitemapSnapshot:
+    """
+    Write changed shards and the index, and remove shards that no longer exist.
+    Returns the snapshot of the new sitemap; its stats count shards, shards
+    written, shards removed and URLs. Compressed shards are reused from
+    `previous_snapshot` when their content is unchanged.
+    """
+    now = datetime.now(timezone.utc)
+    previous_files = previous_snapshot.files if previous_snapshot else {}
+
+    manifest_path = os.path.join(shard_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    manifest = {}
+    files = {}
+    written = urls = 0
+    for name, shard in shards:
+        body = render_urlset(shard)
+        digest = hashlib.sha256(body).hexdigest()
+        path = os.path.join(shard_dir, f"{name}.xml.gz")
+        entry = previous.get(name, {})
+
+        served = previous_files.get(shard_path(name))
+        if served is not None and entry.get("hash") == digest:
+            compressed = served.body
+        else:
+            compressed = compress(body, "gzip", cached=True)
+
+        if entry.get("hash") != digest or not os.path.exists(path):
+            write_atomically(path, compressed)
+            written += 1
+            modified = now
+        else:
+            modified = datetime.fromisoformat(entry["modified"]) if entry.get("modified") else now
+
+        lastmods = [lastmod for _, lastmod, _, _ in shard if lastmod]
+        manifest[name] = {
+            "hash": digest,
+            "lastmod": max(lastmods) if lastmods else None,
+            "modified": modified.isoformat(),
+            "urls": len(shard),
+        }
+        files[shard_path(name)] = SitemapFile(compressed, "application/gzip", digest, modified)
+        urls += len(shard)
+
+    removed = 0
+    for name in set(previous) - set(manifest):
+        try:
+            os.unlink(os.path.join(shard_dir, f"{name}.xml.gz"))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    index = render_index([(name, entry["lastmod"]) for name, entry in manifest.items()])
+    try:
+        with open(index_path, "rb") as f:
+            index_changed = f.read() != index
+    except OSError:
+        index_changed = True
+    if index_changed:
+        write_atomically(index_path, index)
+
+    served_index = previous_files.get("sitemap.xml")
+    if index_changed or served_index is None:
+        index_modified = now if index_changed else datetime.fromtimestamp(os.path.getmtime(index_path), timezone.utc)
+        served_index = index_file(index, index_modified)
+    files["sitemap.xml"] = served_index
+
+    if manifest != previous:
+        write_atomically(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+    stats = {"shards": len(manifest), "written": written, "removed": removed, "urls": urls}
+    return SitemapSnapshot(files, now, stats)
+
+
+def copy_atomically(source: str, destination: str):
+    """
+    Copy a file so that `destination` is replaced in a single rename
+    """
+    # A unique temporary file, so concurrent builds don't write to the same one
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix=".sitemap-", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp_path)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, destination)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def build_sitemap() -> str:
+    """
+    Write the sitemap index, its changed shards and the backend copy of the
+    index, then publish the new in-memory snapshot. Blocking: run it in a
+    worker thread from async code.
+    """
+    global _snapshot
+
+    snapshot = write_sitemap_index(sitemap_shards(), previous_snapshot=_snapshot)
+    result = snapshot.stats
+    print(
+        f"Sitemap index generated at {SITEMAP_PATH}: {result['urls']} URLs in {result['shards']} shards "
+        f"({result['written']} rewritten, {result['removed']} removed)"
+    )
+
+    copy_atomically(SITEMAP_PATH, BACKEND_SITEMAP_PATH)
+    print(f"Sitemap copy saved at {BACKEND_SITEMAP_PATH}")
+
+    # Rebinding the name is atomic: requests see either the old or the new snapshot
+    _snapshot = snapshot
+    return SITEMAP_PATH
+
+
+async def restore_sitemap() -> bool:
+    """
+    Serve the previous build's sitemap from disk until a new build completes.
+    Returns whether a previous sitemap was found.
+    """
+    global _snapshot
+
+    snapshot = await asyncio.to_thread(load_snapshot)
+    # A build may have finished while the files were being read
+    if snapshot is None or _snapshot is not None:
+        return False
+    _snapshot = snapshot
+    print(f"Serving the previous sitemap ({snapshot.stats['urls']} URLs) until it is regenerated")
+    return True
+
+
+async def generate_sitemap() -> str:
+    """
+    Generate the sitemap for the website. Returns the path of the sitemap index.
+    """
+    print("Generating sitemap.xml...")
+    # Cursor reads and file writes block, so keep them off the event loop
+    return await asyncio.to_thread(build_sitemap)
+
 
 if __name__ == "__main__":
     asyncio.run(generate_sitemap())
@@ -0,0 +1,19 @@
+"""
+Debounced sitemap regeneration for KnockoffKitchen.com
+
+Write endpoints call `sitemap_scheduler.mark_dirty()` instead of rebuilding
+the sitemap; it is rebuilt once per burst of writes (see debounced_task).
+"""
+import os
+
+from debounced_task import DebouncedTask
+from sitemap_generator import generate_sitemap
+
+
+# Shared scheduler for the API, tuned from the environment
+sitemap_scheduler = DebouncedTask(
+    generate_sitemap,
+    debounce=float(os.environ.get("SITEMAP_DEBOUNCE_SECONDS", 5)),
+    max_delay=float(os.environ.get("SITEMAP_MAX_DELAY_SECONDS", 60)),
+    name="sitemap",
+)
@@ -0,0 +1,40 @@
+"""
+Startup work run in the background, and the readiness probe reporting it
+
+Both APIs start serving requests immediately and run slow startup work (index
+preparation, the initial sitemap and stats, ...) as named background tasks.
+The app reports ready once all of them have finished.
+"""
+import asyncio
+from typing import Any, Coroutine, Dict
+
+from api_responses import FastJSONResponse
+from http_caching import cache_headers
+
+
+class StartupTasks:
+    """
+    Named background tasks started at startup, tracked until they finish
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, name: str, coro: Coroutine[Any, Any, Any]):
+        # Keep a reference so the task isn't garbage collected before it finishes
+        task = asyncio.create_task(coro)
+        self._tasks[name] = task
+        task.add_done_callback(lambda _: self._tasks.pop(name, None))
+
+    def pending(self):
+        return sorted(self._tasks)
+
+    def readiness_response(self) -> FastJSONResponse:
+        """
+        200 once every startup task has finished, 503 listing the pending ones until then
+        """
+        headers = cache_headers("admin")
+        pending = self.pending()
+        if pending:
+            return FastJSONResponse({"ready": False, "pending": pending}, status_code=503, headers=headers)
+        return FastJSONResponse({"ready": True}, headers=headers)
@@ -0,0 +1,29 @@
+"""
+Shared setup for the backend tests: every test runs against a fresh
+in-memory MongoDB engine, and sitemap builds write to a temporary directory.
+"""
+import os
+import tempfile
+
+# Set before the backend modules are imported; they read these at import time
+os.environ["MONGODB_URI"] = "memory://"
+_sitemap_dir = tempfile.mkdtemp(prefix="sitemap-test-")
+os.environ["SITEMAP_PUBLIC_DIR"] = os.path.join(_sitemap_dir, "public")
+os.environ["SITEMAP_BACKEND_COPY"] = os.path.join(_sitemap_dir, "sitemap.xml")
+
+import pytest
+
+import mongodb_setup
+import sitemap_generator
+from mongodb_indexes import ensure_indexes
+
+
+@pytest.fixture(autouse=True)
+def memory_database():
+    """
+    A fresh in-memory database with the recipe indexes, and no sitemap snapshot
+    """
+    mongodb_setup.use_memory_database()
+    ensure_indexes(mongodb_setup.get_recipes_collection())
+    sitemap_generator._snapshot = None
+    yield mongodb_setup.get_database()
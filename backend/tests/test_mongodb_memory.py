@@ -0,0 +1,388 @@
+"""
+Recipe CRUD, counters, search and sitemap generation driven through the
+in-memory MongoDB engine
+"""
+import asyncio
+import gzip
+import os
+import re
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import mongodb_crud
+import mongodb_main
+import mongodb_related
+import sitemap_generator
+from mongodb_counters import reconcile_counters, ensure_counters
+from mongodb_search import backfill_search_tokens, search_recipes
+from mongodb_setup import (
+    get_recipes_collection, get_brands_collection, get_categories_collection, get_related_collection
+)
+
+
+def recipe(title, brand="Oreo", category="Dessert", ingredients=None, slug=None):
+    return {
+        "title": title,
+        "slug": slug or title.lower().replace(" ", "-"),
+        "brand_name": brand,
+        "category": category,
+        "ingredients": {"items": ingredients or []},
+        "instructions": [],
+    }
+
+
+def create(*recipes):
+    return asyncio.run(mongodb_crud.create_recipes(list(recipes)))
+
+
+def counters(collection):
+    return {doc["_id"]: doc["count"] for doc in collection.find({})}
+
+
+def test_create_and_get_recipe():
+    created = asyncio.run(mongodb_crud.create_recipe(recipe("Chocolate Cookies")))
+
+    assert created["version"] == 1
+    assert "search_tokens" not in created
+    fetched = asyncio.run(mongodb_crud.get_recipe(created["id"]))
+    assert fetched["title"] == "Chocolate Cookies"
+    assert asyncio.run(mongodb_crud.get_recipe_by_slug("chocolate-cookies"))["id"] == created["id"]
+    assert asyncio.run(mongodb_crud.get_recipe("missing")) is None
+
+
+def test_update_bumps_version_and_refreshes_search_tokens():
+    created = asyncio.run(mongodb_crud.create_recipe(recipe("Chocolate Cookies")))
+    created_at = get_recipes_collection().find_one({"_id": created["id"]})["created_at"]
+
+    updated = asyncio.run(mongodb_crud.update_recipe(
+        created["id"], {"title": "Vanilla Wafers", "version": 7, "created_at": None}
+    ))
+    assert updated["version"] == 2
+    assert updated["title"] == "Vanilla Wafers"
+
+    stored = get_recipes_collection().find_one({"_id": created["id"]})
+    assert stored["version"] == 2
+    assert "vanilla" in stored["search_tokens"]
+    assert "chocolate" not in stored["search_tokens"]
+    assert stored["created_at"] == created_at
+
+    validators = asyncio.run(mongodb_crud.get_recipe_validators(recipe_id=created["id"]))
+    assert validators["version"] == 2
+    assert asyncio.run(mongodb_crud.update_recipe("missing", {"title": "Nothing"})) is None
+
+
+def test_search_token_write_is_guarded_by_version():
+    created = asyncio.run(mongodb_crud.create_recipe(recipe("Chocolate Cookies")))
+    asyncio.run(mongodb_crud.update_recipe(created["id"], {"title": "Vanilla Wafers"}))
+    asyncio.run(mongodb_crud.update_recipe(created["id"], {"title": "Lemon Bars"}))
+
+    # A token write from the first edit arriving late matches nothing
+    result = get_recipes_collection().update_one(
+        {"_id": created["id"], "version": 2},
+        {"$set": {"search_tokens": ["vanilla", "wafers"]}}
+    )
+    assert result.modified_count == 0
+    assert "lemon" in get_recipes_collection().find_one({"_id": created["id"]})["search_tokens"]
+
+
+def test_bulk_create_reports_duplicate_slugs():
+    result = create(recipe("Chocolate Cookies"), recipe("Chocolate Cookies"), recipe("Lemon Bars", category="Bars"))
+
+    assert len(result["inserted"]) == 2
+    assert [error["index"] for error in result["errors"]] == [1]
+    assert counters(get_brands_collection()) == {"Oreo": 2}
+    assert counters(get_categories_collection()) == {"Dessert": 1, "Bars": 1}
+
+
+def test_bulk_update_moves_counters_and_tokens():
+    inserted = create(
+        recipe("Chocolate Cookies"),
+        recipe("Lemon Bars", brand="Keebler", category="Bars"),
+    )["inserted"]
+    ids = [doc["id"] for doc in inserted]
+
+    result = asyncio.run(mongodb_crud.update_recipes([
+        {"id": ids[0], "brand_name": "Keebler", "title": "Fudge Stripes"},
+        {"id": ids[1], "description": "Tangy"},
+        {"id": "missing", "title": "Nothing"},
+    ]))
+
+    assert result == {"updated": ids, "not_found": ["missing"], "errors": []}
+    assert counters(get_brands_collection()) == {"Keebler": 2}
+    assert counters(get_categories_collection()) == {"Dessert": 1, "Bars": 1}
+    stored = {doc["_id"]: doc for doc in get_recipes_collection().find({})}
+    assert stored[ids[0]]["version"] == 2
+    assert "fudge" in stored[ids[0]]["search_tokens"]
+    assert stored[ids[1]]["version"] == 2
+    assert stored[ids[1]]["description"] == "Tangy"
+
+    with pytest.raises(ValueError):
+        asyncio.run(mongodb_crud.update_recipes([{"title": "No id"}]))
+
+
+def test_bulk_update_reports_duplicate_slugs():
+    inserted = create(
+        recipe("Chocolate Cookies"),
+        recipe("Lemon Bars", brand="Keebler", category="Bars"),
+    )["inserted"]
+    ids = [doc["id"] for doc in inserted]
+
+    result = asyncio.run(mongodb_crud.update_recipes([
+        {"id": ids[0], "category": "Bars"},
+        {"id": ids[1], "slug": "chocolate-cookies", "category": "Dessert"},
+    ]))
+
+    assert result["updated"] == [ids[0]]
+    assert [(error["index"], error["id"]) for error in result["errors"]] == [(1, ids[1])]
+    assert counters(get_categories_collection()) == {"Bars": 2}
+    stored = get_recipes_collection().find_one({"_id": ids[1]})
+    assert (stored["slug"], stored["version"]) == ("lemon-bars", 1)
+
+
+def test_deletes_drop_empty_counters():
+    inserted = create(
+        recipe("Chocolate Cookies"),
+        recipe("Lemon Bars", brand="Keebler", category="Bars"),
+        recipe("Fudge Stripes", brand="Keebler"),
+    )["inserted"]
+    ids = [doc["id"] for doc in inserted]
+
+    deleted = asyncio.run(mongodb_crud.delete_recipe(ids[0]))
+    assert deleted["id"] == ids[0]
+    result = asyncio.run(mongodb_crud.delete_recipes([ids[1], "missing"]))
+
+    assert result == {"deleted": [ids[1]], "not_found": ["missing"]}
+    assert counters(get_brands_collection()) == {"Keebler": 1}
+    assert counters(get_categories_collection()) == {"Dessert": 1}
+    assert [brand["name"] for brand in asyncio.run(mongodb_crud.get_brands())] == ["Keebler"]
+    assert asyncio.run(mongodb_crud.get_recipe_count(category="Dessert")) == 1
+
+
+def test_reconcile_fixes_counter_drift():
+    create(recipe("Chocolate Cookies"), recipe("Lemon Bars", category="Bars"))
+    get_brands_collection().update_one({"_id": "Oreo"}, {"$inc": {"count": 5}})
+    get_categories_collection().insert_one({"_id": "Gone", "count": 3, "slug": "gone"})
+
+    assert reconcile_counters() == {"brands": 1, "categories": 1}
+    assert counters(get_brands_collection()) == {"Oreo": 2}
+    assert counters(get_categories_collection()) == {"Dessert": 1, "Bars": 1}
+    assert reconcile_counters() == {"brands": 0, "categories": 0}
+
+
+def test_ensure_counters_builds_missing_counters():
+    get_recipes_collection().insert_many([
+        {"_id": "a", "slug": "a", "brand_name": "Oreo", "category": "Dessert"},
+        {"_id": "b", "slug": "b", "brand_name": "Oreo", "category": "Bars"},
+    ])
+
+    ensure_counters()
+
+    assert counters(get_brands_collection()) == {"Oreo": 2}
+    assert get_categories_collection().find_one({"_id": "Bars"})["slug"] == "bars"
+
+
+def test_recipe_count_with_search():
+    create(
+        recipe("Chocolate Cookies"),
+        recipe("Chocolate Bars", category="Bars"),
+        recipe("Lemon Bars", category="Bars"),
+    )
+
+    assert asyncio.run(mongodb_crud.get_recipe_count()) == 3
+    assert asyncio.run(mongodb_crud.get_recipe_count(search_query="chocolate")) == 2
+    assert asyncio.run(mongodb_crud.get_recipe_count(category="Bars", search_query="choc")) == 1
+
+
+def test_search_ranks_title_prefix_matches():
+    create(
+        recipe("Chocolate Cookies"),
+        recipe("Lemon Bars", ingredients=["chocolate chips"]),
+        recipe("Vanilla Wafers"),
+    )
+
+    result = asyncio.run(search_recipes("choc"))
+    assert [doc["title"] for doc in result["recipes"]] == ["Chocolate Cookies", "Lemon Bars"]
+    assert result["has_more"] is False
+
+    result = asyncio.run(search_recipes("chocolate coo"))
+    assert [doc["title"] for doc in result["recipes"]] == ["Chocolate Cookies"]
+    assert asyncio.run(search_recipes("!!"))["recipes"] == []
+
+
+def test_backfill_adds_missing_search_tokens():
+    create(recipe("Chocolate Cookies"))
+    get_recipes_collection().insert_one({"_id": "old", "slug": "old", "title": "Peanut Brittle", "brand_name": "Oreo"})
+
+    assert asyncio.run(search_recipes("pean"))["recipes"] == []
+    assert backfill_search_tokens(missing_only=True, ensure=False) == 1
+    assert [doc["id"] for doc in asyncio.run(search_recipes("pean"))["recipes"]] == ["old"]
+    assert backfill_search_tokens(missing_only=True, ensure=False) == 0
+
+
+def test_sitemap_shards_and_rewrites(tmp_path):
+    create(
+        recipe("Chocolate Cookies"),
+        recipe("Lemon Bars", brand="Keebler", category="Bars"),
+    )
+    index_path = str(tmp_path / "sitemap.xml")
+    shard_dir = str(tmp_path / "sitemaps")
+
+    snapshot = sitemap_generator.write_sitemap_index(sitemap_generator.sitemap_shards(), index_path, shard_dir)
+    assert snapshot.stats["written"] == snapshot.stats["shards"]
+    assert snapshot.stats["urls"] == len(sitemap_generator.STATIC_PAGES) + 2 + 2 + 2
+
+    with open(os.path.join(shard_dir, "brands.xml.gz"), "rb") as f:
+        brands = gzip.decompress(f.read()).decode("utf-8")
+    assert "/brands/keebler" in brands and "/brands/oreo" in brands
+
+    # Unchanged shards are not rewritten
+    snapshot = sitemap_generator.write_sitemap_index(sitemap_generator.sitemap_shards(), index_path, shard_dir, snapshot)
+    assert snapshot.stats["written"] == 0
+
+    # Deleting the only "Bars" recipe removes its shard
+    bars = get_recipes_collection().find_one({"category": "Bars"})
+    asyncio.run(mongodb_crud.delete_recipe(bars["_id"]))
+    snapshot = sitemap_generator.write_sitemap_index(sitemap_generator.sitemap_shards(), index_path, shard_dir, snapshot)
+    assert snapshot.stats["removed"] == 1
+    assert snapshot.stats["written"] == 2
+
+    restored = sitemap_generator.load_snapshot(index_path, shard_dir)
+    assert set(restored.files) == set(snapshot.files)
+
+
+def test_build_sitemap_publishes_snapshot():
+    create(recipe("Chocolate Cookies"))
+
+    path = asyncio.run(sitemap_generator.generate_sitemap())
+
+    assert path == sitemap_generator.SITEMAP_PATH
+    assert not path.startswith(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    snapshot = sitemap_generator.current_snapshot()
+    assert b"/sitemaps/" in snapshot.files["sitemap.xml"].body
+    assert os.path.exists(sitemap_generator.BACKEND_SITEMAP_PATH)
+
+
+def test_listing_count_covers_search():
+    with TestClient(mongodb_main.app) as client:
+        create(
+            recipe("Chocolate Cookies"),
+            recipe("Chocolate Bars", category="Bars"),
+            recipe("Lemon Bars", category="Bars"),
+        )
+        mongodb_main.invalidate_recipe_reads()
+
+        response = client.get("/recipes", params={"search": "chocolate", "include_count": "true", "limit": 1})
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "2"
+        assert len(response.json()) == 1
+
+        response = client.get("/recipes", params={"search": "bars", "category": "Bars", "include_count": "true"})
+        assert response.headers["X-Total-Count"] == "2"
+
+
+def test_bulk_update_endpoint_applies_the_rest_of_the_batch():
+    with TestClient(mongodb_main.app) as client:
+        ids = [doc["id"] for doc in create(recipe("Chocolate Cookies"), recipe("Lemon Bars"))["inserted"]]
+
+        response = client.put("/recipes/bulk", json=[
+            {"id": ids[0], "brand_name": "Keebler"},
+            {"id": ids[1], "slug": "chocolate-cookies"},
+        ])
+
+        assert response.status_code == 200
+        assert response.json()["updated"] == [ids[0]]
+        assert [error["id"] for error in response.json()["errors"]] == [ids[1]]
+        assert counters(get_brands_collection()) == {"Keebler": 1, "Oreo": 1}
+
+
+def test_duplicate_slug_is_a_conflict():
+    with TestClient(mongodb_main.app) as client:
+        assert client.post("/recipes/", json=recipe("Chocolate Cookies")).status_code == 201
+        response = client.post("/recipes/", json=recipe("Chocolate Cookies"))
+        assert response.status_code == 409
+        assert "chocolate-cookies" in response.json()["detail"]
+
+        other = client.post("/recipes/", json=recipe("Lemon Bars")).json()
+        response = client.put(f"/recipes/{other['id']}", json={"slug": "chocolate-cookies"})
+        assert response.status_code == 409
+        assert counters(get_brands_collection()) == {"Oreo": 2}
+
+
+def test_sitemap_shard_names_are_unique(tmp_path):
+    create(
+        recipe("Chocolate Cookies", category="Cookies"),
+        recipe("Sugar Cookies", category="Cookies"),
+        recipe("Lemon Cookies", category="cookies"),
+        recipe("Mint Cookies", category="Cookies 2"),
+        recipe("Lemon Bars", category="A & B"),
+        recipe("Fudge Bars", category="A and B"),
+        recipe("Date Squares", category="Bars/Squares"),
+    )
+
+    shards = list(sitemap_generator.sitemap_shards(shard_size=1))
+    names = [name for name, _ in shards]
+    assert len(names) == len(set(names))
+    assert all(re.fullmatch(r"[a-z0-9_-]+", name) for name in names)
+
+    snapshot = sitemap_generator.write_sitemap_index(
+        iter(shards), str(tmp_path / "sitemap.xml"), str(tmp_path / "sitemaps")
+    )
+    recipe_urls = {url for name, shard in shards if name.startswith("recipes-") for url, _, _, _ in shard}
+    assert len(recipe_urls) == 7
+    assert snapshot.stats["shards"] == len(shards)
+    assert len(os.listdir(tmp_path / "sitemaps")) == len(shards) + 1
+
+
+def test_rebuild_related_drops_rows_of_deleted_recipes():
+    ids = [doc["id"] for doc in create(
+        recipe("Chocolate Chip Cookies", ingredients=["flour", "butter", "chocolate chips"]),
+        recipe("Double Chocolate Cookies", ingredients=["flour", "butter", "cocoa"]),
+        recipe("Lemon Bars", brand="Keebler", category="Bars", ingredients=["lemon", "sugar"]),
+    )["inserted"]]
+    mongodb_related.rebuild_related()
+    get_recipes_collection().delete_one({"_id": ids[2]})
+
+    assert mongodb_related.rebuild_related() == 2
+    assert {row["_id"] for row in get_related_collection().find({})} == set(ids[:2])
+    related = asyncio.run(mongodb_related.get_related_recipes(ids[0]))
+    assert [card["id"] for card in related] == [ids[1]]
+
+
+def test_concurrent_related_refreshes_keep_every_link(monkeypatch):
+    ids = [doc["id"] for doc in create(
+        recipe("Chocolate Chip Cookies", ingredients=["flour", "butter", "chocolate chips"])
+    )["inserted"]]
+    mongodb_related.rebuild_related()
+    ids += [doc["id"] for doc in create(
+        recipe("Chocolate Chip Cookies 1", ingredients=["flour", "butter", "chocolate chips"]),
+        recipe("Chocolate Chip Cookies 2", ingredients=["flour", "butter", "chocolate chips"]),
+    )["inserted"]]
+
+    # Hold each refresh after it reads its candidates' neighbour lists until
+    # the other has read them too, unless refreshes are serialised
+    barrier = threading.Barrier(2, timeout=0.5)
+    related_collection = get_related_collection()
+
+    class RendezvousCollection:
+        def __getattr__(self, name):
+            return getattr(related_collection, name)
+
+        def find(self, *args, **kwargs):
+            rows = list(related_collection.find(*args, **kwargs))
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+            return rows
+
+    monkeypatch.setattr(mongodb_related, "get_related_collection", lambda: RendezvousCollection())
+    threads = [threading.Thread(target=mongodb_related.refresh_related, args=([recipe_id],)) for recipe_id in ids[1:]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    listed = {card["id"] for card in asyncio.run(mongodb_related.get_related_recipes(ids[0]))}
+    assert listed == set(ids[1:])